@@ -11,16 +11,16 @@ function OrderQueuePane({ userID, authToken }) {
     const [queueHead, setQueueHead] = useState(createQueueNode(null, null));
     const [queueError, setQueueError] = useState(null);
 
-    var currentOrderID = 0; // ID of most recent order loaded
+    var currentVersion = 0; // version of the queue loaded, 0 until the queue has been loaded
     
     // This method adds a new order to the back of the queue
     function enqueueOrder(order) {
-        // Check the orderID to ensure it is not already in the queue
-        if (order.foodOrderID <= currentOrderID) {
-            return; // do nothing
-        }
         let current = queueHead;
         while (current.next !== null) { // iterate until the end of the queue is reached
+            // Check the orderID to ensure it is not already in the queue
+            if (current.next.order.foodOrderID === order.foodOrderID) {
+                return; // do nothing
+            }
             current = current.next;
         }
         current.next = createQueueNode(order, null);
@@ -28,13 +28,27 @@ function OrderQueuePane({ userID, authToken }) {
         setQueueHead(structuredClone(queueHead));
     }
 
+    // This method replaces an order in the queue with its latest version
+    function updateOrder(order) {
+        let current = queueHead.next;
+        while (current !== null) { // iterate until the end of the queue is reached
+            if (current.order.foodOrderID === order.foodOrderID) {
+                current.order = order;
+                break;
+            }
+            current = current.next;
+        }
+        // Update the queueHead state variable to trigger a re-render
+        setQueueHead(structuredClone(queueHead));
+    }
+
     // This method removes an order from the queue by ID
     function dequeueOrder(foodOrderID) {
         let current = queueHead;
         while (current.next !== null) { // iterate until the end of the queue is reached
             if (current.next.order.foodOrderID === foodOrderID) {
                 current.next = current.next.next; // removes reference to the order
-                return;
+                break;
             }
             current = current.next;
         }
@@ -42,49 +56,97 @@ function OrderQueuePane({ userID, authToken }) {
         setQueueHead(structuredClone(queueHead));
     }
 
-    // orders are loaded lazily to avoid repeatedly loading the entire queue at once
-    async function fetchOrderQueue() {
-        // Clear the error message
-        setQueueError(null);
+    // The server pushes new orders and changes to orders over a single connection as they happen,
+    // rather than the queue being polled
+    useEffect(() => {
+        let source = null;
+        let retryTimer = null;
+        let closed = false;
 
-        // This function is called repeatedly to fetch the order queue
-        const response = await fetch("https://localhost:8080/getOrderQueue", {
-            method: "POST",
-            headers: {
-                "Content-Type": "application/json",
-            },
-            body: JSON.stringify({
-                userID: userID,
-                authToken: authToken,
-                lastStoredFoodOrderID: currentOrderID
-            })
-        })
-        await response.json()
-        .then(data => {
+        // Each connection is opened with a new single-use ticket, so the auth token is never in the URL
+        async function openStream() {
+            if (closed) {
+                return; // the component has been unmounted
+            }
+            let data;
+            try {
+                const response = await fetch("https://localhost:8080/orderQueueStreamTicket", {
+                    method: "POST",
+                    headers: {
+                        "Content-Type": "application/json",
+                    },
+                    body: JSON.stringify({
+                        userID: userID,
+                        authToken: authToken
+                    })
+                });
+                data = await response.json();
+            } catch {
+                // The server cannot be reached, try again shortly
+                retryTimer = setTimeout(openStream, 5000);
+                return;
+            }
             if (data.error) {
                 setQueueError(data.error);
-            } else {
-                // Append the new orders to the queue
-                for (let order of data.orders) {
+                return;
+            }
+            if (closed) {
+                return; // the component was unmounted while waiting for the ticket
+            }
+
+            // Resume from the last version received, so no change made while disconnected is missed
+            const params = new URLSearchParams({
+                ticket: data.ticket,
+                version: currentVersion
+            });
+            source = new EventSource("https://localhost:8080/orderQueueStream?" + params);
+
+            source.addEventListener("changes", (event) => {
+                // Clear the error message
+                setQueueError(null);
+
+                const changes = JSON.parse(event.data);
+                if (changes.reset) {
+                    // The whole queue has been sent, so it replaces the queue loaded before
+                    queueHead.next = null;
+                    setQueueHead(structuredClone(queueHead));
+                }
+                for (let order of changes.inserted) {
                     enqueueOrder(order);
                 }
-                // Update the current order ID
-                try {
-                    currentOrderID = data.orders[data.orders.length - 1].foodOrderID;
-                } catch {
-                    // An exception could occur if the queue is empty - in this case do nothing
+                for (let order of changes.updated) {
+                    updateOrder(order);
                 }
-            }
-        });
-    }
+                // Fulfilled and rejected orders leave the queue
+                for (let foodOrderID of changes.removed) {
+                    dequeueOrder(foodOrderID);
+                }
+                // Update the current version
+                currentVersion = changes.version;
+            });
 
-    // Fetch the order queue every 10 seconds
-    useEffect(() => {
-        fetchOrderQueue();
-        const interval = setInterval(() => {
-            fetchOrderQueue();
-        }, 10000);
-        return () => clearInterval(interval); // Close the timer when the component is unmounted
+            source.addEventListener("error", (event) => {
+                // The browser would reconnect with the same ticket, which has already been used
+                source.close();
+                if (event.data) {
+                    // Errors sent by the server contain a message, e.g. when the auth token has expired
+                    setQueueError(JSON.parse(event.data).error);
+                } else {
+                    // The connection was lost, reconnect with a new ticket
+                    retryTimer = setTimeout(openStream, 5000);
+                }
+            });
+        }
+        openStream();
+
+        // Close the connection when the component is unmounted
+        return () => {
+            closed = true;
+            clearTimeout(retryTimer);
+            if (source !== null) {
+                source.close();
+            }
+        };
     }, []);
 
     // Reformat the order queue as a list of Order components
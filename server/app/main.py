@@ -1,6 +1,6 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
-from services.nearby_restaurants import getNearbyRestaurants, getRandomRestaurants
+from services.nearby_restaurants import getNearbyRestaurants, getRandomRestaurants, loadSpatialIndex, getNearbyFilters, getIncludedDetails
 from services.restaurant_details import getRestaurantDetails
 from services.email_verification import beginVerification
 from services.check_verification import checkVerificationCode
@@ -8,8 +8,10 @@ from services.auth_token import getAuthToken
 from services.authenticate import authenticate, authenticateProfessional
 from services.make_review import makeReview
 from services.get_reviews import getReviews
-from services.restaurant_search import restaurantSearch
-from services.reservation_availability import getAvailableReservations
+from services.restaurant_search import restaurantSearch, loadSearchIndex
+from services.search_index import MAX_SEARCH_TERM_LENGTH
+from services.top_k import getPageParameters, getNextPage
+from services.reservation_availability import getAvailableReservations, getAvailabilityCalendar
 from services.make_reservation import makeReservation
 from services.update_restaurant import updateRestaurant
 from services.save_image import saveRestaurantImage
@@ -18,32 +20,69 @@ from services.delete_image import deleteRestaurantImage
 from services.menu_item import addMenuItem, deleteMenuItem, changeMenuItem, saveMenuItemImage, getMenu
 from services.restaurant import getTables, setOpeningPeriods
 from services.retrieve_reservations import retrieveReservations
-from services.queue import getUnfulfilledOrders
-from services.db_connection import connect
+from services.queue import getUnfulfilledOrders, getOrderQueueChanges
+from services.order_events import streamOrderQueue
+from services.stream_tickets import streamTickets, TOKEN_CHECK_SECONDS
+from services.db_connection import connect, beginSession, commitSession, endSession, afterCommit
+from services.availability_cache import availabilityCache
+from functools import partial
 from services.bill import retrieveBill
 from services.order_eta import getOrderEta
 from services.metrics import getMetrics
+from services.email_outbox import startEmailWorker
+from services.diagnostics import startDiagnosticsLogging
 from datetime import datetime
+from time import monotonic
 from models.user import User, ProfessionalUser
 from models.table import Table
-from models.order import Order
+from models.order import Order, isValidQuantity
+import logging
 import json
 
 # This sets the app name
 app = Flask("tableNest")
 CORS(app)
 
+@app.before_request
+def openDatabaseSession():
+    # Every service and model used by the request shares one database connection,
+    # which is only opened when the first query is made
+    beginSession()
+
+@app.after_request
+def commitDatabaseSession(response):
+    # Commit all of the request's changes at once before the response is sent
+    # Responses for unhandled exceptions are left for the teardown to roll back
+    if response.status_code >= 500:
+        return response
+    error = commitSession()
+    if error is not None:
+        response = jsonify({"error": error})
+    return response
+
+@app.teardown_request
+def closeDatabaseSession(exception):
+    # Return the connection to the pool, anything left uncommitted is rolled back
+    endSession()
+
 @app.route("/nearbyRestaurants", methods=["POST"])
 def nearbyRestaurants():
     """
     This function takes an input from the POST request, user location.
     It then calls the nearby_restaurants service which finds the nearest 10 (at most)
     restaurants, which will be returned to the client in JSON format.
+    Optional parameters:
+    - maxMiles and category only return restaurants within the radius and in the category
+    - limit sets the number of restaurants returned, and cursor (the nextCursor returned
+      with the previous page) or offset selects a later page
+    - include, e.g. ["details", "images"], also returns each restaurant's details and images
+    - seed makes the random restaurants returned without a location reproducible
     """
     
     # Prepares response to be returned to the client
     response = {
         "restaurants" : None,
+        "nextCursor" : None,
         "error" : None
     }
     
@@ -52,6 +91,8 @@ def nearbyRestaurants():
     try:
         data = request.json
         latitude, longitude, random = data["latitude"], data["longitude"], data["random"]
+        page = getPageParameters(data)
+        filters = getNearbyFilters(data)
     except KeyError:
         response["error"] = "Missing required parameters"
         return jsonify(response)
@@ -65,28 +106,47 @@ def nearbyRestaurants():
         # Stop execution here and return the error message
         return jsonify(response)
     
+    for parameters in (page, filters):
+        if parameters[0] is None:
+            # The requested page or filters are invalid
+            response["error"] = parameters[1]
+            return jsonify(response)
+    maxMiles, category, include = filters[0]
+    
     if not random:
         # Get array of nearby restaurants and their respective distances
-        distances = getNearbyRestaurants((latitude, longitude))
+        # One more restaurant than requested is found to check whether there is another page
+        offset, limit = page[0]
+        distances = getNearbyRestaurants((latitude, longitude), limit + 1, offset, maxMiles, category)
         
-        if distances[0] is not None:
-            # No error has occurred
-            response["restaurants"] = distances[0]
-            
-            return jsonify(response)
-        else:
+        if distances[0] is None:
             # An error has occurred, stop execution here and return it to the client
             response["error"] = distances[1]
-            
             return jsonify(response)
+        
+        # No error has occurred
+        response["restaurants"], response["nextCursor"] = getNextPage(distances[0], offset, limit)
+        restaurantIDs = [restaurant[0] for restaurant in response["restaurants"]]
     else:
         # No location is provided, so return random restaurants
-        randomRestaurants = getRandomRestaurants()
+        seed = data.get("seed")
+        if seed is not None and type(seed) not in (int, str):
+            response["error"] = "The provided seed must be an integer or string"
+            return jsonify(response)
+        randomRestaurants = getRandomRestaurants(seed)
         
         # Encode the function output into the response 
         response["restaurants"], response["error"] = randomRestaurants
-        
-        return jsonify(response)
+        if response["error"] is not None:
+            return jsonify(response)
+        restaurantIDs = response["restaurants"]
+    
+    if len(include) > 0:
+        # Return the requested information for every restaurant, saving a request for each one
+        details = getIncludedDetails(restaurantIDs, include)
+        response["details"], response["error"] = details
+    
+    return jsonify(response)
     
 @app.route("/restaurantDetails", methods=["POST"])
 def restaurantDetails():
@@ -422,11 +482,13 @@ def changeUserEmail():
 def searchForRestaurants():
     """
     This function allows users to provide a search term and returns a list of
-    relevant restaurants (limited to 10 at most)
+    relevant restaurants (limited to 10 at most by default)
+    Optional limit and cursor (or offset) parameters select a different page of the results.
     """
     # Prepares response to be returned to the client
     response = {
         "results": None,
+        "nextCursor": None,
         "error": None
     }
     
@@ -434,6 +496,7 @@ def searchForRestaurants():
     try:
         data = request.json
         search_term = data["searchTerm"]
+        page = getPageParameters(data)
     except KeyError:
         response["error"] = "Missing required parameters"
         return jsonify(response)
@@ -447,15 +510,30 @@ def searchForRestaurants():
         # Stop execution here and return the error message
         return jsonify(response)
     
+    if page[0] is None:
+        # The requested page is invalid
+        response["error"] = page[1]
+        return jsonify(response)
+    
+    # Long search terms are rejected rather than being cut, which would change their results
+    if type(search_term) is not str:
+        response["error"] = "Invalid data format"
+        return jsonify(response)
+    if len(search_term) > MAX_SEARCH_TERM_LENGTH:
+        response["error"] = f"The search term must be at most {MAX_SEARCH_TERM_LENGTH} characters"
+        return jsonify(response)
+    
     # Attempt to get relevant restaurants
-    results = restaurantSearch(search_term)
+    # One more restaurant than requested is found to check whether there is another page
+    offset, limit = page[0]
+    results = restaurantSearch(search_term, limit + 1, offset)
     
     if results[0] is None:
         # An error has occurred
         response["error"] = results[1]
     else:
         # Restructure each tuple in the results into a dictionary
-        results = results[0]
+        results, response["nextCursor"] = getNextPage(results[0], offset, limit)
         for i in range(len(results)):
             restaurant = results[i]
             results[i] = {
@@ -518,6 +596,52 @@ def getRestaurantAvailability():
     response["results"] = availableReservations[0]
     return jsonify(response)
 
+@app.route("/reservationCalendar", methods=["POST"])
+def getRestaurantCalendar():
+    """
+    This function allows users to get the available start times for reservations
+    at a given restaurant for a specific number of people, on every day of a date range
+    (14 days from startDate unless the number of days is provided)
+    """
+    # Prepares response to be returned to the client
+    response = {
+        "calendar": None,
+        "error": None
+    }
+    
+    restaurantID, startDate, days, persons = None, None, 14, None
+    try:
+        data = request.json
+        restaurantID = data["restaurantID"]
+        startDate, persons = data["startDate"], data["persons"]
+        days = data.get("days", days)
+        # The date should be a string in format "YYYY-MM-DD" to comply with ISO 8601 
+    except KeyError:
+        response["error"] = "Missing required parameters"
+        return jsonify(response)
+    except ValueError:
+        response["error"] = "Invalid data format"
+        return jsonify(response)
+    except Exception as e:
+        # An error could occur if the request is malformed
+        response["error"] = "An unknown exception occured:", str(e)
+        
+        # Stop execution here and return the error message
+        return jsonify(response)
+    
+    # Attempt to convert the date from string to datetime object
+    dateObject = None
+    try:
+        dateObject = datetime.strptime(startDate, "%Y-%m-%d")
+    except ValueError as e:
+        # A ValueError could be raised if the date is incorrectly formatted
+        response["error"] = str(e)
+        return jsonify(response)
+    
+    # Retrieve available reservation start times for each day
+    response["calendar"], response["error"] = getAvailabilityCalendar(restaurantID, dateObject, days, persons)
+    return jsonify(response)
+
 @app.route("/makeReservation", methods=["POST"])
 def placeReservation():
     """
@@ -1051,6 +1175,7 @@ def editTable():
     # Prepare response to be returned to the client
     response = {
         "success": False,
+        "cancellations": None,
         "error": None
     }
 
@@ -1094,6 +1219,7 @@ def editTable():
         response["error"] = table.error
     else:
         response["success"] = True
+        response["cancellations"] = table.cancellations
 
     return jsonify(response)
 
@@ -1106,6 +1232,7 @@ def deleteRestaurantTable():
     # Prepare response to be returned to the client
     response = {
         "success": False,
+        "cancellations": None,
         "error": None
     }
 
@@ -1145,8 +1272,7 @@ def deleteRestaurantTable():
         response["error"] = table.error
     else:
         response["success"] = True
-
-    del(table) # Closes the table's database connection
+        response["cancellations"] = table.cancellations
 
     return jsonify(response)
 
@@ -1236,6 +1362,19 @@ def placeOrder():
         response["error"] = authentication[1]
         return jsonify(response)
 
+    # Check the items before the order is placed, so an invalid request does not leave an empty order
+    try:
+        items = [(item["menuItemID"], item["quantity"]) for item in menuItems]
+    except KeyError:
+        response["error"] = "Missing required parameters"
+        return jsonify(response)
+    except TypeError:
+        response["error"] = "Invalid data format"
+        return jsonify(response)
+    if not all(isValidQuantity(quantity) for _, quantity in items):
+        response["error"] = "The quantity of each item must be a whole number of at least 1"
+        return jsonify(response)
+
     # Place the order
     order = Order(userID=userID, restaurantID=restaurantID, tableID=tableID, customisation=customisation)
 
@@ -1245,8 +1384,7 @@ def placeOrder():
         return jsonify(response)
 
     # Add the menu items to the order
-    for item in menuItems:
-        order.addItem(item["menuItemID"], item["quantity"])
+    order.addItems(items)
 
     # Check for errors
     if order.error is not None:
@@ -1344,11 +1482,18 @@ def getOrderQueue():
         response["error"] = "Invalid data format"
         return jsonify(response)
 
-    # Authenticate the provided token and retrieve the user's restaurantID
+    # Authenticate the provided token
+    authentication = authenticate(userID, authToken)
+    if not authentication[0]:
+        # Authentication failed
+        response["error"] = authentication[1]
+        return jsonify(response)
+
+    # Check that the user is a professional and retrieve their restaurantID
     authentication = authenticateProfessional(userID, authToken)
     if authentication[1] is not None:
         # An error has occurred
-        response["erorr"] = authentication[1]
+        response["error"] = authentication[1]
         return jsonify(response)
 
     # No error occurred, retrieve the restaurantID
@@ -1367,6 +1512,180 @@ def getOrderQueue():
 
     return jsonify(response)
 
+@app.route("/getOrderQueueChanges", methods=["POST"])
+def getOrderQueueChangesRoute():
+    """
+    This function allows professional users to retrieve only the changes to their restaurant's order
+    queue since the version they last received, rather than the whole queue
+    """
+    # Prepare response to be returned to the client
+    response = {
+        "version": None,
+        "reset": None,
+        "inserted": None,
+        "updated": None,
+        "removed": None,
+        "error": None
+    }
+
+    userID, authToken, version = None, None, None
+    try:
+        data = request.json
+        userID, authToken = data["userID"], data["authToken"]
+        # A version of 0 returns the whole queue
+        version = data.get("version", 0)
+    except KeyError:
+        response["error"] = "Missing required parameters"
+        return jsonify(response)
+    except ValueError:
+        response["error"] = "Invalid data format"
+        return jsonify(response)
+
+    if type(version) is not int or version < 0:
+        response["error"] = "Invalid data format"
+        return jsonify(response)
+
+    # Authenticate the provided token
+    authentication = authenticate(userID, authToken)
+    if not authentication[0]:
+        # Authentication failed
+        response["error"] = authentication[1]
+        return jsonify(response)
+
+    # Check that the user is a professional and retrieve their restaurantID
+    authentication = authenticateProfessional(userID, authToken)
+    if authentication[1] is not None:
+        # An error has occurred
+        response["error"] = authentication[1]
+        return jsonify(response)
+
+    # No error occurred, retrieve the restaurantID
+    restaurantID = authentication[0]
+
+    # Retrieve the changes to the order queue
+    changes = getOrderQueueChanges(restaurantID, version)
+
+    # Check if any errors occurred during retrieval
+    if changes[0] is None:
+        # An error has occurred
+        response["error"] = changes[1]
+    else:
+        # No errors occurred, return the changes
+        response.update(changes[0])
+
+    return jsonify(response)
+
+@app.route("/orderQueueStreamTicket", methods=["POST"])
+def orderQueueStreamTicket():
+    """
+    This function allows professional users to get a ticket for opening their restaurant's order
+    queue stream. Tickets can be used once, within a few seconds of being issued
+    """
+    # Prepare response to be returned to the client
+    response = {
+        "ticket": None,
+        "error": None
+    }
+
+    userID, authToken = None, None
+    try:
+        data = request.json
+        userID, authToken = data["userID"], data["authToken"]
+    except KeyError:
+        response["error"] = "Missing required parameters"
+        return jsonify(response)
+    except ValueError:
+        response["error"] = "Invalid data format"
+        return jsonify(response)
+
+    # Authenticate the provided token
+    authentication = authenticate(userID, authToken)
+    if not authentication[0]:
+        # Authentication failed
+        response["error"] = authentication[1]
+        return jsonify(response)
+
+    # Check that the user is a professional and retrieve their restaurantID
+    authentication = authenticateProfessional(userID, authToken)
+    if authentication[1] is not None:
+        # An error has occurred
+        response["error"] = authentication[1]
+        return jsonify(response)
+
+    # No error occurred, issue the ticket
+    response["ticket"] = streamTickets.issue(userID, authToken, authentication[0])
+    return jsonify(response)
+
+@app.route("/orderQueueStream", methods=["GET"])
+def orderQueueStream():
+    """
+    This function streams the order queue for a professional user's restaurant as Server-Sent Events
+    New orders and changes to orders are pushed as they are committed, so the client does not poll
+    The stream is opened with a ticket from /orderQueueStreamTicket, and ends once the user's
+    authentication token is no longer valid
+    """
+    ticket, version = None, None
+    try:
+        # EventSource can only make GET requests, so the parameters are in the query string
+        ticket = request.args["ticket"]
+        # The stream resumes from the last version the client received. After reconnecting, the
+        # browser sends it as the id of the last event. A version of 0 starts with the whole queue
+        version = int(request.headers.get("Last-Event-ID", request.args.get("version", 0)))
+    except KeyError:
+        return jsonify({"error": "Missing required parameters"})
+    except ValueError:
+        return jsonify({"error": "Invalid data format"})
+
+    if version < 0:
+        return jsonify({"error": "Invalid data format"})
+
+    # The ticket can only be used once, so a logged URL cannot be used to open another stream
+    redeemed = streamTickets.redeem(ticket)
+    if redeemed is None:
+        return jsonify({"error": "The stream ticket is invalid or expired"})
+    userID, authToken, restaurantID = redeemed
+
+    # The stream stays open for as long as the kitchen screen does, so it must not keep the
+    # request's database connection. Any later queries check a connection out only when needed
+    error = commitSession()
+    endSession()
+    if error is not None:
+        return jsonify({"error": error})
+
+    def formatEvent(name, eventID, data):
+        message = f"event: {name}\n"
+        if eventID is not None:
+            message += f"id: {eventID}\n"
+        return message + f"data: {app.json.dumps(data)}\n\n"
+
+    def generateEvents():
+        events = streamOrderQueue(restaurantID, version)
+        lastChecked = monotonic()
+        try:
+            for event in events:
+                # Check the token again from time to time, ending the stream once it has expired
+                # or been deleted. An idle stream still yields keep-alives, so this always happens
+                if monotonic() - lastChecked >= TOKEN_CHECK_SECONDS:
+                    authentication = authenticate(userID, authToken)
+                    if not authentication[0]:
+                        yield formatEvent("error", None, {"error": authentication[1]})
+                        return
+                    lastChecked = monotonic()
+
+                if event is None:
+                    # A comment line keeps the connection open while nothing is happening
+                    yield ": keep-alive\n\n"
+                    continue
+                yield formatEvent(*event)
+        finally:
+            # Stop listening for the restaurant's events as soon as the stream ends
+            events.close()
+
+    return Response(generateEvents(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no" # stops proxies from holding events back
+    })
+
 @app.route("/getTableBill", methods=["POST"])
 def getTableBill():
     """
@@ -1498,6 +1817,7 @@ def setRestaurantOpeningPeriods():
     # Prepares response to be returned to the client
     response = {
         "success": False,
+        "cancellations": None,
         "error": None
     }
 
@@ -1538,6 +1858,8 @@ def setRestaurantOpeningPeriods():
         response["error"] = periods[1]
     else:
         response["success"] = True
+        # Report how many reservations were cancelled by the new opening periods
+        response["cancellations"] = periods[0]
 
     return jsonify(response)
 
@@ -1619,9 +1941,18 @@ def cancelReservation():
     if connection[0] is not None:
         with connection[0] as connection:
             with connection.cursor() as cursor:
+                # Find which availability the reservation affects before deleting it
+                sql = "SELECT restaurantID, datetime FROM Reservation WHERE reservationID=%s AND userID=%s;"
+                cursor.execute(sql, (reservationID, userID))
+                reservation = cursor.fetchone()
+                
                 sql = "DELETE FROM Reservation WHERE reservationID=%s AND userID=%s;"
                 cursor.execute(sql, (reservationID, userID))
                 connection.commit()
+                
+                if reservation is not None:
+                    # The table is available again around this time
+                    afterCommit(partial(availabilityCache.invalidateAround, reservation[0], reservation[1]))
     else:
         response["error"] = connection[1]
         return jsonify(response)
@@ -1660,4 +1991,12 @@ def getRestaurantID():
 
 # This runs the app so that POST requests can be received
 if __name__ == "__main__":
+    # Build the in-memory search and spatial indexes before the first search arrives
+    loadSearchIndex()
+    loadSpatialIndex()
+    # Emails queued by requests are sent in the background
+    startEmailWorker()
+    # The counters of the shared caches and pools are logged periodically
+    logging.basicConfig(level=logging.INFO)
+    startDiagnosticsLogging()
     app.run(host="localhost", port=8080, ssl_context=("/Users/wl/Documents/restaurant/restaurant-frontend/localhost+1.pem", "/Users/wl/Documents/restaurant/restaurant-frontend/localhost+1-key.pem"))
\ No newline at end of file
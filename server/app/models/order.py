@@ -1,4 +1,7 @@
-from services.db_connection import connect
+from services.db_connection import connect, afterCommit
+from services.order_events import orderEvents
+from services.queue import logOrderChange
+from functools import partial
 
 # This class will be used to represent each food order placed by users
 class Order:
@@ -15,6 +18,7 @@ class Order:
         self.error = None
 
         # Establish a database connection
+        self.__connection = None
         connection = connect()
         if connection[0] is not None:
             connection = connection[0]
@@ -47,10 +51,14 @@ class Order:
         # Attempt to execute the SQL query
         try:
             self.__cursor.execute(sql, (self.__userID, self.__restaurantID, self.__tableID, self.__customisation))
-            self.__connection.commit()
 
             # The order was created successfully, so retrieve the new orderID
             self.__foodOrderID = self.__cursor.lastrowid
+            self.__connection.commit()
+
+            # Log the order and tell the restaurant's order queue streams about it once it is committed
+            afterCommit(partial(logOrderChange, self.__restaurantID, self.__foodOrderID, "insert"))
+            afterCommit(partial(orderEvents.publish, self.__restaurantID, {"type": "order", "foodOrderID": self.__foodOrderID}))
 
             # Store the new database values in the object
             self.__retrieveData()
@@ -82,58 +90,78 @@ class Order:
 
     def addItem(self, menuItemID, quantity=1):
         # This function adds an item to the order
-        # Check that the menuItemID exists and is associated with the restaurant
-        sql = """
-        SELECT menuItemID
-        FROM MenuItem
-        WHERE restaurantID = %s AND menuItemID = %s;
-        """
-        self.__cursor.execute(sql, (self.__restaurantID, menuItemID))
-        result = self.__cursor.fetchone()
-        if result is None:
-            self.error = "The menu item does not exist"
+        return self.addItems([(menuItemID, quantity)])
+
+    def addItems(self, items):
+        # This function adds several items to the order at once, taking a list of (menuItemID, quantity)
+        # Every item is checked with one query, then all of the OrderItems are inserted and the
+        # price is updated in a single transaction
+        # Quantities are stored in an INT column, so anything but a whole number of units is rejected
+        if not all(isValidQuantity(quantity) for _, quantity in items):
+            self.error = "The quantity of each item must be a whole number of at least 1"
             return False
 
-        for _ in range(quantity):
-            # Repeat this process for each item to be added
+        # Check that the menuItemIDs exist and are associated with the restaurant
+        menuItemIDs = list(set(menuItemID for menuItemID, _ in items))
+        prices = {}
+        if len(menuItemIDs) > 0:
+            placeholders = ", ".join(["%s"] * len(menuItemIDs))
+            sql = f"""
+            SELECT menuItemID, price
+            FROM MenuItem
+            WHERE restaurantID = %s AND menuItemID IN ({placeholders});
+            """
+            self.__cursor.execute(sql, (self.__restaurantID, *menuItemIDs))
+            prices = {str(menuItemID): price for menuItemID, price in self.__cursor.fetchall()}
+
+        # One OrderItem is stored for each item with the number of units ordered and the price of
+        # each unit, in the order the items were provided
+        # Items which do not exist are skipped and reported, the other items are still added
+        orderItems = []
+        total = 0
+        for menuItemID, quantity in items:
+            if str(menuItemID) not in prices:
+                self.error = "The menu item does not exist"
+                continue
+            unitPrice = prices[str(menuItemID)]
+            orderItems.append((self.__foodOrderID, menuItemID, quantity, unitPrice))
+            total += unitPrice * quantity
+
+        if len(orderItems) == 0:
+            return self.error is None
+
+        try:
+            # executemany sends the rows as a single multi-row INSERT
             sql = """
-            INSERT INTO OrderItem (foodOrderID, menuItemID)
-            VALUES (%s, %s);
+            INSERT INTO OrderItem (foodOrderID, menuItemID, quantity, unitPrice)
+            VALUES (%s, %s, %s, %s);
             """
-            try:
-                self.__cursor.execute(sql, (self.__foodOrderID, menuItemID))
-                self.__connection.commit()
-            except Exception as e:
-                self.__connection.rollback()
-                self.error = "An error occurred adding the item to the order"
-                return False
+            self.__cursor.executemany(sql, orderItems)
 
             # Update the price of the order
             sql = """
             UPDATE FoodOrder
-            SET price = price + (SELECT price FROM MenuItem WHERE menuItemID = %s)
+            SET price = price + %s
             WHERE foodOrderID = %s;
             """
-            try:
-                self.__cursor.execute(sql, (menuItemID, self.__foodOrderID))
-                self.__connection.commit()
-            except Exception as e:
-                self.__connection.rollback()
-                self.error = "An error occurred updating the order price"
-                return False
-
-            # Update the price of the order object
-            sql = "SELECT price FROM FoodOrder WHERE foodOrderID = %s;"
-            self.__cursor.execute(sql, (self.__foodOrderID,))
-            self.__price = self.__cursor.fetchone()[0]
+            self.__cursor.execute(sql, (total, self.__foodOrderID))
+            self.__connection.commit()
+        except Exception as e:
+            self.__connection.rollback()
+            self.error = "An error occurred adding the items to the order"
+            return False
 
-            # The item was added successfully
-            continue
-        return True
+        # Update the price of the order object
+        sql = "SELECT price FROM FoodOrder WHERE foodOrderID = %s;"
+        self.__cursor.execute(sql, (self.__foodOrderID,))
+        self.__price = self.__cursor.fetchone()[0]
+
+        return self.error is None
 
     def orderStatus(self, confirmed=False, fulfilled=False, paid=False):
         # This function allows an order to be confirmed or rejected, or marked as fulfilled, or marked as paid
         if fulfilled:
+            status = "fulfilled"
             # Mark the order as fulfilled
             sql = """
             UPDATE FoodOrder
@@ -141,6 +169,7 @@ class Order:
             WHERE foodOrderID = %s;
             """
         elif paid:
+            status = "paid"
             # Mark the order as paid
             sql = """
             UPDATE FoodOrder
@@ -148,6 +177,7 @@ class Order:
             WHERE foodOrderID = %s;
             """
         elif confirmed:
+            status = "confirmed"
             # Mark the order as confirmed
             sql = """
             UPDATE FoodOrder
@@ -155,6 +185,7 @@ class Order:
             WHERE foodOrderID = %s;
             """
         elif not confirmed and not (fulfilled or paid):
+            status = "rejected"
             # This is a request to reject the order, so delete the order
             sql = """
             DELETE FROM FoodOrder
@@ -165,6 +196,10 @@ class Order:
         try:
             self.__cursor.execute(sql, (self.__foodOrderID,))
             self.__connection.commit()
+
+            # Log the change and tell the restaurant's order queue streams about it once it is committed
+            afterCommit(partial(logOrderChange, self.__restaurantID, self.__foodOrderID, "delete" if status == "rejected" else "update"))
+            afterCommit(partial(orderEvents.publish, self.__restaurantID, {"type": "status", "foodOrderID": self.__foodOrderID, "status": status}))
             return True
         except Exception as e:
             self.__connection.rollback()
@@ -177,6 +212,13 @@ class Order:
     def getRestaurantID(self):
         return self.__restaurantID
 
-    def __del__(self):
-        # Close the database connection when the object is destroyed
-        self.__connection.close()
\ No newline at end of file
+    def close(self):
+        # This returns the database connection once the order is no longer needed
+        # During a request this has no effect, as the connection belongs to the request session
+        if self.__connection is not None:
+            self.__connection.close()
+            self.__connection = None
+
+# This function checks that a quantity is a whole number of units, booleans are not accepted
+def isValidQuantity(quantity):
+    return type(quantity) is int and quantity >= 1
@@ -1,5 +1,7 @@
-from services.db_connection import connect
-from services.email import sendEmail
+from services.db_connection import connect, afterCommit
+from services.availability_cache import availabilityCache
+from functools import partial
+from services.cancel_reservations import cancelReservations
 
 # This class is used for organising data about each table in a restaurant
 class Table:
@@ -9,8 +11,11 @@ class Table:
         self.__capacity = capacity
         self.__tableNumber = tableNumber
         self.error = None
+        # How many reservations the last edit or deletion cancelled, and how long it took
+        self.cancellations = None
 
         # Establish a database connection
+        self.__connection = None
         connection = connect()
         if connection[0] is not None:
             connection = connection[0]
@@ -87,6 +92,7 @@ class Table:
             # Retrieve the value of the new tableID
             self.__tableID = self.__cursor.lastrowid
 
+            self.__invalidateAvailability()
             return True
         except Exception as e:
             # An error occurred inserting the table
@@ -119,6 +125,7 @@ class Table:
 
             # Delete any future reservations which exceed the table's capacity
             self.__cancelInvalidReservations()
+            self.__invalidateAvailability()
 
             # Return True to indicate success
             return True
@@ -140,25 +147,13 @@ class Table:
         self.__cursor.execute(sql, (self.__restaurantID, self.__tableID, self.__capacity))
         result = self.__cursor.fetchall()
 
-        # Iterate through each invalid reservation
-        for reservation in result:
-            reservationID, reservationDatetime, userEmail = reservation
-            # Delete the reservation
-            sql = "DELETE FROM Reservation WHERE reservationID = %s;"
-            try:
-                self.__cursor.execute(sql, (reservationID,))
-                self.__connection.commit()
-            except Exception as e:
-                # An error occurred deleting the reservation
-                self.__connection.rollback()
-                self.error = f"An error occurred deleting a future invalid reservation: {e}"
-                return
-
-            # Send cancellation email
-            sendEmail(userEmail, "Reservation Cancelled", """
-            Unfortunately, your reservation at <strong>%s</strong> has been cancelled,
-            as the table you reserved is no longer available. We apologise for any inconvenience caused.
-            """ % (reservationDatetime))
+        # Delete every invalid reservation and notify their users together
+        cancellations = cancelReservations(self.__connection, self.__cursor, self.__getCancellations(result))
+        if cancellations[0] is None:
+            # An error occurred deleting the reservations
+            self.error = f"An error occurred deleting future invalid reservations: {cancellations[1]}"
+            return
+        self.cancellations = cancellations[0]
 
     def deleteTable(self):
         # Retrieve any reservations which will need to be deleted
@@ -171,25 +166,13 @@ class Table:
         self.__cursor.execute(sql, (self.__restaurantID, self.__tableID))
         result = self.__cursor.fetchall()
 
-        # Iterate through each reservation
-        for reservation in result:
-            reservationID, reservationDatetime, userEmail = reservation
-            # Delete the reservation
-            sql = "DELETE FROM Reservation WHERE reservationID = %s;"
-            try:
-                self.__cursor.execute(sql, (reservationID,))
-                self.__connection.commit()
-            except Exception as e:
-                # An error occurred deleting the reservation
-                self.__connection.rollback()
-                self.error = f"An error occurred deleting a future reservation: {e}"
-                return False
-
-            # Send cancellation email
-            sendEmail(userEmail, "Reservation Cancelled", """
-            Unfortunately, your reservation at <strong>%s</strong> has been cancelled,
-            as the table you reserved is no longer available. We apologise for any inconvenience caused.
-            """ % (reservationDatetime))
+        # Delete every future reservation and notify their users together
+        cancellations = cancelReservations(self.__connection, self.__cursor, self.__getCancellations(result))
+        if cancellations[0] is None:
+            # An error occurred deleting the reservations
+            self.error = f"An error occurred deleting future reservations: {cancellations[1]}"
+            return False
+        self.cancellations = cancellations[0]
 
         # This function deletes the table from the database
         sql = "DELETE FROM RestaurantTable WHERE restaurantID = %s AND tableID = %s;"
@@ -197,6 +180,7 @@ class Table:
         try:
             self.__cursor.execute(sql, (self.__restaurantID, self.__tableID))
             self.__connection.commit()
+            self.__invalidateAvailability()
             return True
         except Exception as e:
             # An error occurred deleting the table
@@ -204,10 +188,24 @@ class Table:
             self.error = f"An error occurred deleting the table: {e}"
             return False
 
+    def __getCancellations(self, reservations):
+        # Creates the (reservationID, emailAddress, body) tuples used to cancel the provided reservations
+        return [(reservationID, userEmail, """
+            Unfortunately, your reservation at <strong>%s</strong> has been cancelled,
+            as the table you reserved is no longer available. We apologise for any inconvenience caused.
+            """ % (reservationDatetime)) for reservationID, reservationDatetime, userEmail in reservations]
+
+    def __invalidateAvailability(self):
+        # The restaurant's stored availability is out of date once the table's changes are committed
+        afterCommit(partial(availabilityCache.invalidate, self.__restaurantID))
+
     def getTableID(self):
         # This function returns the tableID of the table
         return self.__tableID
 
-    def __del__(self):
-        # This destructor closes the database connection
-        self.__connection.close()
\ No newline at end of file
+    def close(self):
+        # This returns the database connection once the table is no longer needed
+        # During a request this has no effect, as the connection belongs to the request session
+        if self.__connection is not None:
+            self.__connection.close()
+            self.__connection = None
\ No newline at end of file
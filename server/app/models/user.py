@@ -1,4 +1,9 @@
-from services.db_connection import connect
+from services.db_connection import connect, afterCommit
+from services.search_index import searchIndex
+from services.spatial_index import spatialIndex
+from services.restaurant_id_cache import restaurantIDCache
+from services.auth_cache import authCache
+from functools import partial
 from email_validator import validate_email, EmailNotValidError
 
 # This class is used for organising data about users of the system
@@ -114,6 +119,9 @@ class User:
                         connection.rollback() # revert changes
                         return
                     
+                    # The deleted tokens must no longer be accepted from the authentication cache
+                    afterCommit(partial(authCache.invalidateUser, self.userID))
+
                     self.email = new_email
                     return
         else:
@@ -240,6 +248,11 @@ class ProfessionalUser(User):
             connection.rollback()
             return
         
+        # Make the new restaurant searchable
+        afterCommit(partial(searchIndex.setName, cursor.lastrowid, "New Restaurant"))
+        afterCommit(partial(spatialIndex.setRestaurant, cursor.lastrowid, "0, 0", "None"))
+        afterCommit(partial(restaurantIDCache.add, cursor.lastrowid))
+        
     def getRestaurantID(self, cursor):
         # Retrieve the restaurantID stored for this user's restaurant
         sql = "SELECT restaurantID FROM Restaurant WHERE managerUserID = %s;"
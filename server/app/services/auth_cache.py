@@ -0,0 +1,95 @@
+from collections import OrderedDict
+from datetime import datetime
+from time import monotonic
+import threading
+import secrets
+import hashlib
+import hmac
+import os
+
+# This class remembers which (userID, token) pairs have recently been verified, so that repeated
+# requests with the same token do not each need an Argon2 verification
+# Entries are keyed by an HMAC of the userID and token with a key which only exists in this
+# process, so the cache never holds a plaintext token or anything which could be checked offline
+# Entries are removed once they are older than the TTL, once the token expires, when the user's
+# tokens change, or when the cache is full and they are the least recently used
+class AuthCache:
+    def __init__(self, maxEntries, ttl):
+        self.__maxEntries = maxEntries
+        self.__ttl = ttl
+        self.__key = secrets.token_bytes(32)
+        # digest -> (userID, time the entry expires, token expiry), least recently used first
+        self.__entries = OrderedDict()
+        # userID -> set of the user's digests
+        self.__users = {}
+        self.__lock = threading.Lock()
+
+        # Counters describing how the cache is being used
+        self.__metrics = {
+            "hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "invalidations": 0
+        }
+
+    def check(self, userID, token):
+        # Returns True if the token was recently verified for the user and has not expired
+        digest = self.__digest(userID, token)
+        with self.__lock:
+            entry = self.__entries.get(digest)
+            if entry is not None and (monotonic() >= entry[1] or datetime.now() >= entry[2]):
+                self.__remove(digest)
+                entry = None
+
+            if entry is None:
+                self.__metrics["misses"] += 1
+                return False
+
+            self.__entries.move_to_end(digest)
+            self.__metrics["hits"] += 1
+            return True
+
+    def add(self, userID, token, tokenExpiry):
+        # Stores a successful verification, which is used until the TTL passes or the token expires
+        digest = self.__digest(userID, token)
+        userID = str(userID)
+        with self.__lock:
+            if digest in self.__entries:
+                self.__remove(digest)
+            self.__entries[digest] = (userID, monotonic() + self.__ttl, tokenExpiry)
+            self.__users.setdefault(userID, set()).add(digest)
+            while len(self.__entries) > self.__maxEntries:
+                self.__remove(next(iter(self.__entries)))
+                self.__metrics["evictions"] += 1
+
+    def invalidateUser(self, userID):
+        # Removes every stored verification for the user, for example when their tokens are deleted
+        with self.__lock:
+            self.__metrics["invalidations"] += 1
+            for digest in list(self.__users.get(str(userID), ())):
+                self.__remove(digest)
+
+    def getMetrics(self):
+        # Returns a snapshot of the cache's size and counters
+        with self.__lock:
+            metrics = dict(self.__metrics)
+            metrics["size"] = len(self.__entries)
+            metrics["maxEntries"] = self.__maxEntries
+            return metrics
+
+    def __digest(self, userID, token):
+        message = f"{userID}:{token}".encode("utf-8")
+        return hmac.new(self.__key, message, hashlib.sha256).digest()
+
+    def __remove(self, digest):
+        userID = self.__entries.pop(digest)[0]
+        digests = self.__users[userID]
+        digests.discard(digest)
+        if len(digests) == 0:
+            del self.__users[userID]
+
+# The cache is shared by the whole process, its size and TTL can be set in the environment
+authCache = AuthCache(
+    int(os.getenv("AUTH_CACHE_SIZE", 10000)),
+    float(os.getenv("AUTH_CACHE_TTL", 60))
+)
@@ -1,6 +1,6 @@
 from services.db_connection import connect
 from secrets import token_hex
-from argon2 import PasswordHasher
+from services.hashing import hashingPool
 from datetime import datetime, timedelta
 
 def getAuthToken(userID):
@@ -14,17 +14,20 @@ def getAuthToken(userID):
     if connection[0] is not None:
         with connection[0] as connection:
             with connection.cursor() as cursor:
-                # Generate the plaintext and hashed token
-                plaintext, hash_token = generateToken()
+                # Generate the plaintext token, its selector and the hashed verifier
+                token = generateToken()
+                if token[0] is None:
+                    return (None, token[1])
+                plaintext, selector, hash_token = token
                 
                 # Calculate token expiry
                 expiry = datetime.now() + timedelta(days=7)
                 
                 # Insert hashed token into the database
-                sql = "INSERT INTO AuthToken (userID, tokenHash, expiry) VALUES (%s, %s, %s);"
+                sql = "INSERT INTO AuthToken (userID, selector, tokenHash, expiry) VALUES (%s, %s, %s, %s);"
                 
                 try:
-                    cursor.execute(sql, (userID, hash_token, expiry))
+                    cursor.execute(sql, (userID, selector, hash_token, expiry))
                     connection.commit()
                 except Exception as e:
                     # An error has occurred while inserting, revert changes
@@ -40,15 +43,20 @@ def getAuthToken(userID):
     
 def generateToken():
     """
-    This method generates a random authorisation token and returns it in both
-    plaintext and hashed form.
+    This method generates a random authorisation token in the form "selector.verifier" and returns
+    it in plaintext, along with the selector and the hashed verifier.
+    The selector lets the token be found without checking the user's other tokens, only the
+    verifier is secret. If the verifier cannot be hashed, (None, error message, None) is returned.
     """
-    # Generate random plaintext token
-    plaintext = token_hex(16)
+    # Generate random plaintext selector and verifier
+    selector = token_hex(8)
+    verifier = token_hex(16)
     
-    # Hash the token
-    hasher = PasswordHasher()
-    hash_token = hasher.hash(plaintext)
+    # Hash the verifier using the hashing pool
+    hash_token = hashingPool.hash("token", verifier)
+    if hash_token[0] is None:
+        # The hash could not be created, return None and the error message
+        return None, hash_token[1], None
     
-    # Return both tokens
-    return plaintext, hash_token
\ No newline at end of file
+    # Return the token, selector and hash
+    return f"{selector}.{verifier}", selector, hash_token[0]
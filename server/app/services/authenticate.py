@@ -1,41 +1,68 @@
 from services.db_connection import connect
-from argon2 import PasswordHasher
-from argon2.exceptions import VerifyMismatchError
+from services.auth_cache import authCache
+from services.hashing import hashingPool
 
 from models.user import User, ProfessionalUser
 
 # This function checks whether a provided authentication token is valid
 def authenticate(userID, token):
+    # A token verified recently does not need to be verified again
+    if authCache.check(userID, token):
+        return (True, None)
+
     # Attempt to connect to the database
     connection = connect()
     
     if connection[0] is not None:
         with connection[0] as connection:
             with connection.cursor() as cursor:
-                # Retrieve all stored, non-expired tokens for the provided userID
-                sql = """
-                SELECT
-                    AuthToken.tokenHash
-                FROM
-                    AuthToken INNER JOIN USER
-                        ON AuthToken.userID = User.userID
-                WHERE
-                    AuthToken.userID = %s
-                    AND AuthToken.expiry > NOW()
-                    AND User.loginAttempts <= 5;
-                """
-                cursor.execute(sql, (userID,))
+                # Tokens are "selector.verifier", the selector finds the one stored token to check
+                token = str(token)
+                selector, _, verifier = token.partition(".")
+                if verifier != "":
+                    sql = """
+                    SELECT
+                        AuthToken.tokenHash, AuthToken.expiry, User.loginAttempts
+                    FROM
+                        AuthToken INNER JOIN USER
+                            ON AuthToken.userID = User.userID
+                    WHERE
+                        AuthToken.selector = %s
+                        AND AuthToken.userID = %s
+                        AND AuthToken.expiry > NOW()
+                        AND User.loginAttempts <= 5;
+                    """
+                    cursor.execute(sql, (selector, userID))
+                else:
+                    # Tokens issued before selectors were added are checked against every stored
+                    # token without a selector. These expire within 7 days of being issued
+                    verifier = token
+                    sql = """
+                    SELECT
+                        AuthToken.tokenHash, AuthToken.expiry, User.loginAttempts
+                    FROM
+                        AuthToken INNER JOIN USER
+                            ON AuthToken.userID = User.userID
+                    WHERE
+                        AuthToken.userID = %s
+                        AND AuthToken.selector IS NULL
+                        AND AuthToken.expiry > NOW()
+                        AND User.loginAttempts <= 5;
+                    """
+                    cursor.execute(sql, (userID,))
                 result = cursor.fetchall()
                 
-                # Initialise a PasswordHasher object for verifying hashes
-                hasher = PasswordHasher()
-                
                 # We iterate through each valid stored token and check if it matches
                 for row in result:
                     token_hash = row[0]
-                    try:
-                        if hasher.verify(bytes(token_hash), str(token)):
-                            # A matching token has been found, reset login attempts
+                    # The hash is checked by the hashing pool's worker processes
+                    matched = hashingPool.verify("token", bytes(token_hash), verifier)
+                    if matched[1] is not None:
+                        # The token could not be checked, which is not a failed attempt
+                        return (False, matched[1])
+                    if matched[0]:
+                        # A matching token has been found, reset login attempts unless they are already 0
+                        if row[2] != 0:
                             sql = "UPDATE User SET loginAttempts = 0 WHERE userID = %s;"
                             try:
                                 cursor.execute(sql, (userID,))
@@ -44,13 +71,17 @@ def authenticate(userID, token):
                                 # An error has occurred, revert changes
                                 connection.rollback()
                                 return (False, str(e))
-                            
-                            # Return authentication success message
-                            return (True, None)
-                    except VerifyMismatchError:
-                        continue
+                        
+                        # Remember the verification until the token expires or the cache's TTL passes
+                        authCache.add(userID, token, row[1])
+
+                        # Return authentication success message
+                        return (True, None)
                 
                 # No matching token has been found, increment login attempts
+                # The user's cached verifications are removed, so that a user locked out by too many
+                # failed attempts cannot keep using a cached token
+                authCache.invalidateUser(userID)
                 sql = "UPDATE User SET loginAttempts = loginAttempts + 1 WHERE userID = %s;"
                 
                 try:
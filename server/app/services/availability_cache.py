@@ -0,0 +1,102 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from time import monotonic
+import threading
+import os
+
+# This class stores the DaySchedule built for a restaurant on a date, so that availability for
+# any number of persons can be found without querying the database again
+# Entries are removed once changes which affect them are committed, once they are older than
+# the TTL, or when the cache is full and they are the least recently used
+class AvailabilityCache:
+    def __init__(self, maxEntries, ttl):
+        self.__maxEntries = maxEntries
+        self.__ttl = ttl
+        # (restaurantID, date) -> (DaySchedule, timeStored), least recently used first
+        self.__entries = OrderedDict()
+        # restaurantID -> number of times the restaurant's entries have been invalidated
+        self.__versions = {}
+        self.__lock = threading.Lock()
+
+        # Counters describing how the cache is being used
+        self.__metrics = {
+            "hits": 0,
+            "misses": 0,
+            "expiries": 0,
+            "evictions": 0,
+            "invalidations": 0
+        }
+
+    def getVersion(self, restaurantID):
+        # Returns the restaurant's version, which must be read before its schedules are built
+        with self.__lock:
+            return self.__versions.get(restaurantID, 0)
+
+    def get(self, restaurantID, date):
+        # Returns the stored DaySchedule, or None if there is not a current one
+        key = (restaurantID, toDay(date))
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None and monotonic() - entry[1] >= self.__ttl:
+                del self.__entries[key]
+                self.__metrics["expiries"] += 1
+                entry = None
+
+            if entry is None:
+                self.__metrics["misses"] += 1
+                return None
+
+            self.__entries.move_to_end(key)
+            self.__metrics["hits"] += 1
+            return entry[0]
+
+    def set(self, restaurantID, date, schedule, version):
+        # Stores a DaySchedule, unless the restaurant has changed since the version was read
+        # as the schedule could then have been built from data which is no longer correct
+        key = (restaurantID, toDay(date))
+        with self.__lock:
+            if self.__versions.get(restaurantID, 0) != version:
+                return
+            self.__entries[key] = (schedule, monotonic())
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.__maxEntries:
+                self.__entries.popitem(last=False)
+                self.__metrics["evictions"] += 1
+
+    def invalidate(self, restaurantID, dates=None):
+        # Removes the restaurant's stored schedules for the dates, or for every date if None
+        days = None if dates is None else set(toDay(date) for date in dates)
+        with self.__lock:
+            self.__versions[restaurantID] = self.__versions.get(restaurantID, 0) + 1
+            self.__metrics["invalidations"] += 1
+            keys = [
+                key for key in self.__entries
+                if key[0] == restaurantID and (days is None or key[1] in days)
+            ]
+            for key in keys:
+                del self.__entries[key]
+
+    def invalidateAround(self, restaurantID, reservationTime):
+        # Removes the schedules which a reservation at the provided datetime could affect
+        # A reservation blocks start times up to 2 hours either side, which may be on another day
+        self.invalidate(restaurantID, [reservationTime + timedelta(days=offset) for offset in (-1, 0, 1)])
+
+    def getMetrics(self):
+        # Returns a snapshot of the cache's size and counters
+        with self.__lock:
+            metrics = dict(self.__metrics)
+            metrics["size"] = len(self.__entries)
+            metrics["maxEntries"] = self.__maxEntries
+            return metrics
+
+# This function converts a date or datetime into the date used as part of a cache key
+def toDay(date):
+    if isinstance(date, datetime):
+        return date.date()
+    return date
+
+# The cache is shared by the whole process, its size and TTL can be set in the environment
+availabilityCache = AvailabilityCache(
+    int(os.getenv("AVAILABILITY_CACHE_SIZE", 2000)),
+    float(os.getenv("AVAILABILITY_CACHE_TTL", 300))
+)
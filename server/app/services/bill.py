@@ -8,13 +8,16 @@ def retrieveBill(tableID):
     if connection[0] is not None:
         with connection[0] as connection:
             with connection.cursor() as cursor:
-                # Retrieve the bill for the given tableID
+                # Retrieve the bill for the given tableID, with a row for each item of each order
+                # Each item is priced at the price stored when it was ordered
                 sql = """
                 SELECT
                     FoodOrder.foodOrderID,
                     FoodOrder.price,
                     FoodOrder.timeOrdered,
-                    GROUP_CONCAT(CONCAT(MenuItem.name, ' - ', MenuItem.price) SEPARATOR ', ') AS menuItems
+                    MenuItem.name,
+                    COALESCE(OrderItem.unitPrice, MenuItem.price),
+                    OrderItem.quantity
                 FROM
                     FoodOrder
                 INNER JOIN
@@ -24,20 +27,26 @@ def retrieveBill(tableID):
                 WHERE
                     FoodOrder.tableID = %s
                     AND NOT FoodOrder.paid
-                GROUP BY
-                    FoodOrder.foodOrderID
-                ORDER BY FoodOrder.timeOrdered DESC;
+                ORDER BY FoodOrder.timeOrdered DESC, FoodOrder.foodOrderID;
                 """
                 cursor.execute(sql, (tableID,))
                 result = cursor.fetchall()
 
-                # Format the result into a list of dictionaries using list comprehension
-                orders = [{
-                    "foodOrderID": order[0],
-                    "price": order[1],
-                    "timeOrdered": order[2],
-                    "menuItems": order[3]
-                } for order in result]
+                # Group the items into orders, listing each unit separately as "name - price"
+                orders = []
+                for foodOrderID, price, timeOrdered, name, unitPrice, quantity in result:
+                    if len(orders) == 0 or orders[-1]["foodOrderID"] != foodOrderID:
+                        orders.append({
+                            "foodOrderID": foodOrderID,
+                            "price": price,
+                            "timeOrdered": timeOrdered,
+                            "menuItems": []
+                        })
+                    orders[-1]["menuItems"] += [f"{name} - {unitPrice}"] * quantity
+
+                # The items are returned as a single string, in the format produced by GROUP_CONCAT
+                for order in orders:
+                    order["menuItems"] = ", ".join(order["menuItems"])
 
                 return (orders, None)
     else:
@@ -0,0 +1,36 @@
+from services.email import queueEmails
+from services.email_outbox import emailWorker
+from services.db_connection import afterCommit
+from time import perf_counter
+
+# This function cancels several reservations at once and notifies each of the users
+# reservations is a list of (reservationID, emailAddress, body) tuples, where body is the
+# cancellation email sent to that user
+# Returns a tuple containing {"count", "seconds"} describing the cancellations or any error
+def cancelReservations(connection, cursor, reservations):
+    start = perf_counter()
+    if len(reservations) == 0:
+        return ({"count": 0, "seconds": 0.0}, None)
+
+    try:
+        # Delete every reservation with a single statement
+        placeholders = ", ".join(["%s"] * len(reservations))
+        sql = f"DELETE FROM Reservation WHERE reservationID IN ({placeholders});"
+        cursor.execute(sql, tuple(reservation[0] for reservation in reservations))
+        count = cursor.rowcount
+
+        # The emails are committed with the deletion, so either every reservation is cancelled
+        # and its user notified or nothing changes
+        queueEmails(cursor, [
+            (emailAddress, "Reservation Cancelled", body)
+            for reservationID, emailAddress, body in reservations
+        ])
+        connection.commit()
+    except Exception as e:
+        # An error occurred cancelling the reservations
+        connection.rollback()
+        return (None, f"An error occurred cancelling the reservations: {e}")
+
+    # The email worker sends all of the emails in batches over one connection
+    afterCommit(emailWorker.notify)
+    return ({"count": count, "seconds": round(perf_counter() - start, 3)}, None)
@@ -1,6 +1,5 @@
 from services.db_connection import connect
-from argon2 import PasswordHasher
-from argon2.exceptions import VerifyMismatchError
+from services.hashing import hashingPool
 
 # This function checks whether a provided email verification code is valid and not expired
 def checkVerificationCode(userID, verification_code):
@@ -25,32 +24,31 @@ def checkVerificationCode(userID, verification_code):
                 cursor.execute(sql, (userID,))
                 result = cursor.fetchall()
 
-                # Initialise a PasswordHasher object for verifying hashes
-                hasher = PasswordHasher()
-                
                 # We iterate through each valid stored code and check if it matches
                 for row in result:
                     code_hash = row[0]
-                    try:
-                        if hasher.verify(bytes(code_hash), str(verification_code)):
-                            # A matching code has been found, reset login attempts
-                            sql = """
-                            UPDATE User 
-                            SET loginAttempts = 0, verified = 1
-                            WHERE userID = %s;
-                            """
-                            try:
-                                cursor.execute(sql, (userID,))
-                                connection.commit()
-                            except Exception as e:
-                                # An error has occurred, revert changes
-                                connection.rollback()
-                                return (False, str(e))
-                            
-                            # Return with no error
-                            return (True, None)
-                    except VerifyMismatchError:
-                        continue
+                    # The hash is checked by the hashing pool's worker processes
+                    matched = hashingPool.verify("verificationCode", bytes(code_hash), str(verification_code))
+                    if matched[1] is not None:
+                        # The code could not be checked, which is not a failed attempt
+                        return (False, matched[1])
+                    if matched[0]:
+                        # A matching code has been found, reset login attempts
+                        sql = """
+                        UPDATE User 
+                        SET loginAttempts = 0, verified = 1
+                        WHERE userID = %s;
+                        """
+                        try:
+                            cursor.execute(sql, (userID,))
+                            connection.commit()
+                        except Exception as e:
+                            # An error has occurred, revert changes
+                            connection.rollback()
+                            return (False, str(e))
+                        
+                        # Return with no error
+                        return (True, None)
                     
                 # No matching code has been found, increment login attempts
                 sql = "UPDATE User SET loginAttempts = loginAttempts + 1 WHERE userID = %s;"
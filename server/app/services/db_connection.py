@@ -1,49 +1,429 @@
 from dotenv import load_dotenv
+from time import monotonic
+from contextvars import ContextVar
+import threading
+import weakref
 import os
 import mysql.connector
 
+# The .env file only needs to be read once per process
+environmentLoaded = False
+
 # This function retrieves the database password securely from the environment
 def getDbPassword():
+    global environmentLoaded
     # Initialise the environment variable from the .env file
-    load_dotenv()
-    
+    if not environmentLoaded:
+        load_dotenv()
+        environmentLoaded = True
+
     password, error = None, None
     try:
         password = os.getenv("DB_PASSWORD")
     except:
         # An error has occurred retrieving the password
         error = "An error occurred retrieving the database credentials"
-    
+
     # Returns a tuple containing the password or any caught error
     return password, error
 
-# This function attempts to create a connection with the database
-def connect():
-    # Initialise connection and error to be returned
-    connection, error = None, None
-    
-    # Attempt to retrieve database credentials
-    password = getDbPassword()
-    
-    # Check if any errors occurred. If they did, return the error message
-    if password[0] != None:
-        # Remove blank error message from password
-        password = password[0]
-        
-        # Connection process is nested in a try statement to catch any errors during connection
+# This function reads the connection pool settings from the environment, falling back to defaults
+def getPoolSettings():
+    return {
+        # Maximum number of open connections held by the process
+        "size": int(os.getenv("DB_POOL_SIZE", 10)),
+        # Seconds to wait for a free connection before giving up
+        "timeout": float(os.getenv("DB_POOL_TIMEOUT", 5)),
+        # Seconds after which a connection is closed and replaced, however healthy
+        "maxLifetime": float(os.getenv("DB_POOL_MAX_LIFETIME", 1800)),
+        # Seconds a connection may sit unused in the pool before it is closed
+        "idleTimeout": float(os.getenv("DB_POOL_IDLE_TIMEOUT", 300)),
+        # Connections idle for longer than this many seconds are pinged before being handed out
+        "pingAfter": float(os.getenv("DB_POOL_PING_AFTER", 5))
+    }
+
+# This class keeps a bounded set of open database connections which are reused between callers
+class ConnectionPool:
+    def __init__(self, connectionArguments, size, timeout, maxLifetime, idleTimeout, pingAfter):
+        self.__connectionArguments = connectionArguments
+        self.__size = size
+        self.__timeout = timeout
+        self.__maxLifetime = maxLifetime
+        self.__idleTimeout = idleTimeout
+        self.__pingAfter = pingAfter
+
+        # Idle connections are stored as [connection, timeCreated, timeLastUsed] records
+        # The most recently used connection is at the end of the list
+        self.__idle = []
+        # Number of connections currently open, whether idle or checked out
+        self.__open = 0
+        self.__condition = threading.Condition()
+
+        # Counters describing how the pool is being used
+        self.__metrics = {
+            "connectionsCreated": 0,
+            "connectionsClosed": 0,
+            "checkouts": 0,
+            "waits": 0,
+            "exhausted": 0,
+            "maxWaitSeconds": 0.0,
+            "healthCheckFailures": 0,
+            "idleEvictions": 0,
+            "lifetimeExpiries": 0
+        }
+
+    def getConnection(self):
+        # Returns a tuple containing a PooledConnection or any error
+        started = monotonic()
+        record, waited = None, False
+        with self.__condition:
+            while True:
+                self.__evictIdle()
+                if len(self.__idle) > 0:
+                    # Reuse the most recently returned connection
+                    record = self.__idle.pop()
+                    break
+                if self.__open < self.__size:
+                    # Reserve a slot, the connection itself is opened outside of the lock
+                    self.__open += 1
+                    break
+
+                # Every connection is checked out, so wait for one to be returned
+                remaining = self.__timeout - (monotonic() - started)
+                if remaining <= 0:
+                    self.__metrics["exhausted"] += 1
+                    return (None, "Database connection failed: the connection pool is exhausted")
+                if not waited:
+                    self.__metrics["waits"] += 1
+                    waited = True
+                self.__condition.wait(remaining)
+
+            self.__metrics["checkouts"] += 1
+            self.__metrics["maxWaitSeconds"] = max(self.__metrics["maxWaitSeconds"], monotonic() - started)
+
+        # Check that a reused connection is still usable, otherwise replace it
+        if record is not None and not self.__checkHealth(record):
+            record = None
+
+        if record is None:
+            try:
+                connection = mysql.connector.connect(**self.__connectionArguments)
+            except mysql.connector.Error as e:
+                # Give the reserved slot back so that another caller can use it
+                with self.__condition:
+                    self.__open -= 1
+                    self.__condition.notify()
+                return (None, f"Database connection failed: {e}")
+
+            with self.__condition:
+                self.__metrics["connectionsCreated"] += 1
+            now = monotonic()
+            record = [connection, now, now]
+
+        return (PooledConnection(self, record), None)
+
+    def release(self, record):
+        # Returns a checked out connection to the pool
+        connection = record[0]
+        reusable, metric = True, None
+        if monotonic() - record[1] >= self.__maxLifetime:
+            reusable, metric = False, "lifetimeExpiries"
+        else:
+            try:
+                # Discard any uncommitted work so the next caller starts from a clean transaction
+                if connection.in_transaction:
+                    connection.rollback()
+            except mysql.connector.Error:
+                reusable, metric = False, "healthCheckFailures"
+
+        with self.__condition:
+            if reusable:
+                record[2] = monotonic()
+                self.__idle.append(record)
+            else:
+                self.__open -= 1
+                self.__metrics[metric] += 1
+            self.__condition.notify()
+
+        if not reusable:
+            self.__close(connection)
+
+    def getMetrics(self):
+        # Returns a snapshot of the pool's current state and counters
+        with self.__condition:
+            metrics = dict(self.__metrics)
+            metrics["size"] = self.__size
+            metrics["open"] = self.__open
+            metrics["idle"] = len(self.__idle)
+            metrics["inUse"] = self.__open - len(self.__idle)
+            return metrics
+
+    def __checkHealth(self, record):
+        # Returns True if the connection can be handed out, closing it otherwise
+        # The caller replaces a closed connection in the same slot, so the slot stays reserved
+        connection, timeCreated, timeLastUsed = record
+        now = monotonic()
+        healthy = True
+        if now - timeCreated >= self.__maxLifetime:
+            healthy = False
+            metric = "lifetimeExpiries"
+        elif now - timeLastUsed >= self.__pingAfter:
+            # The connection has not been used recently, so check the server is still reachable
+            try:
+                healthy = connection.is_connected()
+            except mysql.connector.Error:
+                healthy = False
+            metric = "healthCheckFailures"
+
+        if not healthy:
+            with self.__condition:
+                self.__metrics[metric] += 1
+            self.__close(connection)
+        return healthy
+
+    def __evictIdle(self):
+        # Closes connections which have been idle for too long, must be called while holding the lock
+        now = monotonic()
+        expired = [record for record in self.__idle if now - record[2] >= self.__idleTimeout]
+        if len(expired) == 0:
+            return
+        self.__idle = [record for record in self.__idle if now - record[2] < self.__idleTimeout]
+        self.__open -= len(expired)
+        self.__metrics["idleEvictions"] += len(expired)
+        for record in expired:
+            self.__close(record[0])
+
+    def __close(self, connection):
+        # Closes a connection, ignoring any errors as it is being discarded anyway
         try:
-            connection = mysql.connector.connect(
-                host = "localhost",
-                user = "tablenest",
-                passwd = password,
-                database = "restaurant"
-            )
+            connection.close()
+        except Exception:
+            pass
+        with self.__condition:
+            self.__metrics["connectionsClosed"] += 1
+
+# This class wraps a connection checked out from the pool
+# Closing it, or leaving a "with" block, returns the connection to the pool instead of closing it
+class PooledConnection:
+    def __init__(self, pool, record):
+        self.__pool = pool
+        self.__record = record
+        # A connection which is never closed, e.g. by a model used outside of a request, is
+        # returned to the pool once the wrapper is garbage collected rather than holding its slot
+        self.__finalizer = weakref.finalize(self, pool.release, record)
+        self.__finalizer.atexit = False
+
+    def __getattr__(self, name):
+        # Any other attribute (cursor, commit, rollback...) is taken from the MySQL connection
+        if self.__record is None:
+            raise mysql.connector.errors.OperationalError("The connection has already been returned to the pool")
+        return getattr(self.__record[0], name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    def close(self):
+        # Return the connection to the pool, the finalizer makes sure this only happens once
+        if self.__record is not None:
+            self.__record = None
+            self.__finalizer()
+
+# This class holds the single database connection shared by everything run during one request
+# The connection is only checked out of the pool when it is first needed
+# Each caller of connect() starts from a savepoint, so a service which rolls back only discards
+# its own changes (and callbacks), as it did when every service committed separately
+class RequestSession:
+    def __init__(self):
+        self.__connection = None
+        # Functions to be run once the request's changes have been committed
+        self.__callbacks = []
+        # (number, callback count) of each savepoint which still exists, oldest first
+        self.__savepoints = []
+        self.__nextSavepoint = 1
+
+    def getConnection(self):
+        # Returns a tuple containing a SessionConnection or any error
+        if self.__connection is None:
+            connection = openPooledConnection()
+            if connection[0] is None:
+                return connection
+            self.__connection = connection[0]
+
+        savepoint = self.createSavepoint()
+        if savepoint[0] is None:
+            return savepoint
+        return (SessionConnection(self, self.__connection, savepoint[0]), None)
+
+    def createSavepoint(self):
+        # Returns a tuple containing the number of a new savepoint or any error
+        savepoint, self.__nextSavepoint = self.__nextSavepoint, self.__nextSavepoint + 1
+        try:
+            with self.__connection.cursor() as cursor:
+                cursor.execute(f"SAVEPOINT session_{savepoint};")
         except mysql.connector.Error as e:
-            # Error message is substituted into the string to be returned
-            error = f"Database connection failed: {e}"
-        
-        # Returns a tuple containing the connection object or any error
-        return connection, error
+            return (None, f"Database connection failed: {e}")
+        self.__savepoints.append((savepoint, len(self.__callbacks)))
+        return (savepoint, None)
+
+    def rollbackTo(self, savepoint):
+        # Discards the changes made since the savepoint, and the callbacks added since then
+        # A savepoint removed by rolling back to an older one is replaced by that older one
+        live = [entry for entry in self.__savepoints if entry[0] <= savepoint]
+        if len(live) > 0:
+            try:
+                with self.__connection.cursor() as cursor:
+                    cursor.execute(f"ROLLBACK TO SAVEPOINT session_{live[-1][0]};")
+                # Rolling back removes every later savepoint
+                self.__savepoints = live
+                del self.__callbacks[live[-1][1]:]
+                return
+            except mysql.connector.Error:
+                pass
+
+        # The savepoint no longer exists, e.g. the server rolled the whole transaction back after
+        # a deadlock, so nothing from before it is left to keep
+        self.__connection.rollback()
+        self.__savepoints = []
+        self.__callbacks = []
+
+    def commit(self):
+        # Commits all of the request's work, returning an error message if this fails
+        # Ending the transaction removes every savepoint
+        self.__savepoints = []
+        if self.__connection is not None:
+            try:
+                self.__connection.commit()
+            except mysql.connector.Error as e:
+                self.__connection.rollback()
+                self.__callbacks = []
+                return f"An error occurred saving changes to the database: {e}"
+
+        # The changes are now visible to other connections, so run any waiting callbacks
+        callbacks, self.__callbacks = self.__callbacks, []
+        for callback in callbacks:
+            callback()
+        return None
+
+    def addCallback(self, callback):
+        self.__callbacks.append(callback)
+
+    def close(self):
+        # Returns the connection to the pool, which discards anything left uncommitted
+        self.__callbacks = []
+        if self.__connection is not None:
+            connection, self.__connection = self.__connection, None
+            connection.close()
+
+# This class is handed to services and models while a request session is active
+# Commits are deferred until the end of the request, rolling back only undoes the caller's own
+# changes and closing it has no effect
+class SessionConnection:
+    def __init__(self, session, connection, savepoint):
+        self.__session = session
+        self.__connection = connection
+        self.__savepoint = savepoint
+
+    def __getattr__(self, name):
+        # Any other attribute (cursor, rollback...) is taken from the shared connection
+        return getattr(self.__connection, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        pass
+
+    def commit(self):
+        # The request session commits once all of the request's work is done. Until then, a later
+        # rollback by the caller only goes back to this point, as it would have after a real commit
+        savepoint = self.__session.createSavepoint()
+        if savepoint[0] is not None:
+            self.__savepoint = savepoint[0]
+
+    def rollback(self):
+        # Changes made before this connection was handed out belong to other callers, so are kept
+        self.__session.rollbackTo(self.__savepoint)
+
+    def close(self):
+        # The request session returns the connection to the pool at the end of the request
+        pass
+
+# The pool is created on the first call to connect() and shared by the whole process
+pool = None
+poolLock = threading.Lock()
+
+# The session for the request currently being handled, if there is one
+currentSession = ContextVar("currentSession", default=None)
+
+# This function checks a connection out of the pool, creating the pool if necessary
+def openPooledConnection():
+    global pool
+    if pool is None:
+        with poolLock:
+            if pool is None:
+                # Attempt to retrieve database credentials
+                password = getDbPassword()
+
+                # Check if any errors occurred. If they did, return the error message
+                if password[0] is None:
+                    return None, password[1]
+
+                settings = getPoolSettings()
+                pool = ConnectionPool({
+                    "host": "localhost",
+                    "user": "tablenest",
+                    "passwd": password[0],
+                    "database": "restaurant",
+                    # Buffered cursors read every row straight away, so a connection can always be
+                    # reset and reused even if a caller leaves rows unread
+                    "buffered": True
+                }, **settings)
+
+    # Returns a tuple containing the connection object or any error
+    return pool.getConnection()
+
+# This function attempts to create a connection with the database
+def connect():
+    # Inside a request every caller shares the request's connection
+    session = currentSession.get()
+    if session is not None:
+        return session.getConnection()
+
+    # Returns a tuple containing the connection object or any error
+    return openPooledConnection()
+
+# This function starts a new request session, called when a request is received
+def beginSession():
+    currentSession.set(RequestSession())
+
+# This function commits the current request session's work, returning any error message
+def commitSession():
+    session = currentSession.get()
+    if session is None:
+        return None
+    return session.commit()
+
+# This function ends the current request session, returning its connection to the pool
+def endSession():
+    session = currentSession.get()
+    if session is not None:
+        currentSession.set(None)
+        session.close()
+
+# This function runs a callback once the current changes have been committed
+# Outside of a request the caller has already committed, so it is run straight away
+def afterCommit(callback):
+    session = currentSession.get()
+    if session is None:
+        callback()
     else:
-        # Return error message
-        return None, password[1]
\ No newline at end of file
+        session.addCallback(callback)
+
+# This function returns the connection pool's counters, for example to check for pool exhaustion
+def getPoolMetrics():
+    if pool is None:
+        return None
+    return pool.getMetrics()
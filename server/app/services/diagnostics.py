@@ -0,0 +1,42 @@
+from services.availability_cache import availabilityCache
+from services.auth_cache import authCache
+from services.db_connection import getPoolMetrics
+from services.email_outbox import emailWorker
+from services.hashing import hashingPool
+from time import sleep
+import threading
+import logging
+import json
+import os
+
+# Seconds between each time the diagnostics are logged, 0 turns the logging off
+DIAGNOSTICS_LOG_SECONDS = float(os.getenv("DIAGNOSTICS_LOG_SECONDS", 300))
+
+logger = logging.getLogger(__name__)
+
+# This function collects the counters of the shared caches and pools, for example to check for
+# connection pool exhaustion, a low cache hit rate or slow password hashing
+def getDiagnostics():
+    return {
+        "connectionPool": getPoolMetrics(),
+        "availabilityCache": availabilityCache.getMetrics(),
+        "authCache": authCache.getMetrics(),
+        "hashing": hashingPool.getMetrics(),
+        "emailWorker": emailWorker.getMetrics()
+    }
+
+# This function logs the diagnostics every DIAGNOSTICS_LOG_SECONDS from a background thread
+def startDiagnosticsLogging():
+    if DIAGNOSTICS_LOG_SECONDS <= 0:
+        return
+    thread = threading.Thread(target=logDiagnostics, name="diagnostics", daemon=True)
+    thread.start()
+
+def logDiagnostics():
+    while True:
+        sleep(DIAGNOSTICS_LOG_SECONDS)
+        try:
+            logger.info("Diagnostics: %s", json.dumps(getDiagnostics()))
+        except Exception:
+            # Logging must keep running, whatever goes wrong collecting one snapshot
+            logger.exception("Error occurred while collecting the diagnostics")
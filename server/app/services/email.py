@@ -1,50 +1,40 @@
-from smtplib import SMTP, SMTPException
-from email.message import EmailMessage
-from dotenv import load_dotenv
-import os
+from services.db_connection import connect, afterCommit
+from services.email_outbox import emailWorker
 
-# This function sends an email from tableNest to the provided email address
+# This function queues an email from tableNest to the provided email address
+# The email is stored in the EmailOutbox table and sent by the background email worker, so the
+# request does not wait for the mail server. Inside a request it is only queued if the request's
+# changes are committed
 def sendEmail(emailAddress, subject, body):
-    # Retrieve email server password
-    password = getEmailPassword()
-    if password is None:
-        return (False, "An error occurred retrieving the email server password")
-    try:
-        print("Sending message!")
-        # Create a new message
-        msg = EmailMessage()
-        msg["From"] = "tableNest@outlook.com"
-        msg["To"] = emailAddress
-        msg["Subject"] = subject
-        msg.add_alternative(body, subtype="html")
-        
-        # Establish connection with SMTP server
-        server = SMTP("smtp.office365.com", 587)
-        server.starttls() # enables secure SSL connection
-        server.login("tableNest@outlook.com", password)
-        
-        # Send the message
-        server.send_message(msg)
-        
-        # Close server connection
-        server.quit()
-        
-        # Return success with no error message
-        return (True, None)
-    except SMTPException as e:
-        # Return error message
-        return (False, "Error occurred while sending email: "+str(e))
-    
-# This function retrieves the email server password securely from the environment
-def getEmailPassword():
-    # Initialise the environment variable from the .env file
-    load_dotenv()
-    
-    password = None
-    try:
-        password = os.getenv("EMAIL_PASSWORD")
-    except:
-        # An error has occurred retrieving the password
-        return None
-    
-    return password
\ No newline at end of file
+    # Attempt to connect to the database
+    connection = connect()
+
+    if connection[0] is not None:
+        with connection[0] as connection:
+            with connection.cursor() as cursor:
+                try:
+                    sql = "INSERT INTO EmailOutbox (emailAddress, subject, body) VALUES (%s, %s, %s);"
+                    cursor.execute(sql, (emailAddress, subject, body))
+                    connection.commit()
+                except Exception as e:
+                    # The failed insert has not changed anything, so the caller's changes are kept
+                    return (False, "Error occurred while queueing email: "+str(e))
+
+                # Wake the email worker rather than waiting for it to next check the outbox
+                afterCommit(emailWorker.notify)
+
+                # Return success with no error message
+                return (True, None)
+    else:
+        # An error has occurred, return the error message
+        return (False, connection[1])
+
+# This function queues several emails at once, taking a list of (emailAddress, subject, body)
+# tuples. The caller commits them along with its own changes, and should then call
+# afterCommit(emailWorker.notify) so that the email worker sends them straight away
+def queueEmails(cursor, emails):
+    if len(emails) == 0:
+        return
+    # executemany sends the rows as a single multi-row INSERT
+    sql = "INSERT INTO EmailOutbox (emailAddress, subject, body) VALUES (%s, %s, %s);"
+    cursor.executemany(sql, emails)
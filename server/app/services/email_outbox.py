@@ -0,0 +1,307 @@
+from services.db_connection import connect
+from smtplib import SMTP, SMTPException, SMTPRecipientsRefused, SMTPResponseException, SMTPServerDisconnected
+from email.message import EmailMessage
+from dotenv import load_dotenv
+import mysql.connector
+import threading
+import logging
+import random
+import os
+
+# The most emails a worker claims at once, they are all sent over one SMTP session
+BATCH_SIZE = 20
+# Seconds a worker waits before checking the outbox again when it is not woken by a new email
+POLL_SECONDS = 10
+# Emails which fail this many times are dead-lettered (kept with status 'dead' and not retried)
+MAX_ATTEMPTS = 8
+# Failed emails are retried after BACKOFF_BASE_SECONDS * 2^(attempts - 1) seconds, at most
+# BACKOFF_MAX_SECONDS, with some jitter so that a mail server outage does not cause a burst
+BACKOFF_BASE_SECONDS = 30
+BACKOFF_MAX_SECONDS = 3600
+# An email claimed for longer than this is assumed to belong to a worker which stopped, and is
+# claimed again. Emails are therefore sent at least once rather than exactly once
+CLAIM_TIMEOUT_SECONDS = 300
+
+logger = logging.getLogger(__name__)
+
+# This class sends the emails queued in the EmailOutbox table from a pool of background threads
+# Several workers (or processes) can run at once, as rows are claimed with SKIP LOCKED
+class EmailWorker:
+    def __init__(self):
+        self.__threads = []
+        self.__wake = threading.Event()
+        self.__lock = threading.Lock()
+
+        # Counters describing the work done since the process started
+        self.__metrics = {
+            "batches": 0,
+            "sent": 0,
+            "retried": 0,
+            "deadLettered": 0,
+            "smtpSessions": 0
+        }
+
+    def start(self, workerCount):
+        # Starts the worker threads, unless they have already been started
+        with self.__lock:
+            if len(self.__threads) > 0:
+                return
+            for i in range(workerCount):
+                thread = threading.Thread(target=self.__run, name=f"email-worker-{i}", daemon=True)
+                thread.start()
+                self.__threads.append(thread)
+
+    def notify(self):
+        # Wakes the workers, called once a new email has been committed to the outbox
+        self.__wake.set()
+
+    def getMetrics(self):
+        # Returns a snapshot of the worker's counters
+        with self.__lock:
+            metrics = dict(self.__metrics)
+            metrics["workers"] = len(self.__threads)
+            return metrics
+
+    def __count(self, name, amount=1):
+        with self.__lock:
+            self.__metrics[name] += amount
+
+    def __run(self):
+        # The SMTP session is kept open while there are emails to send and closed when idle
+        server = None
+        while True:
+            try:
+                # Clear the flag before claiming, so an email queued during the batch wakes it again
+                self.__wake.clear()
+                emails = claimEmails(BATCH_SIZE)
+                if emails[0] is None:
+                    logger.error("Error occurred while claiming emails: %s", emails[1])
+                    self.__wake.wait(POLL_SECONDS)
+                    continue
+
+                if len(emails[0]) == 0:
+                    server = closeSmtpSession(server)
+                    self.__wake.wait(POLL_SECONDS)
+                    continue
+
+                server, results = self.sendBatch(server, emails[0])
+                recordResults(emails[0], results)
+
+                dead = sum(1 for email, result in zip(emails[0], results) if isDead(result, email))
+                sent = sum(1 for result in results if result[0] is None)
+                self.__count("batches")
+                self.__count("sent", sent)
+                self.__count("deadLettered", dead)
+                self.__count("retried", len(results) - sent - dead)
+            except Exception as e:
+                # The worker must keep running, whatever goes wrong with one batch
+                logger.exception("Error occurred in the email worker")
+                server = closeSmtpSession(server)
+                self.__wake.wait(POLL_SECONDS)
+
+    def sendBatch(self, server, emails):
+        # Sends each claimed email, returning the SMTP session and an (error, permanent) tuple
+        # for each email, where error is None if it was sent
+        address = getEmailSettings()["address"]
+        results = []
+        for i, email in enumerate(emails):
+            for attempt in range(2):
+                if server is None:
+                    server = openSmtpSession()
+                    if server[0] is None:
+                        # The mail server cannot be reached, so none of the remaining emails can be sent
+                        error = server[1]
+                        server = None
+                        results += [(error, False)] * (len(emails) - i)
+                        return (None, results)
+                    server = server[0]
+                    self.__count("smtpSessions")
+
+                try:
+                    server.send_message(buildMessage(email, address))
+                    results.append((None, False))
+                    break
+                except SMTPServerDisconnected as e:
+                    # The server closed an idle session, reconnect and try once more
+                    server = None
+                    if attempt == 1:
+                        results.append((str(e), False))
+                except SMTPRecipientsRefused as e:
+                    # The address was rejected, which is only worth retrying for a temporary (4xx) error
+                    permanent = all(code >= 500 for code, _ in e.recipients.values())
+                    results.append((str(e), permanent))
+                    break
+                except SMTPResponseException as e:
+                    results.append((str(e), e.smtp_code >= 500))
+                    break
+                except (SMTPException, OSError) as e:
+                    # The session is in an unknown state, so a new one is used for the next email
+                    server = closeSmtpSession(server)
+                    results.append((str(e), False))
+                    break
+        return (server, results)
+
+# This function claims up to limit emails which are due to be sent
+# Returns a tuple containing a list of (emailID, emailAddress, subject, body, attempts) or any error
+def claimEmails(limit):
+    # Attempt to connect to the database
+    connection = connect()
+
+    if connection[0] is not None:
+        with connection[0] as connection:
+            with connection.cursor() as cursor:
+                try:
+                    # Rows locked by another worker's claim are skipped rather than waited for
+                    sql = """
+                    SELECT emailID, emailAddress, subject, body, attempts
+                    FROM EmailOutbox
+                    WHERE
+                        (status = 'pending' AND nextAttempt <= NOW())
+                        OR (status = 'sending' AND claimedAt <= NOW() - INTERVAL %s SECOND)
+                    ORDER BY emailID ASC
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED;
+                    """
+                    cursor.execute(sql, (CLAIM_TIMEOUT_SECONDS, limit))
+                    emails = cursor.fetchall()
+
+                    if len(emails) > 0:
+                        placeholders = ", ".join(["%s"] * len(emails))
+                        sql = f"UPDATE EmailOutbox SET status = 'sending', claimedAt = NOW() WHERE emailID IN ({placeholders});"
+                        cursor.execute(sql, tuple(email[0] for email in emails))
+                    connection.commit()
+                    return (emails, None)
+                except mysql.connector.Error as e:
+                    connection.rollback() # revert changes
+                    return (None, str(e))
+    else:
+        # An error has occurred, return the error message
+        return (None, connection[1])
+
+# This function stores the outcome of sending each claimed email
+def recordResults(emails, results):
+    sent = [email[0] for email, result in zip(emails, results) if result[0] is None]
+    failed = []
+    for email, result in zip(emails, results):
+        if result[0] is None:
+            continue
+        attempts = email[4] + 1
+        status = "dead" if isDead(result, email) else "pending"
+        failed.append((status, attempts, getBackoffSeconds(attempts), result[0], email[0]))
+
+    # Attempt to connect to the database
+    connection = connect()
+
+    if connection[0] is not None:
+        with connection[0] as connection:
+            with connection.cursor() as cursor:
+                try:
+                    if len(sent) > 0:
+                        # The body is cleared once sent, as it can contain verification codes
+                        placeholders = ", ".join(["%s"] * len(sent))
+                        sql = f"""
+                        UPDATE EmailOutbox
+                        SET status = 'sent', attempts = attempts + 1, sentAt = NOW(), claimedAt = NULL, body = '', lastError = NULL
+                        WHERE emailID IN ({placeholders});
+                        """
+                        cursor.execute(sql, tuple(sent))
+
+                    if len(failed) > 0:
+                        sql = """
+                        UPDATE EmailOutbox
+                        SET status = %s, attempts = %s, nextAttempt = NOW() + INTERVAL %s SECOND, claimedAt = NULL, lastError = %s
+                        WHERE emailID = %s;
+                        """
+                        cursor.executemany(sql, failed)
+                    connection.commit()
+                    return (True, None)
+                except mysql.connector.Error as e:
+                    connection.rollback() # revert changes
+                    # The emails stay claimed, and are sent again once the claim times out
+                    return (False, str(e))
+    else:
+        # An error has occurred, return the error message
+        return (False, connection[1])
+
+# This function decides whether a failed email should no longer be retried
+def isDead(result, email):
+    return result[0] is not None and (result[1] or email[4] + 1 >= MAX_ATTEMPTS)
+
+# This function returns the number of seconds to wait before retrying a failed email
+def getBackoffSeconds(attempts):
+    delay = min(BACKOFF_BASE_SECONDS * 2 ** (attempts - 1), BACKOFF_MAX_SECONDS)
+    return int(delay * random.uniform(0.8, 1.2))
+
+# This function creates the message for a claimed email
+def buildMessage(email, address):
+    msg = EmailMessage()
+    msg["From"] = address
+    msg["To"] = email[1]
+    msg["Subject"] = email[2]
+    msg.add_alternative(email[3], subtype="html")
+    return msg
+
+# This function connects and logs in to the SMTP server
+# Returns a tuple containing the SMTP session or any error
+def openSmtpSession():
+    settings = getEmailSettings()
+    password = getEmailPassword()
+    # Sending without logging in is only allowed when it has been asked for, e.g. for a local
+    # SMTP server used while testing, so that a missing password is not silently ignored
+    if not password and not settings["allowUnauthenticated"]:
+        return (None, "Error occurred while connecting to the email server: EMAIL_PASSWORD is not set")
+
+    server = None
+    try:
+        # Establish connection with SMTP server
+        server = SMTP(settings["host"], settings["port"], timeout=30)
+        if settings["starttls"]:
+            server.starttls() # enables secure SSL connection
+        if password:
+            server.login(settings["address"], password)
+        return (server, None)
+    except (SMTPException, OSError) as e:
+        closeSmtpSession(server)
+        return (None, "Error occurred while connecting to the email server: "+str(e))
+
+# This function closes an SMTP session, ignoring any error, and returns None
+def closeSmtpSession(server):
+    if server is not None:
+        try:
+            server.quit()
+        except (SMTPException, OSError):
+            server.close()
+    return None
+
+# This function retrieves the email server password securely from the environment
+def getEmailPassword():
+    # Initialise the environment variable from the .env file
+    load_dotenv()
+
+    password = None
+    try:
+        password = os.getenv("EMAIL_PASSWORD")
+    except:
+        # An error has occurred retrieving the password
+        return None
+
+    return password
+
+# This function retrieves the email server settings, which can be changed in the environment
+# (for example to send to a local SMTP server while testing)
+def getEmailSettings():
+    load_dotenv()
+    return {
+        "host": os.getenv("EMAIL_SMTP_HOST", "smtp.office365.com"),
+        "port": int(os.getenv("EMAIL_SMTP_PORT", 587)),
+        "address": os.getenv("EMAIL_ADDRESS", "tableNest@outlook.com"),
+        "starttls": os.getenv("EMAIL_STARTTLS", "1") != "0",
+        "allowUnauthenticated": os.getenv("EMAIL_ALLOW_UNAUTHENTICATED", "0") == "1"
+    }
+
+# This function starts the background email workers, the number of which can be set in the environment
+def startEmailWorker():
+    emailWorker.start(int(os.getenv("EMAIL_WORKERS", 2)))
+
+# The worker is shared by the whole process
+emailWorker = EmailWorker()
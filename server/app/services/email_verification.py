@@ -1,10 +1,7 @@
 from services.db_connection import connect
+from services.email import sendEmail
 from random import randint
-from argon2 import PasswordHasher
-from smtplib import SMTP, SMTPException
-from email.message import EmailMessage
-from dotenv import load_dotenv
-import os
+from services.hashing import hashingPool
 from datetime import datetime, timedelta
 
 # This function initiates the email verification process for a provided userID
@@ -30,9 +27,11 @@ def beginVerification(userID):
                 # Generate a random verification code
                 plaintextCode = generateCode()
                 
-                # Hash the generated code for storing in the database
-                hasher = PasswordHasher()
-                hashedCode = hasher.hash(plaintextCode)
+                # Hash the generated code for storing in the database, using the hashing pool
+                hashedCode = hashingPool.hash("verificationCode", plaintextCode)
+                if hashedCode[0] is None:
+                    return (False, hashedCode[1])
+                hashedCode = hashedCode[0]
                 
                 # Calculate the expiry time for the verification code
                 expiry = datetime.now() + timedelta(minutes=15)
@@ -65,52 +64,11 @@ def generateCode():
         code += str(randint(0, 9))
     return code
         
-# This function sends an email containing the provided code to the provided address
+# This function queues an email containing the provided code to the provided address
 def emailCode(code, email):
-    # Retrieve email server password
-    password = getEmailPassword()
-    if password is None:
-        return (False, "An error occurred retrieving the email server password")
-    
-    try:
-        # Create a new message
-        msg = EmailMessage()
-        msg["From"] = "tableNest@outlook.com"
-        msg["To"] = email # we assume this is already validated as it is stored in db
-        msg["Subject"] = "tableNest Verification Code"
-        msg.add_alternative("""
+    # The address is assumed to be valid as it is stored in the database
+    return sendEmail(email, "tableNest Verification Code", """
         This is your verfication code to sign in to tableNest.<br>
         <b>%s</b><br>
         If you did not request this, you do not need to take any action.
-        """ % (code), subtype="html")
-        
-        # Establish connection with SMTP server
-        server = SMTP("smtp.office365.com", 587)
-        server.starttls() # enables secure SSL connection
-        server.login("tableNest@outlook.com", password)
-        
-        # Send the message
-        server.send_message(msg)
-        
-        # Close server connection
-        server.quit()
-        
-        # Return success with no error message
-        return (True, None)
-    except SMTPException as e:
-        # Return error message
-        return (False, "Error occurred while sending email: "+str(e))
-    
-# This function retrieves the email server password securely from the environment
-def getEmailPassword():
-    # Initialise the environment variable from the .env file
-    load_dotenv()
-    
-    password = None
-    try:
-        password = os.getenv("EMAIL_PASSWORD")
-    except:
-        # An error has occurred retrieving the password
-        return None
-    
-    return password
\ No newline at end of file
+        """ % (code))
@@ -0,0 +1,120 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from argon2 import PasswordHasher
+from argon2.exceptions import VerificationError, InvalidHashError
+from bisect import bisect_left
+from time import perf_counter
+import multiprocessing
+import threading
+import os
+
+# Argon2 parameters used to hash each kind of secret, which can be changed in the environment,
+# e.g. ARGON2_TOKEN_MEMORY_COST. Authentication tokens last 7 days, so they use argon2-cffi's
+# defaults. Verification codes expire after 15 minutes, so a lower cost is enough
+ARGON2_DEFAULTS = {
+    "token": {"time_cost": 3, "memory_cost": 65536, "parallelism": 4},
+    "verificationCode": {"time_cost": 2, "memory_cost": 19456, "parallelism": 1}
+}
+# Upper bounds (in milliseconds) of the buckets of each operation's latency histogram
+LATENCY_BUCKETS = [1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+
+# This class runs Argon2 hashing and verification in a pool of worker processes, so that a burst
+# of sign-ins does not hold up the threads serving other requests
+# At most queueLimit operations can be waiting or running at once. Once the limit is reached a
+# caller waits up to queueTimeout seconds for space, and is then told the server is busy
+class HashingPool:
+    def __init__(self, workers, queueLimit, queueTimeout):
+        self.__workers = workers
+        self.__queueTimeout = queueTimeout
+        self.__slots = threading.BoundedSemaphore(queueLimit)
+        self.__executor = None
+        self.__lock = threading.Lock()
+
+        # operation -> count of operations in each latency bucket, the last is for slower operations
+        self.__histograms = {}
+        self.__rejected = 0
+
+    def hash(self, operation, secret):
+        # Returns a tuple containing the hash of the secret, using the operation's parameters, or any error
+        return self.__run(operation, hashSecret, getArgon2Parameters(operation), secret)
+
+    def verify(self, operation, secretHash, secret):
+        # Returns a tuple containing whether the secret matches the hash or any error
+        # The parameters used are the ones stored in the hash
+        return self.__run(operation, verifySecret, secretHash, secret)
+
+    def getMetrics(self):
+        # Returns the latency histogram of each operation and the number of rejected operations
+        with self.__lock:
+            return {
+                "buckets": LATENCY_BUCKETS + ["+Inf"],
+                "histograms": {operation: list(counts) for operation, counts in self.__histograms.items()},
+                "rejected": self.__rejected
+            }
+
+    def __run(self, operation, function, *args):
+        start = perf_counter()
+        # Wait for space in the queue, rather than letting it grow without limit
+        if not self.__slots.acquire(timeout=self.__queueTimeout):
+            with self.__lock:
+                self.__rejected += 1
+            return (None, "The server is busy, please try again")
+
+        try:
+            result = (self.__getExecutor().submit(function, *args).result(), None)
+        except BrokenProcessPool:
+            # A worker process has died, so a new pool is created for the next operation
+            with self.__lock:
+                self.__executor = None
+            result = (None, "An error occurred while checking the credentials")
+        except Exception:
+            # Anything else raised by the operation, e.g. an Argon2 or pickling error
+            result = (None, "An error occurred while checking the credentials")
+        finally:
+            self.__slots.release()
+
+        self.__record(operation, (perf_counter() - start) * 1000)
+        return result
+
+    def __getExecutor(self):
+        with self.__lock:
+            if self.__executor is None:
+                # Worker processes are started fresh rather than forked from this multi-threaded process
+                self.__executor = ProcessPoolExecutor(self.__workers, mp_context=multiprocessing.get_context("spawn"))
+            return self.__executor
+
+    def __record(self, operation, milliseconds):
+        with self.__lock:
+            counts = self.__histograms.setdefault(operation, [0] * (len(LATENCY_BUCKETS) + 1))
+            counts[bisect_left(LATENCY_BUCKETS, milliseconds)] += 1
+
+# This function hashes a secret with the provided Argon2 parameters, run in a worker process
+def hashSecret(parameters, secret):
+    return PasswordHasher(**parameters).hash(secret)
+
+# This function checks a secret against an Argon2 hash, run in a worker process
+def verifySecret(secretHash, secret):
+    try:
+        return PasswordHasher().verify(secretHash, secret)
+    except (VerificationError, InvalidHashError):
+        return False
+
+# This function retrieves the Argon2 parameters for an operation
+def getArgon2Parameters(operation):
+    parameters = {}
+    for name, default in ARGON2_DEFAULTS[operation].items():
+        variable = f"ARGON2_{toEnvironmentName(operation)}_{name.upper()}"
+        parameters[name] = int(os.getenv(variable, default))
+    return parameters
+
+# This function converts an operation's name into the form used in environment variables,
+# e.g. "verificationCode" into "VERIFICATION_CODE"
+def toEnvironmentName(operation):
+    return "".join("_" + char if char.isupper() else char.upper() for char in operation)
+
+# The pool is shared by the whole process, its size and queue limit can be set in the environment
+hashingPool = HashingPool(
+    int(os.getenv("HASHING_WORKERS", os.cpu_count() or 1)),
+    int(os.getenv("HASHING_QUEUE_LIMIT", 4 * (os.cpu_count() or 1))),
+    float(os.getenv("HASHING_QUEUE_TIMEOUT", 5))
+)
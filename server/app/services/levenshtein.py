@@ -0,0 +1,134 @@
+import numpy as np
+
+# This class scores one search term against many restaurant names at once.
+# Each lowercase character is given a small numeric code, and the names are stored as a padded
+# matrix of these codes with one contiguous array per character position.
+# calculateLevenshteinDistance in restaurant_search is the reference implementation.
+class EncodedNames:
+    def __init__(self, names=[]):
+        # Character code 0 is used as padding, so real characters start from 1
+        self.__alphabet = {}
+        self.__count = 0
+        self.__positions = np.zeros((0, max(len(names), 16)), dtype=np.uint32)
+        self.__lengths = np.zeros(self.__positions.shape[1], dtype=np.int32)
+        for name in names:
+            self.append(name)
+
+    def __len__(self):
+        return self.__count
+
+    def append(self, name):
+        # Adds a name to the end of the matrix, returning its index
+        if self.__count == self.__positions.shape[1]:
+            # Double the capacity of the matrix
+            self.__positions = np.pad(self.__positions, ((0, 0), (0, self.__count)))
+            self.__lengths = np.pad(self.__lengths, (0, self.__count))
+        self.__count += 1
+        self.set(self.__count - 1, name)
+        return self.__count - 1
+
+    def set(self, index, name):
+        # Replaces the name stored at the given index
+        codes = [self.__alphabet.setdefault(char, len(self.__alphabet) + 1) for char in name.lower()]
+        if len(codes) > self.__positions.shape[0]:
+            # The name is longer than any stored so far, so add more character positions
+            self.__positions = np.pad(self.__positions, ((0, len(codes) - self.__positions.shape[0]), (0, 0)))
+        self.__positions[:, index] = 0
+        self.__positions[:len(codes), index] = codes
+        self.__lengths[index] = len(codes)
+
+    def calculatePrefixDistances(self, searchTerm):
+        """
+        Returns an array of the Levenshtein distance between the search term and the first
+        len(searchTerm) characters of every stored name, in the order they were added.
+        """
+        # Characters which do not appear in any name are given a code which never matches
+        term = np.array([self.__alphabet.get(char, -1) for char in searchTerm.lower()], dtype=np.int64)
+        termLength = len(term)
+        count = self.__count
+
+        if termLength == 0:
+            # Every name is truncated to nothing, so they all match exactly
+            return np.zeros(count, dtype=np.int32)
+
+        # Longer names are only compared up to the length of the search term
+        truncatedLengths = np.minimum(self.__lengths[:count], termLength)
+
+        # A name with no characters is as far from the term as the term is long
+        distances = np.full(count, termLength, dtype=np.int32)
+
+        columns = [self.__positions[i, :count] for i in range(min(termLength, self.__positions.shape[0]))]
+        if termLength <= 64:
+            calculateBitParallel(term, len(self.__alphabet) + 1, columns, truncatedLengths, distances)
+        else:
+            calculateByRows(term, columns, truncatedLengths, distances)
+        return distances
+
+# This function uses Myers' bit-parallel algorithm, with each column of the Levenshtein matrix
+# for every name stored as bits in one 64-bit integer
+def calculateBitParallel(term, alphabetSize, columns, truncatedLengths, distances):
+    termLength = len(term)
+    count = len(distances)
+    one = np.uint64(1)
+    lastBit = np.uint64(1 << (termLength - 1))
+
+    # For each character code, store a mask of the positions it appears at in the term
+    masks = np.zeros(alphabetSize, dtype=np.uint64)
+    for position, code in enumerate(term):
+        if code > 0:
+            masks[code] |= np.uint64(1 << position)
+
+    # Bits which are set in plus (minus) mean the value increases (decreases) by 1 going down
+    # the column, with the score holding the value in the bottom row
+    plus = np.full(count, (1 << termLength) - 1, dtype=np.uint64)
+    minus = np.zeros(count, dtype=np.uint64)
+    scores = np.full(count, termLength, dtype=np.int32)
+
+    for i, column in enumerate(columns):
+        # Look up the position mask for this character of every name
+        equal = masks[column]
+
+        xVertical = equal | minus
+        xHorizontal = (((equal & plus) + plus) ^ plus) | equal
+        plusHorizontal = minus | ~(xHorizontal | plus)
+        minusHorizontal = plus & xHorizontal
+
+        # Update the bottom row value from the horizontal differences at the last bit
+        scores += ((plusHorizontal & lastBit) != 0)
+        scores -= ((minusHorizontal & lastBit) != 0)
+
+        # The top row of the matrix always increases by 1 for each character of the name
+        plusHorizontal = (plusHorizontal << one) | one
+        minusHorizontal = minusHorizontal << one
+        plus = minusHorizontal | ~(xVertical | plusHorizontal)
+        minus = plusHorizontal & xVertical
+
+        # Store the distance for every name which ends at this character
+        finished = truncatedLengths == i + 1
+        distances[finished] = scores[finished]
+
+# This function calculates the Levenshtein matrix one row at a time for every name,
+# which is used for search terms too long to fit in 64 bits
+def calculateByRows(term, columns, truncatedLengths, distances):
+    termLength = len(term)
+    count = len(distances)
+    offsets = np.arange(termLength + 1, dtype=np.int32)
+
+    # The first row of the Levenshtein matrix is the same for every name
+    previousRow = np.tile(offsets, (count, 1))
+    currentRow = np.empty_like(previousRow)
+    for i, column in enumerate(columns):
+        # Substitutions and insertions only depend on the previous row
+        different = (column[:, None] != term[None, :])
+        currentRow[:, 0] = i + 1
+        np.minimum(previousRow[:, :-1] + different, previousRow[:, 1:] + 1, out=currentRow[:, 1:])
+
+        # A deletion adds 1 per column moved, so the best value for column j is
+        # min(currentRow[k] + (j - k)) over every k <= j, which is a running minimum
+        currentRow = np.minimum.accumulate(currentRow - offsets, axis=1) + offsets
+
+        # Store the distance for every name which ends at this character
+        finished = truncatedLengths == i + 1
+        distances[finished] = currentRow[finished, termLength]
+
+        previousRow, currentRow = currentRow, previousRow
@@ -1,7 +1,16 @@
-from services.db_connection import connect
+from services.db_connection import connect, afterCommit
+from services.availability_cache import availabilityCache
+from functools import partial
 from services.authenticate import authenticate
 from services.email import sendEmail
-from datetime import datetime
+from datetime import datetime, timedelta
+from mysql.connector import errorcode
+import mysql.connector
+
+# A table is unavailable within this many seconds of one of its reservations
+RESERVATION_SECONDS = 7200
+# The number of times a booking is attempted if it deadlocks with another booking
+RESERVATION_ATTEMPTS = 3
 
 # This function places a reservation for a table at a restaurant
 def makeReservation(userID, authToken, restaurantID, date, time, persons):
@@ -37,25 +46,34 @@ def makeReservation(userID, authToken, restaurantID, date, time, persons):
     if connection[0] is not None:
         with connection[0] as connection:
             with connection.cursor() as cursor:
-                # Retrieve the most optimal table to place a booking at
-                tableID = getBestTableID(cursor, restaurantID, dateObject, persons)
-                
-                # Check if a tableID was found
-                if tableID is None:
-                    return (False, "No tables are available at the provided time")
+                # Concurrent bookings can deadlock on the locks taken, in which case MySQL rolls
+                # one of them back and it is tried again
+                for attempt in range(RESERVATION_ATTEMPTS):
+                    try:
+                        # Retrieve the most optimal table to place a booking at, and lock it
+                        tableID = reserveBestTable(cursor, restaurantID, dateObject, persons)
+                        
+                        # Check if a tableID was found
+                        if tableID is None:
+                            return (False, "No tables are available at the provided time")
+                        
+                        # A tableID was found, place a reservation
+                        sql = """
+                        INSERT INTO Reservation (restaurantID, tableID, userID, persons, datetime)
+                        VALUES (%s, %s, %s, %s, %s);
+                        """
+                        cursor.execute(sql, (restaurantID, tableID, userID, persons, dateObject))
+                        connection.commit()
+                        break
+                    except mysql.connector.Error as e:
+                        # An error has occurred while reserving, revert changes
+                        connection.rollback()
+                        retryable = e.errno in (errorcode.ER_LOCK_DEADLOCK, errorcode.ER_LOCK_WAIT_TIMEOUT)
+                        if not retryable or attempt == RESERVATION_ATTEMPTS - 1:
+                            return (False, str(e))
                 
-                # A tableID was found, place a reservation
-                sql = """
-                INSERT INTO Reservation (restaurantID, tableID, userID, persons, datetime)
-                VALUES (%s, %s, %s, %s, %s);
-                """
-                try:
-                    cursor.execute(sql, (restaurantID, tableID, userID, persons, dateObject))
-                    connection.commit()
-                except Exception as e:
-                    # An error has occurred while inserting, revert changes
-                    connection.rollback()
-                    return (False, str(e))
+                # The table is no longer available around this time
+                afterCommit(partial(availabilityCache.invalidateAround, restaurantID, dateObject))
                 
                 # Send confirmation email
                 sendConfirmationEmail(cursor, userID, restaurantID, date, time, persons)
@@ -66,8 +84,14 @@ def makeReservation(userID, authToken, restaurantID, date, time, persons):
         # An error has occurred, return the error message
         return (None, connection[1])
 
-# This function returns the optimal table to make a booking at (least capacity)
-def getBestTableID(cursor, restaurantID, dateObject, persons):
+# This function returns the optimal table to make a booking at (least capacity), which is
+# locked until the booking is committed so that no one else can reserve it at the same time
+def reserveBestTable(cursor, restaurantID, dateObject, persons):
+    # Tables reserved within 2 hours either side of the time are not available
+    windowStart = dateObject - timedelta(seconds=RESERVATION_SECONDS)
+    windowEnd = dateObject + timedelta(seconds=RESERVATION_SECONDS)
+    
+    # Find the tables which appear to be free, without taking any locks
     sql = """
     SELECT
     	tableID
@@ -80,18 +104,38 @@ def getBestTableID(cursor, restaurantID, dateObject, persons):
     		SELECT tableID FROM Reservation
     		WHERE
     			restaurantID = %s
-    			AND ABS(TIMESTAMPDIFF(SECOND, %s, datetime)) <= 7200	
+    			AND datetime >= %s AND datetime <= %s
     	)
-    ORDER BY capacity ASC;
+    ORDER BY capacity ASC, tableID ASC;
     """
-    cursor.execute(sql, (restaurantID, persons, restaurantID, dateObject))
-    result = cursor.fetchall()
-    if len(result) == 0:
-        # There are no tables available at the provided time
-        return None
-    else:
-        # Return the tableID from the first result
-        return result[0][0]
+    cursor.execute(sql, (restaurantID, persons, restaurantID, windowStart, windowEnd))
+    candidates = [row[0] for row in cursor.fetchall()]
+    
+    # Try each table in order of capacity. Tables are always locked in the same order, so two
+    # bookings cannot each wait for a table the other has locked
+    for tableID in candidates:
+        # Lock the table, waiting for any other booking holding it to commit or roll back
+        sql = "SELECT tableID FROM RestaurantTable WHERE tableID = %s FOR UPDATE;"
+        cursor.execute(sql, (tableID,))
+        if cursor.fetchone() is None:
+            # The table has been deleted
+            continue
+        
+        # A locking read sees every reservation committed before the lock was acquired,
+        # including one placed by a booking which held the lock first
+        sql = """
+        SELECT reservationID FROM Reservation
+        WHERE restaurantID = %s AND tableID = %s AND datetime >= %s AND datetime <= %s
+        LIMIT 1
+        LOCK IN SHARE MODE;
+        """
+        cursor.execute(sql, (restaurantID, tableID, windowStart, windowEnd))
+        if cursor.fetchone() is None:
+            # The table is free and stays locked until the reservation is committed
+            return tableID
+    
+    # There are no tables available at the provided time
+    return None
 
 # This function sends a confirmation email to confirm the reservation
 def sendConfirmationEmail(cursor, userID, restaurantID, date, time, persons):
@@ -1,101 +1,167 @@
 from geopy.distance import geodesic as gd
 from services.db_connection import connect
+from services.top_k import selectTopK, DEFAULT_LIMIT
+from services.spatial_index import spatialIndex, parseLocation
+from services.restaurant_details import getMultipleRestaurantDetails
+from services.get_image import getRestaurantImages
+from services.restaurant_id_cache import restaurantIDCache, CACHE_MAX_SIZE
+from random import Random
+
+# The extra information which may be returned alongside nearby restaurants
+INCLUDE_OPTIONS = ["details", "images"]
+# The number of random restaurants returned when no location is provided
+RANDOM_COUNT = 10
+# The primary key is probed at most this many times per random restaurant
+RANDOM_PROBE_ATTEMPTS = 5
 
 # This function returns an ordered list of restaurants near the provided location
-def getNearbyRestaurants(location):    
+def getNearbyRestaurants(location, limit=DEFAULT_LIMIT, offset=0, maxMiles=None, category=None):
+    # The index is built from the database the first time it is used
+    loaded = loadSpatialIndex()
+    if not loaded[0]:
+        # An error has occurred, return the error message
+        return (None, loaded[1])
+    
+    # The provided location must be a valid latitude and longitude
+    coordinates = parseLocation(f"{location[0]}, {location[1]}")
+    if coordinates is None:
+        return (None, "The provided location is invalid")
+    
+    # Only the restaurants which could be among the closest need exact distances calculated,
+    # and restaurants outside the radius or category are never considered
+    candidates = spatialIndex.getNearestCandidates(coordinates, offset + limit, maxMiles, category)
+    
+    # Return the requested page of the closest restaurantIDs with no error message
+    return (selectTopK(calculateDistances(coordinates, candidates, maxMiles), limit, offset), None)
+
+# This function builds the spatial index from the database if it has not been built yet
+def loadSpatialIndex():
+    if spatialIndex.loaded:
+        return (True, None)
+    
     # Attempt to connect to the database
     connection = connect()
     
     if connection[0] is not None:
         with connection[0] as connection:
             with connection.cursor() as cursor:
-                # Retrieve all restaurantID from database
-                sql = "SELECT restaurantID, location FROM Restaurant;"
+                # Retrieve every restaurant's location and category from database
+                sql = "SELECT restaurantID, location, category FROM Restaurant;"
                 cursor.execute(sql)
-                result = cursor.fetchall()
-                
-                # This dictionary is used to store the distance between each restaurant
-                # and the provided location
-                distances = {}
-                
-                for row in result:
-                    restaurantID = row[0]
-                    restaurantLocation = row[1]
-                    
-                    # Calculate distance in miles from given location to restaurant
-                    distance = gd(location, restaurantLocation).miles
-                    
-                    # Store in dictionary
-                    distances[restaurantID] = distance
-                    
-                # Reformat the dictionary into an array of tuples
-                distances = [(restaurantID, distance) for restaurantID, distance in distances.items()]
-                
-                # Return the sorted restaurantIDs with no error message
-                return (sortRestaurants(distances), None)
+                spatialIndex.load(cursor.fetchall())
+                return (True, None)
     else:
         # An error has occurred, return the error message
-        return (None, connection[1])
+        return (False, connection[1])
     
-# This function sorts a given list of restaurantIDs in ascending order of distance
-def sortRestaurants(distances):
-    # If the provided array is only of length 1 then it is already sorted
-    if len(distances) == 1:
-        return distances
+# This function reads the optional maxMiles, category and include parameters from a request's JSON data
+def getNearbyFilters(data):
+    # Returns a tuple containing (maxMiles, category, include) or any error
+    maxMiles, category, include = data.get("maxMiles"), data.get("category"), data.get("include", [])
     
-    # Recursively split the provided array and merge the halves together
-    midpoint = len(distances) // 2
-    left = sortRestaurants(distances[:midpoint])
-    right = sortRestaurants(distances[midpoint:])
+    if maxMiles is not None and (type(maxMiles) not in (int, float) or maxMiles <= 0):
+        return (None, "The provided maxMiles must be a positive number")
+    if category is not None and type(category) != str:
+        return (None, "The provided category must be a string")
     
-    return mergeRestaurants(left, right)
+    # include may be a comma separated string or a list, e.g. "details,images"
+    if type(include) == str:
+        include = [option.strip() for option in include.split(",") if option.strip() != ""]
+    if type(include) != list or any(option not in INCLUDE_OPTIONS for option in include):
+        return (None, f"The provided include must only contain {', '.join(INCLUDE_OPTIONS)}")
+    
+    return ((maxMiles, category, include), None)
 
-# This function merges together halves of ordered arrays
-def mergeRestaurants(left, right):
-    # An empty array is initialised for storing the sorted result
-    sortedRestaurants = []
-    
-    # Two pointers for iterating through each half
-    leftPointer, rightPointer = 0, 0
-    
-    while leftPointer < len(left) and rightPointer < len(right) and (leftPointer + rightPointer) < 10:
-        # Compare the distance from both halves
-        if left[leftPointer][1] <= right[rightPointer][1]:
-            sortedRestaurants.append(left[leftPointer])
-            leftPointer += 1
-        else:
-            sortedRestaurants.append(right[rightPointer])
-            rightPointer += 1
+# This function returns the requested extra information for each of the provided restaurants
+def getIncludedDetails(restaurantIDs, include):
+    # Returns a tuple containing a dictionary mapping each restaurantID to its information, or any error
+    output = {restaurantID: {} for restaurantID in restaurantIDs}
+    
+    if "details" in include:
+        # Every restaurant's details are retrieved with one query
+        details = getMultipleRestaurantDetails(restaurantIDs)
+        if details[0] is None:
+            # An error has occurred, return the error message
+            return (None, details[1])
+        for restaurantID, record in details[0].items():
+            output[restaurantID].update(record)
+    
+    if "images" in include:
+        for restaurantID in restaurantIDs:
+            output[restaurantID]["images"] = getRestaurantImages(restaurantID)
+    
+    return (output, None)
+
+# This function calculates the distance in miles from the given location to each restaurant
+def calculateDistances(location, restaurants, maxMiles=None):
+    # Yields (distance, restaurantID, (restaurantID, distance)) candidates one at a time,
+    # leaving out any restaurant further away than maxMiles
+    for restaurantID, restaurantLocation in restaurants:
+        distance = gd(location, restaurantLocation).miles
+        if maxMiles is None or distance <= maxMiles:
+            yield (distance, restaurantID, (restaurantID, distance))
+
+# This function returns at most 10 random restaurantIDs
+# Providing a seed makes the choice reproducible, as long as the restaurants do not change
+def getRandomRestaurants(seed=None):
+    generator = Random(seed)
+    
+    # Random restaurants are chosen from the cached restaurantIDs where possible
+    restaurantIDs, fresh = restaurantIDCache.get()
+    if not fresh:
+        # Attempt to connect to the database
+        connection = connect()
         
-    # Add any leftover elements to the sorted array
-    while leftPointer < len(left) and (leftPointer + rightPointer) < 10:
-        sortedRestaurants.append(left[leftPointer])
-        leftPointer += 1
+        if connection[0] is None:
+            # An error has occurred, return the error message
+            return (None, connection[1])
         
-    while rightPointer < len(right) and (leftPointer + rightPointer) < 10:
-        sortedRestaurants.append(right[rightPointer])
-        rightPointer += 1
-
-    return sortedRestaurants
+        with connection[0] as connection:
+            with connection.cursor() as cursor:
+                # Retrieve every restaurantID, stopping once there are too many to cache
+                sql = "SELECT restaurantID FROM Restaurant ORDER BY restaurantID LIMIT %s;"
+                cursor.execute(sql, (CACHE_MAX_SIZE + 1,))
+                restaurantIDCache.load([row[0] for row in cursor.fetchall()])
+        restaurantIDs, fresh = restaurantIDCache.get()
     
-# This function returns at most 10 random restaurantIDs
-def getRandomRestaurants(): 
+    if restaurantIDs is not None:
+        # Return a sample of the cached restaurantIDs with no error message
+        return (generator.sample(restaurantIDs, min(RANDOM_COUNT, len(restaurantIDs))), None)
+    
+    # There are too many restaurants to cache, so probe the primary key instead
+    return probeRandomRestaurants(generator)
+
+# This function chooses random restaurants by picking random restaurantIDs between the smallest
+# and largest, and taking the first restaurant at or after each one
+# Restaurants after a gap in the restaurantIDs are slightly more likely to be chosen
+def probeRandomRestaurants(generator):
     # Attempt to connect to the database
     connection = connect()
     
     if connection[0] is not None:
         with connection[0] as connection:
             with connection.cursor() as cursor:
-                # Retrieve 10 random restaurantIDs from database
-                sql = "SELECT restaurantID FROM Restaurant ORDER BY RAND() LIMIT 10;"
+                sql = "SELECT MIN(restaurantID), MAX(restaurantID) FROM Restaurant;"
                 cursor.execute(sql)
-                result = cursor.fetchall()
+                lowest, highest = cursor.fetchone()
+                
+                restaurants = []
+                if lowest is None:
+                    # There are no restaurants
+                    return (restaurants, None)
                 
-                # Store the restaurantIDs in an array
-                restaurants = [row[0] for row in result]
+                # Each probe uses the primary key index, so only reads a single row
+                sql = "SELECT restaurantID FROM Restaurant WHERE restaurantID >= %s ORDER BY restaurantID LIMIT 1;"
+                for _ in range(RANDOM_COUNT * RANDOM_PROBE_ATTEMPTS):
+                    cursor.execute(sql, (generator.randint(lowest, highest),))
+                    restaurantID = cursor.fetchone()[0]
+                    if restaurantID not in restaurants:
+                        restaurants.append(restaurantID)
+                    if len(restaurants) == RANDOM_COUNT:
+                        break
                 
                 # Return this array with no error message
                 return (restaurants, None)
     else:
         # An error has occurred, return the error message
-        return (None, connection[1])
\ No newline at end of file
+        return (None, connection[1])
@@ -40,9 +40,9 @@ def getOrderEta(foodOrderID):
                 model = LinearRegression().fit(x, y)
 
                 # Retrieve the number of items in the order
-                sql = "SELECT COUNT(*) FROM OrderItem WHERE foodOrderID = %s;"
+                sql = "SELECT COALESCE(SUM(quantity), 0) FROM OrderItem WHERE foodOrderID = %s;"
                 cursor.execute(sql, (foodOrderID,))
-                numItems = cursor.fetchone()[0]
+                numItems = int(cursor.fetchone()[0])
 
                 # Use the model to predict the time taken to fulfill the order
                 eta = model.predict(np.array([numItems]).reshape((-1, 1)))[0]
@@ -78,9 +78,9 @@ def getPastData(connection, cursor, restaurantID):
         foodOrderID = row[2]
 
         # Retrieve the number of items in the order
-        sql = "SELECT COUNT(*) FROM OrderItem WHERE foodOrderID = %s;"
+        sql = "SELECT COALESCE(SUM(quantity), 0) FROM OrderItem WHERE foodOrderID = %s;"
         cursor.execute(sql, (foodOrderID,))
-        numItems = cursor.fetchone()[0]
+        numItems = int(cursor.fetchone()[0])
 
         # Calculate the time taken to fulfill the order
         timeTaken = timeFulfilled - timeOrdered
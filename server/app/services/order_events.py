@@ -0,0 +1,82 @@
+from services.queue import getOrderQueueChanges
+from queue import Queue, Empty, Full
+import threading
+
+# Seconds between keep-alive messages sent to an idle stream, so proxies do not close it
+KEEPALIVE_SECONDS = 15
+# Events waiting to be handled by one stream. A stream reads every change since its version once it
+# handles an event, so only whether anything has changed matters
+SUBSCRIBER_QUEUE_SIZE = 1
+
+# This class passes order events from the requests which change orders to the order queue streams
+# of the same restaurant. Events are only published once the change has been committed
+class OrderEventBroker:
+    def __init__(self):
+        # restaurantID -> set of the subscribed streams' queues
+        self.__subscribers = {}
+        self.__lock = threading.Lock()
+
+    def subscribe(self, restaurantID):
+        # Returns a queue which receives every event published for the restaurant from now on
+        subscription = Queue(SUBSCRIBER_QUEUE_SIZE)
+        with self.__lock:
+            self.__subscribers.setdefault(restaurantID, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, restaurantID, subscription):
+        with self.__lock:
+            subscriptions = self.__subscribers.get(restaurantID)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if len(subscriptions) == 0:
+                    del self.__subscribers[restaurantID]
+
+    def publish(self, restaurantID, event):
+        # Sends an event (a dictionary with a "type") to every stream of the restaurant
+        with self.__lock:
+            subscriptions = list(self.__subscribers.get(restaurantID, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.put_nowait(event)
+            except Full:
+                # The stream has not handled its last event yet, and will read this change along with it
+                pass
+
+# This function generates the events of a restaurant's order queue stream
+# It yields (event, id, data) tuples: "changes" events contain the changes to the queue since the
+# client's version, as returned by getOrderQueueChanges, and have the new version as their id, so a
+# client can resume from it after reconnecting without missing any change. The first event replaces
+# the client's queue (reset is True) if the version is 0 or no longer in the change log
+# None is yielded when nothing has happened for KEEPALIVE_SECONDS
+# The database is only queried once an order has changed
+def streamOrderQueue(restaurantID, version=0):
+    # Subscribe before reading the changes, so that no change made in between is missed
+    subscription = orderEvents.subscribe(restaurantID)
+    try:
+        changed = True
+        while True:
+            if changed:
+                changes = getOrderQueueChanges(restaurantID, version)
+                if changes[0] is None:
+                    yield ("error", None, {"error": changes[1]})
+                    return
+                if changes[0]["reset"] or changes[0]["version"] != version:
+                    version = changes[0]["version"]
+                    yield ("changes", version, changes[0])
+                changed = False
+
+            try:
+                subscription.get(timeout=KEEPALIVE_SECONDS)
+            except Empty:
+                yield None
+                continue
+
+            # Every event already waiting is handled together, as one query reads all of the changes
+            while not subscription.empty():
+                subscription.get_nowait()
+            changed = True
+    finally:
+        orderEvents.unsubscribe(restaurantID, subscription)
+
+# The broker is shared by the whole process
+orderEvents = OrderEventBroker()
@@ -1,51 +1,184 @@
-from services.db_connection import connect
+from services.db_connection import connect, openPooledConnection
+import mysql.connector
+import logging
+
+# The most changes kept in each restaurant's change log. A client whose version is older than all
+# of them is sent the whole queue again
+CHANGE_LOG_SIZE = 1000
+
+logger = logging.getLogger(__name__)
 
 # This function retrieves unfulfilled orders after a provided foodOrderID
-def getUnfulfilledOrders(restaurantID, foodOrderID=0): # default value of 0 will return all unfulfilled orders
+# If a list of foodOrderIDs is provided, only those orders are retrieved
+def getUnfulfilledOrders(restaurantID, foodOrderID=0, foodOrderIDs=None): # default value of 0 will return all unfulfilled orders
+    if foodOrderIDs is not None and len(foodOrderIDs) == 0:
+        return ([], None)
+
     # Establish a database connection
     connection = connect()
     if connection[0] is not None:
         with connection[0] as connection:
-            cursor = connection.cursor()
-            # Retrieve unfulfilled orders after the provided foodOrderID
-            sql = """
-            SELECT foodOrderID, userID, restaurantID, tableID, price, timeOrdered, confirmed, customisation
-            FROM FoodOrder
-            WHERE restaurantID = %s AND foodOrderID > %s AND timeFulfilled IS NULL;
-            """
-            cursor.execute(sql, (restaurantID, foodOrderID))
-            result = cursor.fetchall()
-
-            # Format the result into a list of dictionaries using list comprehension
-            result = [{
-                "foodOrderID": order[0],
-                "userID": order[1],
-                "restaurantID": order[2],
-                "tableID": order[3],
-                "price": order[4],
-                "timeOrdered": order[5],
-                "confirmed": order[6] == 1, # converts 0/1 to False/True
-                "customisation": order[7]
-            } for order in result]
-
-            # Retrieve all of the OrderItems for each order
-            for order in result:
-                sql = """
-                SELECT MenuItem.name, MenuItem.section, MenuItem.price
-                FROM OrderItem INNER JOIN MenuItem
-                ON OrderItem.menuItemID = MenuItem.menuItemID
-                WHERE OrderItem.foodOrderID = %s;
+            with connection.cursor() as cursor:
+                # Retrieve unfulfilled orders after the provided foodOrderID along with all of their
+                # OrderItems in one query, each order's items are on consecutive rows
+                # The items are sorted too, so they are listed in the same order every time
+                filterSql, params = "", (restaurantID, foodOrderID)
+                if foodOrderIDs is not None:
+                    filterSql = f"AND FoodOrder.foodOrderID IN ({', '.join(['%s'] * len(foodOrderIDs))})"
+                    params += tuple(foodOrderIDs)
+                sql = f"""
+                SELECT
+                    FoodOrder.foodOrderID, FoodOrder.userID, FoodOrder.restaurantID, FoodOrder.tableID,
+                    FoodOrder.price, FoodOrder.timeOrdered, FoodOrder.confirmed, FoodOrder.customisation,
+                    MenuItem.name, MenuItem.section, COALESCE(OrderItem.unitPrice, MenuItem.price), OrderItem.quantity
+                FROM FoodOrder
+                LEFT JOIN (
+                    OrderItem INNER JOIN MenuItem ON OrderItem.menuItemID = MenuItem.menuItemID
+                ) ON OrderItem.foodOrderID = FoodOrder.foodOrderID
+                WHERE FoodOrder.restaurantID = %s AND FoodOrder.foodOrderID > %s AND FoodOrder.timeFulfilled IS NULL
+                {filterSql}
+                ORDER BY FoodOrder.foodOrderID, OrderItem.menuItemID, OrderItem.quantity;
                 """
-                cursor.execute(sql, (order["foodOrderID"],))
+                cursor.execute(sql, params)
+
+                # Group the rows into a list of dictionaries, one for each order
+                result = []
+                for row in cursor:
+                    if len(result) == 0 or result[-1]["foodOrderID"] != row[0]:
+                        result.append({
+                            "foodOrderID": row[0],
+                            "userID": row[1],
+                            "restaurantID": row[2],
+                            "tableID": row[3],
+                            "price": row[4],
+                            "timeOrdered": row[5],
+                            "confirmed": row[6] == 1, # converts 0/1 to False/True
+                            "customisation": row[7],
+                            "orderItems": []
+                        })
+
+                    # Orders without any items have a single row with no item
+                    if row[11] is None:
+                        continue
+
+                    # Each unit is listed separately, as the order queue expects
+                    result[-1]["orderItems"] += [{
+                        "name": row[8],
+                        "section": row[9],
+                        "price": row[10]
+                    } for _ in range(row[11])]
+
+                return (result, None)
+    else:
+        # An error occurred connecting to the database, return it
+        return (None, connection[1])
+
+# This function records a change to an order in the restaurant's change log, returning a tuple
+# containing whether it was recorded or any error
+# It is run once the change to the order has been committed, in its own short transaction, so the
+# restaurant is only locked while the change is logged. The lock makes the restaurant's changes
+# commit in the order of their changeIDs, otherwise a client could read a later change and never
+# see an earlier one which was committed after it
+def logOrderChange(restaurantID, foodOrderID, changeType):
+    # The request's connection has already been committed, so a separate one is used
+    connection = openPooledConnection()
+    if connection[0] is not None:
+        with connection[0] as connection:
+            with connection.cursor() as cursor:
+                try:
+                    sql = "SELECT restaurantID FROM Restaurant WHERE restaurantID = %s FOR UPDATE;"
+                    cursor.execute(sql, (restaurantID,))
+                    cursor.fetchall()
 
-                # Append the order items to the order dictionary using list comprehension
-                order["orderItems"] = [{
-                    "name": item[0],
-                    "section": item[1],
-                    "price": item[2]
-                } for item in cursor.fetchall()]
+                    sql = "INSERT INTO FoodOrderChange (foodOrderID, restaurantID, changeType) VALUES (%s, %s, %s);"
+                    cursor.execute(sql, (foodOrderID, restaurantID, changeType))
 
-            return (result, None)
+                    # Only the newest CHANGE_LOG_SIZE changes are kept
+                    sql = """
+                    SELECT changeID
+                    FROM FoodOrderChange
+                    WHERE restaurantID = %s
+                    ORDER BY changeID DESC
+                    LIMIT 1 OFFSET %s;
+                    """
+                    cursor.execute(sql, (restaurantID, CHANGE_LOG_SIZE))
+                    oldest = cursor.fetchone()
+                    if oldest is not None:
+                        sql = "DELETE FROM FoodOrderChange WHERE restaurantID = %s AND changeID <= %s;"
+                        cursor.execute(sql, (restaurantID, oldest[0]))
+
+                    connection.commit()
+                    return (True, None)
+                except mysql.connector.Error as e:
+                    connection.rollback() # revert changes
+                    # The order has already been changed, so clients only see the change once the queue is reloaded
+                    logger.error("Error occurred while logging a change to order %s: %s", foodOrderID, e)
+                    return (False, str(e))
+    else:
+        # An error occurred connecting to the database, return it
+        logger.error("Error occurred while logging a change to order %s: %s", foodOrderID, connection[1])
+        return (False, connection[1])
+
+# This function retrieves the changes to a restaurant's order queue since the provided version
+# (the last changeID the client has seen), returning a tuple containing the delta or any error
+# The delta contains the new version, the orders added to the queue and updated in it, and the
+# foodOrderIDs of orders which have left the queue (fulfilled or rejected)
+# A version of 0 returns the whole queue, as does a version which is no longer in the change log.
+# Either way reset is True, and the client should replace its queue with the inserted orders
+def getOrderQueueChanges(restaurantID, version=0):
+    # Establish a database connection
+    connection = connect()
+    if connection[0] is not None:
+        with connection[0] as connection:
+            with connection.cursor() as cursor:
+                if version != 0:
+                    # Check that the changes since the version have not been removed from the log
+                    sql = "SELECT changeID FROM FoodOrderChange WHERE changeID = %s AND restaurantID = %s;"
+                    cursor.execute(sql, (version, restaurantID))
+                    if cursor.fetchone() is None:
+                        version = 0
+
+                if version == 0:
+                    # The client has no queue yet, so only the latest version is needed
+                    sql = "SELECT COALESCE(MAX(changeID), 0) FROM FoodOrderChange WHERE restaurantID = %s;"
+                    cursor.execute(sql, (restaurantID,))
+                    changes = [(cursor.fetchone()[0], None, None)]
+                else:
+                    # Retrieve the changes made since the provided version
+                    sql = """
+                    SELECT changeID, foodOrderID, changeType
+                    FROM FoodOrderChange
+                    WHERE restaurantID = %s AND changeID > %s
+                    ORDER BY changeID;
+                    """
+                    cursor.execute(sql, (restaurantID, version))
+                    changes = cursor.fetchall()
     else:
         # An error occurred connecting to the database, return it
-        return (None, connection[1])
\ No newline at end of file
+        return (None, connection[1])
+
+    # The orders are read after the changes, so they are at least as new as the new version
+    newVersion = changes[-1][0] if len(changes) > 0 else version
+    if version == 0:
+        # Every unfulfilled order is new to the client
+        orders = getUnfulfilledOrders(restaurantID)
+        if orders[0] is None:
+            return orders
+        return ({"version": newVersion, "reset": True, "inserted": orders[0], "updated": [], "removed": []}, None)
+
+    # Only the orders which have changed are read. Those created since the version are inserted,
+    # the others still in the queue are updated, and any which are not in the queue have left it
+    inserted = set(foodOrderID for _, foodOrderID, changeType in changes if changeType == "insert")
+    changedIDs = list(dict.fromkeys(foodOrderID for _, foodOrderID, _ in changes))
+    orders = getUnfulfilledOrders(restaurantID, foodOrderIDs=changedIDs)
+    if orders[0] is None:
+        return orders
+
+    queued = set(order["foodOrderID"] for order in orders[0])
+    return ({
+        "version": newVersion,
+        "reset": False,
+        "inserted": [order for order in orders[0] if order["foodOrderID"] in inserted],
+        "updated": [order for order in orders[0] if order["foodOrderID"] not in inserted],
+        "removed": [foodOrderID for foodOrderID in changedIDs if foodOrderID not in queued]
+    }, None)
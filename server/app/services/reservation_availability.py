@@ -1,6 +1,13 @@
 from services.db_connection import connect
+from services.availability_cache import availabilityCache
+from bisect import bisect_left, bisect_right
 import datetime as dt
 
+# Reservations last 2 hours, so a table is unavailable within this many seconds of one
+RESERVATION_SECONDS = 7200
+# The largest number of days which availability can be requested for at once
+MAX_CALENDAR_DAYS = 31
+
 # This function returns a list of all available reservation start times
 def getAvailableReservations(restaurantID, date, persons):
     # Attempt to connect to the database
@@ -10,46 +17,17 @@ def getAvailableReservations(restaurantID, date, persons):
     if date < dt.datetime.combine(dt.datetime.now(), dt.datetime.min.time()):
         return (None, "The provided date is in the past")
     
+    # The number of persons may be provided as a string, e.g. "2"
+    persons = getPersons(persons)
+    if persons is None:
+        return (None, "The provided number of persons is invalid")
+    
     if connection[0] is not None:
         with connection[0] as connection:
             with connection.cursor() as cursor:
-                # Retrieve all opening periods on the selected date
-                openingPeriods = getOpeningPeriods(cursor, restaurantID, date)
-                availableStartTimes = []
-                
-                # Iterate through each OpeningPeriod
-                for period in openingPeriods:
-                    currentTime, closingTime = period
-                    
-                    # Check each 30 minute period up to 2 hours before closing
-                    closingTime -= dt.timedelta(hours=2)
-
-                    while currentTime <= closingTime:
-                        # Check availability at this time
-                        currentDatetime = dt.datetime.combine(date, dt.time(0,0)) + currentTime
-                        sql = """
-                        SELECT tableID FROM RestaurantTable
-                        WHERE restaurantID = %s
-                        AND capacity >= %s
-                        AND tableID NOT IN (
-                            SELECT tableID FROM Reservation
-                            WHERE
-                                restaurantID = %s
-                                AND ABS(TIMESTAMPDIFF(SECOND, %s, DATETIME)) < 7200
-                        );
-                        """
-                        cursor.execute(sql, (restaurantID, persons, restaurantID, currentDatetime))
-                        result = cursor.fetchall()
-                        
-                        if len(result) > 0:
-                            # This means there is availability in the selected period
-                            # Convert the start time to string format and add it
-                            currentTimeStr = (dt.datetime.min + currentTime).strftime("%H:%M")
-                            
-                            availableStartTimes.append(currentTimeStr)
-                        
-                        # Add 30 minutes and check next time slot
-                        currentTime += dt.timedelta(minutes=30)
+                # Retrieve the opening periods, tables and reservations for the day at once
+                schedule = getDaySchedules(cursor, restaurantID, [date])[date]
+                availableStartTimes = schedule.getAvailableTimes(persons)
                 
                 # Remove any times which are in the past if the reservation is for today
                 if date == dt.datetime.combine(dt.datetime.now(), dt.datetime.min.time()):
@@ -59,26 +37,195 @@ def getAvailableReservations(restaurantID, date, persons):
     else:
         # An error has occurred, return the error message
         return (None, connection[1])
+
+# This function returns the available reservation start times for each day in a date range
+def getAvailabilityCalendar(restaurantID, startDate, days, persons):
+    # Check that the dates are in the future
+    today = dt.datetime.combine(dt.datetime.now(), dt.datetime.min.time())
+    if startDate < today:
+        return (None, "The provided date is in the past")
+    
+    if type(days) != int or days < 1 or days > MAX_CALENDAR_DAYS:
+        return (None, f"The number of days must be between 1 and {MAX_CALENDAR_DAYS}")
+    
+    # The number of persons may be provided as a string, e.g. "2"
+    persons = getPersons(persons)
+    if persons is None:
+        return (None, "The provided number of persons is invalid")
+    
+    # Attempt to connect to the database
+    connection = connect()
     
-# This function retrieves all stored OpeningPeriods for a restaurant
-def getOpeningPeriods(cursor, restaurantID, date):
-    # Prepare an empty array for storing these opening periods
-    openingPeriods = []
+    if connection[0] is not None:
+        with connection[0] as connection:
+            with connection.cursor() as cursor:
+                # Retrieve the opening periods, tables and reservations for every day at once
+                dates = [startDate + dt.timedelta(days=i) for i in range(days)]
+                schedules = getDaySchedules(cursor, restaurantID, dates)
+                
+                # Store the available times for each day, with "YYYY-MM-DD" as the key
+                calendar = {}
+                for date in dates:
+                    availableStartTimes = schedules[date].getAvailableTimes(persons)
+                    if date == today:
+                        # Remove any times which are in the past
+                        availableStartTimes = removePastTimes(availableStartTimes)
+                    calendar[date.strftime("%Y-%m-%d")] = availableStartTimes
+                
+                return (calendar, None)
+    else:
+        # An error has occurred, return the error message
+        return (None, connection[1])
+
+# This function converts the provided number of persons to an integer, returning None if invalid
+def getPersons(persons):
+    if type(persons) == bool:
+        return None
+    try:
+        return int(persons)
+    except (TypeError, ValueError):
+        return None
+
+# This class stores which tables are reserved at each possible start time on one day
+class DaySchedule:
+    def __init__(self, date, openingPeriods, tables):
+        # openingPeriods is a [(openingTime, closingTime)] list of timedeltas
+        # tables is a [(tableID, capacity)] list
+        midnight = dt.datetime.combine(date, dt.time(0, 0))
+        
+        # Start times are every 30 minutes during each opening period, up to 2 hours before closing
+        self.slots = []
+        for currentTime, closingTime in openingPeriods:
+            closingTime -= dt.timedelta(hours=2)
+            while currentTime <= closingTime:
+                self.slots.append(currentTime)
+                currentTime += dt.timedelta(minutes=30)
+        
+        # Each distinct start time is given a bit, in time order
+        self.__startTimes = sorted(set(midnight + slot for slot in self.slots))
+        self.__bits = [bisect_left(self.__startTimes, midnight + slot) for slot in self.slots]
+        
+        # Each table stores a bitmap of the start times at which it is reserved
+        self.__capacities = {tableID: capacity for tableID, capacity in tables}
+        self.__occupied = {tableID: 0 for tableID, _ in tables}
+    
+    def addReservations(self, reservations):
+        # Marks the tables in the [(tableID, datetime)] list as reserved around each datetime
+        window = dt.timedelta(seconds=RESERVATION_SECONDS)
+        for tableID, reservationTime in reservations:
+            if tableID not in self.__occupied:
+                continue
+            # A reservation blocks every start time less than 2 hours away from it
+            first = bisect_right(self.__startTimes, reservationTime - window)
+            last = bisect_left(self.__startTimes, reservationTime + window)
+            if last > first:
+                self.__occupied[tableID] |= ((1 << (last - first)) - 1) << first
+    
+    def getWindow(self):
+        # Returns the (start, end) datetimes between which reservations affect this day,
+        # or None if the restaurant is closed
+        if len(self.__startTimes) == 0:
+            return None
+        window = dt.timedelta(seconds=RESERVATION_SECONDS)
+        return (self.__startTimes[0] - window, self.__startTimes[-1] + window)
+    
+    def getAvailableTimes(self, persons):
+        # Returns the "HH:MM" start times at which a table for the number of persons is free
+        allTimes = (1 << len(self.__startTimes)) - 1
+        available = 0
+        for tableID, occupied in self.__occupied.items():
+            if self.__capacities[tableID] >= persons:
+                available |= allTimes & ~occupied
+        
+        # Convert the start times to string format, in the order of the opening periods
+        return [
+            (dt.datetime.min + slot).strftime("%H:%M")
+            for slot, bit in zip(self.slots, self.__bits)
+            if available >> bit & 1
+        ]
+
+# This function returns a dictionary mapping each of the provided dates to its DaySchedule,
+# using the availability cache where possible
+def getDaySchedules(cursor, restaurantID, dates):
+    # The version is read first, so that schedules built while the restaurant changes are not stored
+    version = availabilityCache.getVersion(restaurantID)
+    
+    schedules, missing = {}, []
+    for date in dates:
+        schedule = availabilityCache.get(restaurantID, date)
+        if schedule is None:
+            missing.append(date)
+        else:
+            schedules[date] = schedule
+    
+    if len(missing) > 0:
+        # Every date which is not cached is built at once
+        for date, schedule in buildDaySchedules(cursor, restaurantID, missing).items():
+            availabilityCache.set(restaurantID, date, schedule, version)
+            schedules[date] = schedule
+    return schedules
+
+# This function retrieves everything needed to find the available start times on each of the
+# provided dates, returning a dictionary mapping each date to its DaySchedule
+def buildDaySchedules(cursor, restaurantID, dates):
+    # Retrieve every opening period and every table once for all of the dates
+    weeklyOpeningPeriods = getWeeklyOpeningPeriods(cursor, restaurantID)
+    tables = getTables(cursor, restaurantID)
+    
+    schedules = {}
+    for date in dates:
+        # Convert the date to a day as a number (1=Monday)
+        openingPeriods = weeklyOpeningPeriods.get(date.weekday() + 1, [])
+        schedules[date] = DaySchedule(date, openingPeriods, tables)
+    
+    # Only reservations which could block one of the start times are needed
+    windows = [schedule.getWindow() for schedule in schedules.values()]
+    windows = [window for window in windows if window is not None]
+    if len(windows) == 0:
+        # The restaurant is closed on every date
+        return schedules
+    
+    sql = """
+    SELECT tableID, datetime FROM Reservation
+    WHERE restaurantID = %s AND datetime > %s AND datetime < %s
+    ORDER BY datetime;
+    """
+    cursor.execute(sql, (restaurantID, min(window[0] for window in windows), max(window[1] for window in windows)))
+    reservations = cursor.fetchall()
+    reservationTimes = [reservation[1] for reservation in reservations]
+    
+    # Each day is only given the reservations inside its own window
+    for schedule in schedules.values():
+        window = schedule.getWindow()
+        if window is not None:
+            first = bisect_right(reservationTimes, window[0])
+            last = bisect_left(reservationTimes, window[1])
+            schedule.addReservations(reservations[first:last])
+    return schedules
+
+# This function retrieves the tableID and capacity of every table in a restaurant
+def getTables(cursor, restaurantID):
+    sql = "SELECT tableID, capacity FROM RestaurantTable WHERE restaurantID = %s;"
+    cursor.execute(sql, (restaurantID,))
+    return [(row[0], row[1]) for row in cursor.fetchall()]
     
-    # Convert the date to a day as a number (1=Monday)
-    dayOfWeek = date.weekday() + 1
+# This function retrieves all stored OpeningPeriods for a restaurant, as a dictionary mapping
+# each day of the week (1=Monday) to a list of (openingTime, closingTime) tuples
+def getWeeklyOpeningPeriods(cursor, restaurantID):
+    # Prepare an empty dictionary for storing these opening periods
+    openingPeriods = {}
     
     # Retrieve OpeningPeriods
     sql = """
-    SELECT openingTime, closingTime FROM OpeningPeriod
-    WHERE restaurantID = %s AND dayOfWeek = %s;
+    SELECT dayOfWeek, openingTime, closingTime FROM OpeningPeriod
+    WHERE restaurantID = %s;
     """
-    cursor.execute(sql, (restaurantID, dayOfWeek))
+    cursor.execute(sql, (restaurantID,))
     result = cursor.fetchall()
     
-    # Iterate through each OpeningPeriod and append it to openingPeriods
+    # Iterate through each OpeningPeriod and append it to its day's list
     for period in result:
-        openingPeriods.append((period[0], period[1]))
+        openingPeriods.setdefault(period[0], []).append((period[1], period[2]))
     
     return openingPeriods
 
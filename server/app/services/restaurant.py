@@ -1,6 +1,8 @@
-from datetime import datetime, timedelta
-from services.db_connection import connect
-from services.email import sendEmail
+from datetime import datetime
+from services.db_connection import connect, afterCommit
+from services.availability_cache import availabilityCache
+from functools import partial
+from services.cancel_reservations import cancelReservations
 
 # This function allows all of a restaurant's tables to be retrieved
 def getTables(restaurantID):
@@ -44,34 +46,64 @@ def setOpeningPeriods(restaurantID, openingPeriods):
     if connection[0] is not None:
         with connection[0] as connection:
             with connection.cursor() as cursor:
-                # Delete all of the restaurant's existing opening periods
-                sql = "DELETE FROM OpeningPeriod WHERE restaurantID = %s;"
+                # Nothing needs to change if the provided opening periods are the ones already stored
+                newPeriods = {
+                    int(day): (toSeconds(value["openingTime"]), toSeconds(value["closingTime"]))
+                    for day, value in openingPeriods.items()
+                }
+                sql = "SELECT dayOfWeek, openingTime, closingTime FROM OpeningPeriod WHERE restaurantID = %s;"
+                cursor.execute(sql, (restaurantID,))
+                storedPeriods = {
+                    dayOfWeek: (int(openingTime.total_seconds()), int(closingTime.total_seconds()))
+                    for dayOfWeek, openingTime, closingTime in cursor.fetchall()
+                }
+                if newPeriods == storedPeriods:
+                    return ({"count": 0, "seconds": 0.0}, None)
+
+                # Replace the restaurant's opening periods in a single transaction, so that the
+                # restaurant is never left with only some of its opening periods
                 try:
+                    sql = "DELETE FROM OpeningPeriod WHERE restaurantID = %s;"
                     cursor.execute(sql, (restaurantID,))
+
+                    # executemany sends the rows as a single multi-row INSERT
+                    sql = """INSERT INTO OpeningPeriod (restaurantID, dayOfWeek, openingTime, closingTime)
+                    VALUES (%s, %s, %s, %s);"""
+                    cursor.executemany(sql, [
+                        (restaurantID, int(day), value["openingTime"], value["closingTime"])
+                        for day, value in openingPeriods.items()
+                    ])
+                except Exception as e:
+                    # An error occurred replacing the opening periods
+                    connection.rollback()
+                    return (False, f"An error occurred replacing the opening periods: {e}")
+
+                # Cancel any reservations which are now outside of the opening hours, then commit
+                # the new opening periods along with the cancellations
+                cancellations = deleteInvalidReservations(restaurantID, connection, cursor)
+                if cancellations[0] is None:
+                    return (False, cancellations[1])
+                try:
                     connection.commit()
                 except Exception as e:
-                    # An error occurred deleting the opening periods
-                    return (False, f"An error occurred deleting the current opening periods: {e}")
-
-                # Insert the provided opening periods into the database
-                sql = """INSERT INTO OpeningPeriod (restaurantID, dayOfWeek, openingTime, closingTime)
-                VALUES (%s, %s, %s, %s);"""
-                for day, value in openingPeriods.items():
-                    openingTime = value["openingTime"]
-                    closingTime = value["closingTime"]
-                    try:
-                        cursor.execute(sql, (restaurantID, int(day), openingTime, closingTime))
-                        connection.commit()
-                    except Exception as e:
-                        # An error occurred inserting the opening period
-                        return (False, f"An error occurred inserting the opening period: {e}")
-
-                # Return no error
-                deleteInvalidReservations(restaurantID, connection, cursor)
-                return (True, None)
+                    # An error occurred saving the opening periods
+                    connection.rollback()
+                    return (False, f"An error occurred saving the opening periods: {e}")
+                
+                # Every stored availability for the restaurant is now out of date
+                afterCommit(partial(availabilityCache.invalidate, restaurantID))
+
+                # Return how many reservations were cancelled, with no error
+                return (cancellations[0], None)
     else:
         # An error occurred connecting to the database
         return (False, connection[1])
+
+# This function converts a time in the format "HH:MM" into a number of seconds since midnight
+def toSeconds(time):
+    time = datetime.strptime(time, "%H:%M")
+    return time.hour * 3600 + time.minute * 60
+
 def validateOpeningPeriods(openingPeriods):
     # Ensure that the opening periods are provided in the correct format
     if type(openingPeriods) is not dict:
@@ -112,62 +144,31 @@ def validateOpeningPeriods(openingPeriods):
     return True
 
 def deleteInvalidReservations(restaurantID, connection, cursor):
-    # This function deletes any stored reservations which are placed outside of the restaurant's opening hours
-    # Retrieve the restaurant's opening periods
-    sql = "SELECT dayOfWeek, openingTime, closingTime FROM OpeningPeriod WHERE restaurantID = %s;"
-    cursor.execute(sql, (restaurantID,))
-    result = cursor.fetchall()
-
-    # Format the opening periods into a dictionary
-    openingPeriods = {}
-    for row in result:
-        dayOfWeek, openingTime, closingTime = row
-        openingPeriods[dayOfWeek] = {
-            "openingTime": openingTime,
-            "closingTime": closingTime
-        }
-    for day in range(1, 8):
-        if day not in openingPeriods:
-            # The restaurant is not open on the day, so store the opening and closing times as None
-            openingPeriods[day] = {
-                "openingTime": None,
-                "closingTime": None
-            }
-
-    # Retrieve all of the restaurant's reservations
+    # This function deletes any future reservations which are placed outside of the restaurant's opening hours
+    # Reservations in the past are never changed, so only those from now onwards are read, using the
+    # (restaurantID, datetime) index. A reservation is invalid if the restaurant is closed on its day
+    # of the week (WEEKDAY is 0 for Monday, dayOfWeek is 1), or it is before opening time or within
+    # 1 hour of closing time, which accounts for the time taken to fulfill the order
     sql = """
-    SELECT 
-    Reservation.reservationID, Reservation.datetime, User.email 
-    FROM Reservation INNER JOIN User
-    ON Reservation.userID = User.userID
-    WHERE restaurantID = %s;
+    SELECT
+    Reservation.reservationID, User.email
+    FROM Reservation
+    INNER JOIN User ON Reservation.userID = User.userID
+    LEFT JOIN OpeningPeriod ON OpeningPeriod.restaurantID = Reservation.restaurantID
+    AND OpeningPeriod.dayOfWeek = WEEKDAY(Reservation.datetime) + 1
+    WHERE Reservation.restaurantID = %s AND Reservation.datetime >= NOW()
+    AND (
+        OpeningPeriod.dayOfWeek IS NULL
+        OR TIME(Reservation.datetime) < OpeningPeriod.openingTime
+        OR TIME(Reservation.datetime) >= SUBTIME(OpeningPeriod.closingTime, '01:00:00')
+    );
     """
     cursor.execute(sql, (restaurantID,))
     result = cursor.fetchall()
-    # Iterate through each reservation and delete it if it is outside of the restaurant's opening hours
-    for row in result:
-        reservationID, rdatetime, userEmail = row
-        dayOfWeek = (rdatetime.weekday()) + 1 # avoids 0 based indexing
-        openingTime = openingPeriods[dayOfWeek]["openingTime"]
-        # Subtract 1 hour from the closing time to account for the time taken to fulfill the order
-        try:
-            closingTime = openingPeriods[dayOfWeek]["closingTime"] - timedelta(hours=1)
-        except:
-            openingTime = "00:00:01"
-            closingTime = "00:00:01"
-
-        # Convert opening and closing time timedelta objects to time objects
-        openingTime = datetime.strptime(str(openingTime), "%H:%M:%S").time()
-        closingTime = datetime.strptime(str(closingTime), "%H:%M:%S").time()
-
-        # Delete the reservation if it is outside of the restaurant's opening hours
-        if rdatetime.time() < openingTime or rdatetime.time() >= closingTime:
-            sql = "DELETE FROM Reservation WHERE reservationID = %s;"
-            cursor.execute(sql, (reservationID,))
-            connection.commit()
-
-            # Send cancellation email
-            sendEmail(userEmail, "Reservation Cancelled",
-            """
-            Sorry, your reservation has been cancelled as it is outside of the restaurant's opening hours.
-            """)
\ No newline at end of file
+
+    # Delete the reservations and notify their users together
+    invalidReservations = [(reservationID, userEmail,
+    """
+    Sorry, your reservation has been cancelled as it is outside of the restaurant's opening hours.
+    """) for reservationID, userEmail in result]
+    return cancelReservations(connection, cursor, invalidReservations)
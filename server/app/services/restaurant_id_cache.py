@@ -0,0 +1,49 @@
+from bisect import bisect_left, insort
+from time import monotonic
+import threading
+
+# Seconds the cached restaurantIDs are used for before being read from the database again
+CACHE_TTL = 300
+# Tables with more restaurants than this are not cached, random restaurants are found by
+# probing the primary key instead
+CACHE_MAX_SIZE = 100000
+
+# This class stores every restaurantID in memory so that random restaurants can be chosen
+# without sorting the whole Restaurant table
+class RestaurantIDCache:
+    def __init__(self):
+        self.__ids = [] # sorted, so that seeded samples are reproducible
+        self.__tooLarge = False
+        self.__loadedAt = None
+        self.__lock = threading.Lock()
+
+    def get(self):
+        # Returns a tuple containing the sorted restaurantIDs (or None if the table is too large
+        # to cache) and whether the cache is still fresh
+        with self.__lock:
+            fresh = self.__loadedAt is not None and monotonic() - self.__loadedAt < CACHE_TTL
+            if self.__tooLarge:
+                return (None, fresh)
+            return (self.__ids, fresh)
+
+    def load(self, restaurantIDs):
+        # Replaces the cached restaurantIDs, at most CACHE_MAX_SIZE + 1 of them should be provided
+        with self.__lock:
+            self.__tooLarge = len(restaurantIDs) > CACHE_MAX_SIZE
+            self.__ids = [] if self.__tooLarge else sorted(restaurantIDs)
+            self.__loadedAt = monotonic()
+
+    def add(self, restaurantID):
+        # Adds a new or updated restaurant, so that it can be chosen before the cache next expires
+        with self.__lock:
+            if self.__tooLarge:
+                return
+            # The list is replaced rather than changed, as callers may still be sampling from it
+            i = bisect_left(self.__ids, restaurantID)
+            if i == len(self.__ids) or self.__ids[i] != restaurantID:
+                ids = list(self.__ids)
+                insort(ids, restaurantID)
+                self.__ids = ids
+
+# The cache is shared by the whole process
+restaurantIDCache = RestaurantIDCache()
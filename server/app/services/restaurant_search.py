@@ -1,33 +1,32 @@
 from services.db_connection import connect
+from services.search_index import searchIndex
+from services.top_k import DEFAULT_LIMIT
 
-def restaurantSearch(search_term):
-    # Retrieve all restaurant names and IDs
-    restaurantNames = getRestaurantNames()
-    if restaurantNames[0] == None:
+def restaurantSearch(search_term, limit=DEFAULT_LIMIT, offset=0):
+    # The index is built from the database the first time it is used
+    loaded = loadSearchIndex()
+    if not loaded[0]:
         # An error has occurred
-        return (None, restaurantNames[1])
-    else:
-        restaurantNames = restaurantNames[0]
-    
-    # Calculate and store the Levenshtein distance for each restaurant
-    for i in range(len(restaurantNames)):
-        restaurant = restaurantNames[i]
-        name = restaurant[1]
-        
-        # If the restaurant name is longer than the search term then only compare the
-        # first part of the restaurant name so that the lengths are equal
-        if len(name) > len(search_term):
-            name = name[:len(search_term)]
-            
-        distance = calculateLevenshteinDistance(name, search_term)
-        
-        # Store the distance in the tuple
-        # (restaurantID, name, levenshteinDistance)
-        restaurantNames[i] = (restaurant[0], restaurant[1], distance)
-        
-    # Return the ordered list of restaurants
-    return (orderByDistance(restaurantNames), False)
+        return (None, loaded[1])
+
+    # Retrieve the requested page of the restaurants whose names are closest to the search term
+    # The index selects the best offset + limit with a bounded heap, ties ordered by restaurantID
+    # Format of the result: [(restaurantID, name, levenshteinDistance)]
+    return (searchIndex.search(search_term, offset + limit)[offset:], False)
     
+# This function builds the search index from the database if it has not been built yet
+def loadSearchIndex():
+    if searchIndex.loaded:
+        return (True, None)
+
+    restaurantNames = getRestaurantNames()
+    if restaurantNames[0] is None:
+        # An error has occurred
+        return (False, restaurantNames[1])
+
+    searchIndex.load(restaurantNames[0])
+    return (True, None)
+
 def getRestaurantNames():
     # This function returns every stored restaurant name, matched to a restaurantID
     # Attempt to connect to the database
@@ -48,47 +47,6 @@ def getRestaurantNames():
         # An error has occurred, return the error message
         return (None, connection[1])
 
-# Merge sort algorithm
-def orderByDistance(restaurantNames):
-    # Format of restaurantNames: [(restaurantID, name, levenshteinDistance)]
-    if len(restaurantNames) == 1:
-        return restaurantNames # base case
-    # Split into two halves recursively
-    midpoint = len(restaurantNames) // 2
-    left = orderByDistance(restaurantNames[:midpoint])
-    right = orderByDistance(restaurantNames[midpoint:])
-    
-    # Merge the halves together into a sorted array
-    return mergeRestaurants(left, right)
-
-# This merges two lists of sorted restaurants
-def mergeRestaurants(left, right):
-    sortedRestaurants = [] # prepare empty array for sorting
-    leftPointer, rightPointer, numSorted = 0, 0, 0
-    
-    # Continously add the smallest distance restaurant from each half
-    while leftPointer < len(left) and rightPointer < len(right) and numSorted < 10:
-        if left[leftPointer][2] < right[rightPointer][2]:
-            sortedRestaurants.append(left[leftPointer])
-            leftPointer += 1
-            numSorted += 1
-        else:
-            sortedRestaurants.append(right[rightPointer])
-            rightPointer += 1
-            numSorted += 1
-    
-    # Add any remaining restaurants
-    while leftPointer < len(left) and numSorted < 10:
-        sortedRestaurants.append(left[leftPointer])
-        leftPointer += 1
-        numSorted += 1
-    while rightPointer < len(right) and numSorted < 10:
-        sortedRestaurants.append(right[rightPointer])
-        rightPointer += 1
-        numSorted += 1
-
-    return sortedRestaurants
-
 def calculateLevenshteinDistance(term1, term2):
     # Convert both arguments to lowercase for case-insensitive comparison
     term1 = term1.lower()
@@ -0,0 +1,188 @@
+from services.levenshtein import EncodedNames
+from bisect import insort, bisect_left
+import numpy as np
+import heapq
+import threading
+
+# The trie is fast when the search term closely matches some names, but has to explore most of
+# it when nothing is close. Once this many Levenshtein matrix cells have been calculated the
+# search switches to scoring every name at once instead
+TRIE_CELL_BUDGET = 20000
+# Longer search terms are rejected by /restaurantSearch. They would need the row-by-row scoring
+# rather than the bit-parallel scoring, which is much slower and holds the index lock meanwhile
+MAX_SEARCH_TERM_LENGTH = 64
+
+# Each node of the trie stores the restaurants whose lowercase name passes through it
+class TrieNode:
+    def __init__(self, depth=0):
+        self.depth = depth
+        self.children = {}
+        # Sorted restaurantIDs of every name in this node's subtree
+        self.subtreeIDs = []
+        # Sorted restaurantIDs of names which end exactly at this node
+        self.endIDs = []
+
+# This class stores every restaurant name in memory so that searches do not need to read
+# or score the whole Restaurant table
+class RestaurantSearchIndex:
+    def __init__(self):
+        self.__root = TrieNode()
+        self.__names = {} # restaurantID -> name
+        # Every name is also stored in a character matrix for scoring them all at once
+        self.__encoded = EncodedNames()
+        self.__positions = {} # restaurantID -> index in the matrix
+        self.__ids = np.zeros(0, dtype=np.int64)
+        self.__lock = threading.Lock()
+        self.loaded = False
+
+    def load(self, restaurantNames):
+        # Replaces the contents of the index with the provided [(restaurantID, name)] list
+        with self.__lock:
+            self.__root = TrieNode()
+            self.__names = {}
+            self.__encoded = EncodedNames()
+            self.__positions = {}
+            for restaurantID, name in restaurantNames:
+                self.__insert(restaurantID, name)
+            self.__ids = np.array(list(self.__positions), dtype=np.int64)
+            self.loaded = True
+
+    def setName(self, restaurantID, name):
+        # Adds a restaurant to the index, or replaces the name stored for it
+        with self.__lock:
+            if restaurantID in self.__names:
+                self.__remove(restaurantID)
+            else:
+                self.__ids = np.append(self.__ids, restaurantID)
+            self.__insert(restaurantID, name)
+
+    def search(self, searchTerm, k=10):
+        """
+        Returns the k restaurants whose names have the smallest Levenshtein distance to the
+        search term, comparing only the first len(searchTerm) characters of each name.
+        Results are (restaurantID, name, distance) tuples, with ties ordered by restaurantID.
+        """
+        if k <= 0:
+            return []
+
+        with self.__lock:
+            results = self.__searchTrie(searchTerm, k)
+            if results is None:
+                results = self.__searchAll(searchTerm, k)
+            return [(restaurantID, self.__names[restaurantID], distance) for distance, restaurantID in results]
+
+    def __searchAll(self, searchTerm, k):
+        # Scores every name at once, returning the best k as (distance, restaurantID) tuples
+        distances = self.__encoded.calculatePrefixDistances(searchTerm).astype(np.int64)
+        if len(distances) == 0:
+            return []
+
+        # Combine the distance and restaurantID into a single key so that ties are ordered by ID
+        multiplier = int(self.__ids.max()) + 1
+        keys = distances * multiplier + self.__ids
+        if len(keys) > k:
+            keys = keys[np.argpartition(keys, k)[:k]]
+        return [(int(key) // multiplier, int(key) % multiplier) for key in np.sort(keys)]
+
+    def __searchTrie(self, searchTerm, k):
+        # Searches the trie, returning the best k as (distance, restaurantID) tuples,
+        # or None if the search would take too long
+        term = searchTerm.lower()
+        length = len(term)
+        cellsCalculated = 0
+
+        # The k best results so far, stored as a max-heap of (-distance, -restaurantID)
+        best = []
+
+        def offer(distance, restaurantIDs):
+            # Considers each provided restaurantID (in ascending order) as a result
+            for restaurantID in restaurantIDs:
+                entry = (-distance, -restaurantID)
+                if len(best) < k:
+                    heapq.heappush(best, entry)
+                elif entry > best[0]:
+                    heapq.heapreplace(best, entry)
+                else:
+                    # Every later restaurantID is larger, so none of them can be better
+                    return
+
+        # Nodes are explored in order of the lowest distance any name below them could have.
+        # The values in a Levenshtein row never decrease further down the trie, so the minimum
+        # of a node's row is a lower bound for every name in its subtree
+        firstRow = list(range(length + 1))
+        queue = [(0, 0, self.__root, firstRow)]
+        counter = 1 # breaks ties in the queue without comparing nodes
+        while len(queue) > 0:
+            lowerBound, _, node, row = heapq.heappop(queue)
+            if len(best) == k and lowerBound > -best[0][0]:
+                # No remaining name can beat the current results
+                break
+
+            distance = row[length]
+            if node.depth == length:
+                # Names at least as long as the search term are truncated here
+                offer(distance, node.subtreeIDs[:k])
+                continue
+
+            # Names shorter than the search term are compared in full
+            offer(distance, node.endIDs[:k])
+
+            cellsCalculated += length * len(node.children)
+            if cellsCalculated > TRIE_CELL_BUDGET:
+                return None
+
+            for char, child in node.children.items():
+                # Calculate the next row of the Levenshtein matrix for this character
+                nextRow = [row[0] + 1]
+                for j in range(length):
+                    nextRow.append(min(
+                        row[j + 1] + 1, # insertion
+                        nextRow[j] + 1, # deletion
+                        row[j] + (char != term[j]) # substitution
+                    ))
+                childBound = min(nextRow)
+                if len(best) == k and childBound > -best[0][0]:
+                    continue
+                heapq.heappush(queue, (childBound, counter, child, nextRow))
+                counter += 1
+
+        return sorted((-entry[0], -entry[1]) for entry in best)
+
+    def __insert(self, restaurantID, name):
+        self.__names[restaurantID] = name
+        if restaurantID in self.__positions:
+            self.__encoded.set(self.__positions[restaurantID], name)
+        else:
+            self.__positions[restaurantID] = self.__encoded.append(name)
+
+        node = self.__root
+        insort(node.subtreeIDs, restaurantID)
+        for depth, char in enumerate(name.lower()):
+            if char not in node.children:
+                child = TrieNode(depth + 1)
+                node.children[char] = child
+            node = node.children[char]
+            insort(node.subtreeIDs, restaurantID)
+        insort(node.endIDs, restaurantID)
+
+    def __remove(self, restaurantID):
+        name = self.__names.pop(restaurantID)
+        # Walk down the trie removing the restaurantID, then remove any nodes left empty
+        path = [(None, self.__root)]
+        for char in name.lower():
+            path.append((char, path[-1][1].children[char]))
+        removeID(path[-1][1].endIDs, restaurantID)
+        for i in range(len(path) - 1, -1, -1):
+            char, node = path[i]
+            removeID(node.subtreeIDs, restaurantID)
+            if i > 0 and len(node.subtreeIDs) == 0:
+                del path[i - 1][1].children[char]
+
+# This function removes a value from a sorted list
+def removeID(sortedIDs, restaurantID):
+    i = bisect_left(sortedIDs, restaurantID)
+    if i < len(sortedIDs) and sortedIDs[i] == restaurantID:
+        del sortedIDs[i]
+
+# The index is shared by the whole process
+searchIndex = RestaurantSearchIndex()
@@ -0,0 +1,328 @@
+import numpy as np
+import heapq
+import math
+import threading
+
+# Mean radius of the Earth, used for distances on the sphere
+EARTH_RADIUS_MILES = 3958.8
+# The haversine distance on a sphere of the mean radius is within this fraction of the WGS-84
+# geodesic distance calculated by geopy (measured between -0.45% and +0.57%). Candidates are
+# chosen by haversine distance widened by this tolerance and then refined with geopy, so the
+# miles returned, and their order, are identical to calculating every geodesic distance
+HAVERSINE_TOLERANCE = 0.006
+# Extra distance in miles added to every search radius to allow for floating point error
+MILES_EPSILON = 1e-6
+# Maximum number of points stored in one leaf of the k-d tree
+LEAF_SIZE = 32
+# The tree is rebuilt once this many restaurants (or this fraction of them) have moved
+REBUILD_MINIMUM = 64
+REBUILD_FRACTION = 0.05
+
+# This function converts a "latitude, longitude" string into a tuple of floats
+def parseLocation(location):
+    # Returns the (latitude, longitude) tuple, or None if the location is invalid
+    try:
+        latitude, longitude = (float(x) for x in location.split(","))
+    except (ValueError, AttributeError):
+        return None
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return None
+    return (latitude, longitude)
+
+# This function converts arrays of latitudes and longitudes into points on the unit sphere
+def toUnitVectors(latitudes, longitudes):
+    latitudes, longitudes = np.radians(latitudes), np.radians(longitudes)
+    return np.column_stack((
+        np.cos(latitudes) * np.cos(longitudes),
+        np.cos(latitudes) * np.sin(longitudes),
+        np.sin(latitudes)
+    ))
+
+# This function calculates the great circle distance in miles from one point to many others
+def calculateHaversine(coordinates, latitudes, longitudes):
+    latitude, longitude = math.radians(coordinates[0]), math.radians(coordinates[1])
+    latitudes, longitudes = np.radians(latitudes), np.radians(longitudes)
+    h = np.sin((latitudes - latitude) / 2) ** 2 + math.cos(latitude) * np.cos(latitudes) * np.sin((longitudes - longitude) / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.minimum(h, 1.0)))
+
+# This function converts the straight line distance between two points on the unit sphere
+# into the great circle distance in miles
+def chordToMiles(chord):
+    return 2 * math.asin(min(chord / 2, 1.0)) * EARTH_RADIUS_MILES
+
+# This function converts a great circle distance in miles into the straight line distance
+# between two points on the unit sphere
+def milesToChord(miles):
+    return 2 * math.sin(min(miles / EARTH_RADIUS_MILES, math.pi) / 2)
+
+# This class stores restaurant coordinates in flat arrays, parsed once, so that the distances
+# to all of them can be calculated in one vectorised pass
+# Removed entries have their latitude set to NaN, which no distance comparison ever matches
+class CoordinateStore:
+    def __init__(self, restaurants=[]):
+        # restaurants is a [(restaurantID, (latitude, longitude), categoryCode)] list
+        self.__count = len(restaurants)
+        capacity = max(self.__count, 16)
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.latitudes = np.full(capacity, np.nan)
+        self.longitudes = np.zeros(capacity)
+        self.categories = np.zeros(capacity, dtype=np.int32)
+        if self.__count > 0:
+            coordinates = np.array([restaurant[1] for restaurant in restaurants], dtype=np.float64)
+            self.ids[:self.__count] = [restaurant[0] for restaurant in restaurants]
+            self.latitudes[:self.__count] = coordinates[:, 0]
+            self.longitudes[:self.__count] = coordinates[:, 1]
+            self.categories[:self.__count] = [restaurant[2] for restaurant in restaurants]
+
+    def __len__(self):
+        return self.__count
+
+    def append(self, restaurantID, coordinates, categoryCode):
+        # Adds a restaurant to the end of the arrays, returning its index
+        if self.__count == len(self.ids):
+            # Double the capacity of the arrays
+            self.ids = np.pad(self.ids, (0, self.__count))
+            self.latitudes = np.pad(self.latitudes, (0, self.__count), constant_values=np.nan)
+            self.longitudes = np.pad(self.longitudes, (0, self.__count))
+            self.categories = np.pad(self.categories, (0, self.__count))
+        index = self.__count
+        self.ids[index] = restaurantID
+        self.latitudes[index], self.longitudes[index] = coordinates
+        self.categories[index] = categoryCode
+        self.__count += 1
+        return index
+
+    def remove(self, index):
+        self.latitudes[index] = np.nan
+
+    def calculateHaversine(self, coordinates):
+        # Returns the great circle distance in miles to every stored restaurant, NaN if removed
+        count = self.__count
+        return calculateHaversine(coordinates, self.latitudes[:count], self.longitudes[:count])
+
+    def toUnitVectors(self):
+        return toUnitVectors(self.latitudes[:self.__count], self.longitudes[:self.__count])
+
+    def getRestaurants(self, indices=None, withCategories=False):
+        # Returns [(restaurantID, (latitude, longitude))] for the indices, or every stored restaurant
+        if indices is None:
+            indices = np.nonzero(~np.isnan(self.latitudes[:self.__count]))[0]
+        columns = [
+            self.ids[indices].tolist(),
+            zip(self.latitudes[indices].tolist(), self.longitudes[indices].tolist())
+        ]
+        if withCategories:
+            columns.append(self.categories[indices].tolist())
+        return list(zip(*columns))
+
+# Each node of the k-d tree stores the bounding box of the points below it
+class KDNode:
+    def __init__(self, lower, upper):
+        self.lower = lower
+        self.upper = upper
+        # Leaves store the indices of their points, other nodes store two children
+        self.indices = None
+        self.left = None
+        self.right = None
+
+    def squaredDistance(self, query):
+        # Returns the squared distance from the query to the closest point of the bounding box
+        difference = np.maximum(np.maximum(self.lower - query, query - self.upper), 0)
+        return float(difference @ difference)
+
+# This class is a k-d tree over 3D points, answering nearest and within-radius queries
+class KDTree:
+    def __init__(self, points):
+        self.points = points
+        self.root = None
+        if len(points) > 0:
+            self.root = self.__build(np.arange(len(points)))
+
+    def __build(self, indices):
+        points = self.points[indices]
+        node = KDNode(points.min(axis=0), points.max(axis=0))
+        if len(indices) <= LEAF_SIZE:
+            node.indices = indices
+            return node
+
+        # Split the points in half along the widest axis of the bounding box
+        axis = int(np.argmax(node.upper - node.lower))
+        middle = len(indices) // 2
+        indices = indices[np.argpartition(points[:, axis], middle)]
+        node.left = self.__build(indices[:middle])
+        node.right = self.__build(indices[middle:])
+        return node
+
+    def nearest(self, query, k, current):
+        # Returns [(squaredDistance, index)] for the k closest points whose index is marked as current
+        # The k best points so far, stored as a max-heap of (-squaredDistance, index)
+        best = []
+        if self.root is None or k <= 0:
+            return []
+
+        # Nodes are visited closest first, and skipped once they cannot contain a better point
+        queue = [(0.0, 0, self.root)]
+        counter = 1 # breaks ties in the queue without comparing nodes
+        while len(queue) > 0:
+            bound, _, node = heapq.heappop(queue)
+            if len(best) == k and bound > -best[0][0]:
+                break
+
+            if node.indices is not None:
+                indices = node.indices[current[node.indices]]
+                differences = self.points[indices] - query
+                distances = np.einsum("ij,ij->i", differences, differences)
+                for index, distance in zip(indices.tolist(), distances.tolist()):
+                    if len(best) < k:
+                        heapq.heappush(best, (-distance, index))
+                    elif distance < -best[0][0]:
+                        heapq.heapreplace(best, (-distance, index))
+                continue
+
+            for child in (node.left, node.right):
+                heapq.heappush(queue, (child.squaredDistance(query), counter, child))
+                counter += 1
+
+        return [(-distance, index) for distance, index in best]
+
+    def withinRadius(self, query, radius):
+        # Returns an array of the indices of every point at most radius away from the query
+        found = []
+        if self.root is None:
+            return np.zeros(0, dtype=np.int64)
+
+        squaredRadius = radius * radius
+        stack = [self.root]
+        while len(stack) > 0:
+            node = stack.pop()
+            if node.squaredDistance(query) > squaredRadius:
+                continue
+            if node.indices is not None:
+                differences = self.points[node.indices] - query
+                distances = np.einsum("ij,ij->i", differences, differences)
+                found.append(node.indices[distances <= squaredRadius])
+            else:
+                stack.append(node.left)
+                stack.append(node.right)
+        if len(found) == 0:
+            return np.zeros(0, dtype=np.int64)
+        return np.concatenate(found)
+
+# This class stores every restaurant's location in memory so that nearby searches only need to
+# calculate exact distances to the few restaurants which could be closest
+class RestaurantSpatialIndex:
+    def __init__(self):
+        self.__lock = threading.Lock()
+        # Categories are stored as numbers, category -> number
+        self.__categories = {}
+        self.__build([])
+        self.loaded = False
+
+    def load(self, restaurants):
+        # Replaces the contents of the index with the provided [(restaurantID, location, category)] list
+        with self.__lock:
+            self.__categories = {}
+            records = []
+            for restaurantID, location, category in restaurants:
+                coordinates = parseLocation(location)
+                if coordinates is not None:
+                    records.append((restaurantID, coordinates, self.__getCategoryCode(category)))
+            self.__build(records)
+            self.loaded = True
+
+    def setRestaurant(self, restaurantID, location, category):
+        # Adds a restaurant to the index, or changes its location and category
+        coordinates = parseLocation(location)
+        with self.__lock:
+            # The old point stays in the tree, but is ignored until the tree is rebuilt
+            if restaurantID in self.__positions:
+                self.__current[self.__positions.pop(restaurantID)] = False
+                self.__staleCount += 1
+            if restaurantID in self.__pendingPositions:
+                self.__pending.remove(self.__pendingPositions.pop(restaurantID))
+
+            if coordinates is not None:
+                categoryCode = self.__getCategoryCode(category)
+                self.__pendingPositions[restaurantID] = self.__pending.append(restaurantID, coordinates, categoryCode)
+
+            changes = len(self.__pending) + self.__staleCount
+            if changes > max(REBUILD_MINIMUM, REBUILD_FRACTION * len(self.__stored)):
+                self.__build(self.__getRestaurants(self.__current, None, True))
+
+    def getNearestCandidates(self, coordinates, k, maxMiles=None, category=None):
+        """
+        Returns [(restaurantID, (latitude, longitude))] for a set of restaurants which is
+        guaranteed to contain the k closest restaurants to the provided coordinates, measured
+        along the ellipsoid, along with any restaurants tied with the kth.
+        Restaurants further than maxMiles away, or in a different category, are never returned.
+        """
+        with self.__lock:
+            # Only restaurants in the requested category are considered at all
+            current, pendingMatches = self.__current, None
+            if category is not None:
+                categoryCode = self.__categories.get(normaliseCategory(category))
+                if categoryCode is None:
+                    return []
+                current = current & (self.__stored.categories[:len(self.__stored)] == categoryCode)
+                pendingMatches = self.__pending.categories[:len(self.__pending)] == categoryCode
+
+            # Find the k closest restaurants on the sphere, from both the tree and the pending list
+            query = toUnitVectors(*coordinates)[0]
+            nearest = [chordToMiles(math.sqrt(distance)) for distance, _ in self.__tree.nearest(query, k, current)]
+            pendingMiles = self.__pending.calculateHaversine(coordinates)
+            if pendingMatches is not None:
+                pendingMiles[~pendingMatches] = np.nan
+            nearest = np.concatenate((nearest, pendingMiles[~np.isnan(pendingMiles)]))
+
+            # Any restaurant which could be closer along the ellipsoid than the kth closest on the
+            # sphere is within the widened radius
+            radius = math.inf
+            if len(nearest) >= k:
+                furthest = float(np.partition(nearest, k - 1)[k - 1])
+                radius = furthest * (1 + HAVERSINE_TOLERANCE) / (1 - HAVERSINE_TOLERANCE) + MILES_EPSILON
+            if maxMiles is not None:
+                radius = min(radius, maxMiles * (1 + HAVERSINE_TOLERANCE) + MILES_EPSILON)
+
+            if radius == math.inf:
+                # There are fewer than k restaurants, so every one of them is a candidate
+                return self.__getRestaurants(current, pendingMiles)
+            return self.__getCandidates(query, radius, current, pendingMiles)
+
+    def __getCandidates(self, query, radius, current, pendingMiles):
+        # Returns every current restaurant within the radius in miles on the sphere
+        indices = self.__tree.withinRadius(query, milesToChord(radius))
+        candidates = self.__stored.getRestaurants(indices[current[indices]])
+        candidates.extend(self.__pending.getRestaurants(np.nonzero(pendingMiles <= radius)[0]))
+        return candidates
+
+    def __getRestaurants(self, current, pendingMiles, withCategories=False):
+        # Returns the location of every current restaurant, and every pending restaurant which
+        # has a distance (or every pending restaurant if no distances are provided)
+        pendingIndices = None
+        if pendingMiles is not None:
+            pendingIndices = np.nonzero(~np.isnan(pendingMiles))[0]
+        restaurants = self.__stored.getRestaurants(np.nonzero(current)[0], withCategories)
+        return restaurants + self.__pending.getRestaurants(pendingIndices, withCategories)
+
+    def __getCategoryCode(self, category):
+        # Returns the number used to store the category, assigning a new one if necessary
+        return self.__categories.setdefault(normaliseCategory(category), len(self.__categories))
+
+    def __build(self, restaurants):
+        # Rebuilds the tree from the provided [(restaurantID, (latitude, longitude), categoryCode)] list
+        self.__stored = CoordinateStore(restaurants)
+        self.__tree = KDTree(self.__stored.toUnitVectors())
+        self.__positions = {restaurant[0]: index for index, restaurant in enumerate(restaurants)}
+        # Tree points of restaurants which have since moved are no longer current
+        self.__current = np.ones(len(restaurants), dtype=bool)
+        self.__staleCount = 0
+        # Restaurants added or moved since the tree was built
+        self.__pending = CoordinateStore()
+        self.__pendingPositions = {} # restaurantID -> index in the pending store
+
+# This function converts a category into the form used to compare categories
+def normaliseCategory(category):
+    return str(category).strip().lower()
+
+# The index is shared by the whole process
+spatialIndex = RestaurantSpatialIndex()
@@ -0,0 +1,43 @@
+from time import monotonic
+import threading
+import secrets
+import os
+
+# Seconds the authentication token of an open stream is trusted before it is checked again, so a
+# stream ends soon after its token expires or is deleted
+TOKEN_CHECK_SECONDS = 60
+
+# This class issues the short-lived, single-use tickets used to open an order queue stream
+# EventSource can only send a URL, which ends up in access logs and browser history, so the URL
+# holds a ticket rather than the 7-day authentication token
+# The ticket is exchanged for the userID, token and restaurantID it was issued for, and the
+# token is kept in memory only to check it again while the stream is open
+class StreamTickets:
+    def __init__(self, ttl):
+        self.__ttl = ttl
+        # ticket -> (userID, authToken, restaurantID, time the ticket expires)
+        self.__tickets = {}
+        self.__lock = threading.Lock()
+
+    def issue(self, userID, authToken, restaurantID):
+        # Returns a new ticket for an authenticated professional user
+        ticket = secrets.token_urlsafe(32)
+        now = monotonic()
+        with self.__lock:
+            # Remove tickets which were never used
+            for expired in [key for key, value in self.__tickets.items() if now >= value[3]]:
+                del self.__tickets[expired]
+            self.__tickets[ticket] = (userID, authToken, restaurantID, now + self.__ttl)
+        return ticket
+
+    def redeem(self, ticket):
+        # Returns the (userID, authToken, restaurantID) the ticket was issued for, or None if it
+        # is unknown, expired or has already been used
+        with self.__lock:
+            entry = self.__tickets.pop(ticket, None)
+        if entry is None or monotonic() >= entry[3]:
+            return None
+        return entry[:3]
+
+# The tickets are shared by the whole process, as are the streams they open
+streamTickets = StreamTickets(float(os.getenv("STREAM_TICKET_TTL", 30)))
@@ -0,0 +1,72 @@
+import heapq
+import base64
+import json
+
+# The number of results returned when the client does not ask for a page size
+DEFAULT_LIMIT = 10
+# The largest page of results a client may ask for
+MAX_LIMIT = 50
+# The furthest into the results a page may end. The best offset + limit candidates are held
+# in memory while selecting a page, so this keeps the heap bounded
+MAX_RESULTS = 500
+
+# This function returns one page of the best candidates without sorting all of them
+def selectTopK(candidates, limit=DEFAULT_LIMIT, offset=0):
+    """
+    Takes an iterable (e.g. a generator) of (score, restaurantID, value) tuples and returns the
+    values of the candidates with the lowest scores, skipping the first offset of them.
+    Candidates with equal scores are ordered by restaurantID, so pages are stable.
+    Only offset + limit candidates are held in memory at any time.
+    """
+    if limit <= 0:
+        return []
+
+    # nsmallest keeps a bounded heap of the best candidates seen so far
+    best = heapq.nsmallest(offset + limit, candidates, key=lambda candidate: (candidate[0], candidate[1]))
+    return [candidate[2] for candidate in best[offset:]]
+
+# This function reads the optional offset, cursor and limit parameters from a request's JSON data
+def getPageParameters(data):
+    # Returns a tuple containing (offset, limit) or any error
+    offset, limit = data.get("offset", 0), data.get("limit", DEFAULT_LIMIT)
+
+    # A cursor returned with a previous page takes the place of the offset
+    if data.get("cursor") is not None:
+        offset = decodeCursor(data["cursor"])
+        if offset is None:
+            return (None, "The provided cursor is invalid")
+
+    # Booleans are also integers in Python, but are not valid page parameters
+    for value in (offset, limit):
+        if type(value) is not int:
+            return (None, "Invalid data format")
+
+    if offset < 0 or limit < 1 or limit > MAX_LIMIT:
+        return (None, f"The offset must be at least 0 and the limit must be between 1 and {MAX_LIMIT}")
+    if offset + limit > MAX_RESULTS:
+        return (None, f"Only the first {MAX_RESULTS} results can be retrieved")
+    return ((offset, limit), None)
+
+# This function splits one extra result off the end of a page, returning the page and the
+# cursor for the next page, which is None if there are no more results that can be retrieved
+def getNextPage(results, offset, limit):
+    if len(results) <= limit:
+        return (results, None)
+    if offset + limit >= MAX_RESULTS:
+        # The next page could not be retrieved, so no cursor is returned for it
+        return (results[:limit], None)
+    return (results[:limit], encodeCursor(offset + limit))
+
+# This function converts an offset into an opaque cursor string for the client
+def encodeCursor(offset):
+    return base64.urlsafe_b64encode(json.dumps({"offset": offset}).encode("utf-8")).decode("utf-8")
+
+# This function converts a cursor string back into an offset, returning None if it is invalid
+def decodeCursor(cursor):
+    try:
+        offset = json.loads(base64.urlsafe_b64decode(cursor.encode("utf-8")))["offset"]
+    except Exception:
+        return None
+    if type(offset) is not int:
+        return None
+    return offset
@@ -1,5 +1,9 @@
 from models.user import User
-from services.db_connection import connect
+from services.db_connection import connect, afterCommit
+from services.search_index import searchIndex
+from services.spatial_index import spatialIndex
+from services.restaurant_id_cache import restaurantIDCache
+from functools import partial
 from services.authenticate import authenticate
 
 # This function changes the details for a given user's restaurant
@@ -42,6 +46,14 @@ def updateRestaurant(userID, authToken, restaurantName, description, category, l
                     connection.rollback()
                     return (False, str(e))
                 
+                # Keep the search and spatial indexes and restaurantID cache in step with the new details
+                sql = "SELECT restaurantID FROM Restaurant WHERE managerUserID = %s;"
+                cursor.execute(sql, (userID,))
+                for row in cursor.fetchall():
+                    afterCommit(partial(searchIndex.setName, row[0], restaurantName))
+                    afterCommit(partial(spatialIndex.setRestaurant, row[0], location, category))
+                    afterCommit(partial(restaurantIDCache.add, row[0]))
+                
                 # Update succeeded, return success message with no error
                 return (True, None)
 
@@ -0,0 +1,18 @@
+-- Emails waiting to be sent by the background email worker (services/email_outbox.py)
+CREATE TABLE IF NOT EXISTS EmailOutbox (
+    emailID INT NOT NULL AUTO_INCREMENT,
+    emailAddress VARCHAR(255) NOT NULL,
+    subject VARCHAR(255) NOT NULL,
+    body TEXT NOT NULL,
+    -- pending: waiting to be sent, sending: claimed by a worker, sent: delivered,
+    -- dead: failed permanently or too many times, kept for inspection
+    status ENUM('pending', 'sending', 'sent', 'dead') NOT NULL DEFAULT 'pending',
+    attempts INT NOT NULL DEFAULT 0,
+    nextAttempt DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    claimedAt DATETIME NULL,
+    lastError TEXT NULL,
+    createdAt DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    sentAt DATETIME NULL,
+    PRIMARY KEY (emailID),
+    INDEX idx_email_outbox_due (status, nextAttempt)
+);
@@ -0,0 +1,3 @@
+-- Lets the reservations of one restaurant from a point in time onwards be found without reading
+-- the restaurant's whole reservation history (services/restaurant.py deleteInvalidReservations)
+CREATE INDEX idx_reservation_restaurant_datetime ON Reservation (restaurantID, datetime);
@@ -0,0 +1,11 @@
+-- Stores one OrderItem row per menu item in an order with the number of units ordered, rather
+-- than one row per unit, and the price of each unit when the order was placed
+ALTER TABLE OrderItem
+    ADD COLUMN quantity INT NOT NULL DEFAULT 1,
+    ADD COLUMN unitPrice DECIMAL(10, 2) NULL;
+
+-- Existing rows are each one unit, priced at the menu item's current price
+UPDATE OrderItem
+INNER JOIN MenuItem ON MenuItem.menuItemID = OrderItem.menuItemID
+SET OrderItem.unitPrice = MenuItem.price
+WHERE OrderItem.unitPrice IS NULL;
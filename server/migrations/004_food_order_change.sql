@@ -0,0 +1,12 @@
+-- A log of every change to a restaurant's orders, so that clients can fetch only what changed
+-- since the last changeID (version) they saw. There is no foreign key to FoodOrder, as the log
+-- keeps a record of orders which have been deleted
+CREATE TABLE IF NOT EXISTS FoodOrderChange (
+    changeID BIGINT NOT NULL AUTO_INCREMENT,
+    foodOrderID INT NOT NULL,
+    restaurantID INT NOT NULL,
+    changeType ENUM('insert', 'update', 'delete') NOT NULL,
+    changedAt DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (changeID),
+    INDEX idx_food_order_change_restaurant (restaurantID, changeID)
+);
@@ -0,0 +1,6 @@
+-- Tokens are issued as "selector.verifier". The selector is stored in plaintext so that the
+-- token can be found with one indexed lookup, and only the verifier's hash (tokenHash) has to
+-- be checked. Tokens issued before this change have no selector, and are accepted until they expire
+ALTER TABLE AuthToken
+    ADD COLUMN selector CHAR(16) NULL,
+    ADD UNIQUE INDEX idx_auth_token_selector (selector);
@@ -0,0 +1,5 @@
+import sys
+import os
+
+# The app's modules are imported as they are by main.py, e.g. "from services.queue import ..."
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
@@ -0,0 +1,40 @@
+from services import auth_cache
+from services.auth_cache import AuthCache
+from datetime import datetime, timedelta
+
+def test_cache_entries_expire(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(auth_cache, "monotonic", lambda: now[0])
+    cache = AuthCache(100, 60)
+    cache.add(1, "token", datetime.now() + timedelta(days=1))
+    assert cache.check(1, "token") and cache.check("1", "token")
+    assert not cache.check(1, "other") and not cache.check(2, "token")
+
+    # Entries are removed once the TTL passes
+    now[0] += 61
+    assert not cache.check(1, "token")
+
+    # or once the token itself expires
+    cache.add(1, "token", datetime.now() - timedelta(seconds=1))
+    assert not cache.check(1, "token")
+
+def test_cache_evicts_least_recently_used():
+    cache = AuthCache(3, 60)
+    expiry = datetime.now() + timedelta(days=1)
+    for i in range(3):
+        cache.add(i, "token", expiry)
+    assert cache.check(0, "token")
+    cache.add(3, "token", expiry)
+    assert not cache.check(1, "token")
+    assert all(cache.check(i, "token") for i in (0, 2, 3))
+    assert cache.getMetrics()["evictions"] == 1
+
+def test_invalidating_a_user_keeps_other_users():
+    cache = AuthCache(100, 60)
+    expiry = datetime.now() + timedelta(days=1)
+    cache.add(1, "first", expiry)
+    cache.add(1, "second", expiry)
+    cache.add(2, "first", expiry)
+    cache.invalidateUser("1")
+    assert not cache.check(1, "first") and not cache.check(1, "second")
+    assert cache.check(2, "first")
@@ -0,0 +1,178 @@
+from services import authenticate as authenticateModule
+from services.auth_cache import AuthCache
+from services.authenticate import authenticate
+from services.hashing import hashSecret, verifySecret
+from models import user as userModule
+from models.user import User
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+import pytest
+
+# Cheap Argon2 parameters, so the tests do not spend their time hashing
+TEST_PARAMETERS = {"time_cost": 1, "memory_cost": 8, "parallelism": 1}
+
+# This class verifies hashes in the test's own process, counting each verification
+class FakeHashingPool:
+    def __init__(self):
+        self.verifications = 0
+
+    def verify(self, operation, secretHash, secret):
+        self.verifications += 1
+        return (verifySecret(secretHash, secret), None)
+
+# This class stands in for the User and AuthToken tables
+class FakeDatabase:
+    def __init__(self):
+        # userID -> [email, loginAttempts]
+        self.users = {}
+        # (userID, selector, tokenHash, expiry) for each stored token
+        self.tokens = []
+        self.queries = 0
+
+    def addToken(self, userID, selector=None, expiry=None):
+        # Stores a token for the user, returning the token the client would send
+        verifier = f"verifier{len(self.tokens)}"
+        expiry = expiry or datetime.now() + timedelta(days=7)
+        self.tokens.append((userID, selector, hashSecret(TEST_PARAMETERS, verifier).encode(), expiry))
+        return verifier if selector is None else f"{selector}.{verifier}"
+
+# This class answers the queries made while authenticating and changing emails
+class FakeCursor:
+    def __init__(self, database):
+        self.database = database
+        self.result = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def execute(self, sql, params=()):
+        self.database.queries += 1
+        sql = " ".join(sql.split())
+        users, now = self.database.users, datetime.now()
+        if sql.startswith("SELECT AuthToken.tokenHash"):
+            selector, userID = (params[0], params[1]) if "AuthToken.selector = %s" in sql else (None, params[0])
+            self.result = [
+                (tokenHash, expiry, users[userID][1])
+                for tokenUserID, tokenSelector, tokenHash, expiry in self.database.tokens
+                if tokenUserID == userID and tokenSelector == selector and expiry > now and users[userID][1] <= 5
+            ]
+        elif sql.startswith("UPDATE User SET loginAttempts = 0"):
+            users[params[0]][1] = 0
+        elif sql.startswith("UPDATE User SET loginAttempts = loginAttempts + 1"):
+            users[params[0]][1] += 1
+        elif sql.startswith("SELECT email, userID, name, professional, loginAttempts, verified FROM User WHERE userID"):
+            self.result = [(users[params[0]][0], params[0], "Test User", 0, users[params[0]][1], 1)]
+        elif sql.startswith("SELECT * FROM User WHERE email"):
+            self.result = [(userID,) for userID, details in users.items() if details[0] == params[0]]
+        elif sql.startswith("UPDATE User SET email"):
+            users[params[1]][0] = params[0]
+        elif sql.startswith("DELETE FROM AuthToken"):
+            self.database.tokens = [token for token in self.database.tokens if token[0] != params[0]]
+        elif sql.startswith("DELETE FROM VerificationCode"):
+            pass
+        else:
+            raise AssertionError("Unexpected query: " + sql)
+
+    def fetchone(self):
+        return self.result[0] if len(self.result) > 0 else None
+
+    def fetchall(self):
+        return list(self.result)
+
+class FakeConnection:
+    def __init__(self, database):
+        self.database = database
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def cursor(self):
+        return FakeCursor(self.database)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+# This fixture returns a FakeDatabase with two users, and an empty authentication cache
+@pytest.fixture
+def database(monkeypatch):
+    database = FakeDatabase()
+    database.users[1] = ["user@example.com", 0]
+    database.users[2] = ["other@example.com", 0]
+    cache = AuthCache(100, 60)
+    pool = FakeHashingPool()
+    database.pool = pool
+    for module in (authenticateModule, userModule):
+        monkeypatch.setattr(module, "connect", lambda: (FakeConnection(database), None))
+        monkeypatch.setattr(module, "authCache", cache)
+    monkeypatch.setattr(authenticateModule, "hashingPool", pool)
+    return database
+
+def test_selector_token_only_checks_its_own_hash(database):
+    tokens = [database.addToken(1, f"selector{i}") for i in range(5)]
+    assert authenticate(1, tokens[3]) == (True, None)
+    assert database.pool.verifications == 1
+
+    # The verification is cached, so the database is not queried again
+    queries = database.queries
+    assert authenticate(1, tokens[3]) == (True, None)
+    assert database.queries == queries and database.pool.verifications == 1
+
+def test_selector_must_belong_to_the_user(database):
+    token = database.addToken(1, "selector")
+    assert authenticate(2, token) == (False, "The provided authentication token is invalid or expired")
+    assert database.users[2][1] == 1
+    # The wrong verifier with a valid selector is rejected too
+    assert authenticate(1, "selector.wrong")[0] is False
+    assert database.users[1][1] == 1
+
+def test_legacy_token_without_selector_is_checked_against_legacy_hashes(database):
+    database.addToken(1, "selector")
+    tokens = [database.addToken(1) for _ in range(3)]
+    assert authenticate(1, tokens[2]) == (True, None)
+    # Only the tokens without a selector are checked
+    assert database.pool.verifications == 3
+
+    assert authenticate(1, tokens[2]) == (True, None)
+    assert database.pool.verifications == 3
+
+def test_expired_token_is_rejected(database):
+    token = database.addToken(1, "selector", datetime.now() - timedelta(seconds=1))
+    assert authenticate(1, token)[0] is False
+
+def test_failed_attempt_removes_cached_verifications_and_locks_out(database):
+    token = database.addToken(1, "selector")
+    assert authenticate(1, token) == (True, None)
+
+    # A failed attempt removes the user's cached verifications, so the token is checked again
+    assert authenticate(1, "other.wrong")[0] is False
+    verifications = database.pool.verifications
+    assert authenticate(1, token) == (True, None)
+    assert database.pool.verifications == verifications + 1
+    assert database.users[1][1] == 0
+
+    # Once the user is locked out by too many failed attempts, the cached token stops working
+    for _ in range(6):
+        assert authenticate(1, "other.wrong")[0] is False
+    assert authenticate(1, token)[0] is False
+
+def test_changing_email_removes_cached_verifications(database, monkeypatch):
+    monkeypatch.setattr(userModule, "validate_email", lambda email, check_deliverability: SimpleNamespace(email=email))
+    token = database.addToken(1, "selector")
+    assert authenticate(1, token) == (True, None)
+
+    user = User(userID=1)
+    user.changeEmail("new@example.com", token)
+    assert user.error is None
+    assert database.users[1][0] == "new@example.com"
+
+    # The token was deleted along with the user's other tokens, and is no longer cached
+    assert authenticate(1, token)[0] is False
@@ -0,0 +1,222 @@
+from services import db_connection
+from services.db_connection import ConnectionPool, connect, beginSession, commitSession, endSession, afterCommit
+import mysql.connector
+import threading
+import time
+import gc
+import pytest
+
+# This class stands in for a cursor, recording the statements executed on its connection
+class FakeCursor:
+    def __init__(self, connection):
+        self.__connection = connection
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        pass
+
+    def execute(self, sql, params=None):
+        if sql.startswith("ROLLBACK TO") and self.__connection.failRollbackTo:
+            raise mysql.connector.Error("SAVEPOINT does not exist")
+        self.__connection.statements.append(sql)
+
+# This class stands in for a MySQL connection, recording whether it has been closed
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+        self.connected = True
+        self.in_transaction = False
+        self.statements = []
+        self.failRollbackTo = False
+
+    def is_connected(self):
+        return self.connected
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.statements.append("COMMIT")
+
+    def rollback(self):
+        self.statements.append("ROLLBACK")
+
+    def close(self):
+        self.closed = True
+
+# This fixture replaces mysql.connector.connect, keeping a list of every connection opened
+@pytest.fixture
+def opened(monkeypatch):
+    connections = []
+    def connect(**arguments):
+        connection = FakeConnection()
+        connections.append(connection)
+        return connection
+    monkeypatch.setattr(mysql.connector, "connect", connect)
+    return connections
+
+def createPool(size=1, timeout=0.1, maxLifetime=1800, idleTimeout=300, pingAfter=5):
+    return ConnectionPool({}, size, timeout, maxLifetime, idleTimeout, pingAfter)
+
+# This function returns how many of the opened connections are still open
+def countOpen(connections):
+    return sum(1 for connection in connections if not connection.closed)
+
+def test_reuses_a_returned_connection(opened):
+    pool = createPool()
+    with pool.getConnection()[0]:
+        pass
+    with pool.getConnection()[0]:
+        pass
+    assert len(opened) == 1
+    assert pool.getMetrics()["open"] == 1
+
+def test_size_bounds_connections_after_lifetime_expiry(opened):
+    pool = createPool(size=1, maxLifetime=0.01)
+    first = pool.getConnection()[0]
+    first.close()
+    time.sleep(0.02)
+
+    # The expired connection is replaced at checkout in the same slot
+    second = pool.getConnection()[0]
+    assert opened[0].closed
+    assert pool.getMetrics()["lifetimeExpiries"] == 1
+    assert pool.getMetrics()["open"] == 1
+    assert pool.getMetrics()["inUse"] == 1
+
+    # The only slot is in use, so another caller has to wait rather than open a second connection
+    third = pool.getConnection()
+    assert third[0] is None
+    assert countOpen(opened) == 1
+    assert pool.getMetrics()["exhausted"] == 1
+    second.close()
+
+def test_size_bounds_connections_after_failed_ping(opened):
+    pool = createPool(size=1, pingAfter=0)
+    first = pool.getConnection()[0]
+    first.close()
+    opened[0].connected = False
+
+    second = pool.getConnection()[0]
+    assert opened[0].closed
+    assert pool.getMetrics()["healthCheckFailures"] == 1
+    assert pool.getMetrics()["open"] == 1
+
+    assert pool.getConnection()[0] is None
+    assert countOpen(opened) == 1
+
+    # Once returned, the replacement is handed out again
+    second.close()
+    opened[1].connected = True
+    with pool.getConnection()[0]:
+        assert countOpen(opened) == 1
+    assert pool.getMetrics()["open"] == 1
+    assert pool.getMetrics()["inUse"] == 0
+
+def test_failed_connect_gives_the_slot_back(opened, monkeypatch):
+    pool = createPool(size=1)
+    def fail(**arguments):
+        raise mysql.connector.Error("unreachable")
+    monkeypatch.setattr(mysql.connector, "connect", fail)
+    assert pool.getConnection()[0] is None
+    assert pool.getMetrics()["open"] == 0
+
+def test_size_holds_under_concurrent_checkouts(opened):
+    # Every checkout replaces an expired connection, so this also checks the replacement path
+    pool = createPool(size=3, timeout=5, maxLifetime=0)
+    lock = threading.Lock()
+    peak = [0]
+    errors = []
+
+    def work():
+        for _ in range(50):
+            connection = pool.getConnection()
+            if connection[0] is None:
+                errors.append(connection[1])
+                continue
+            with connection[0]:
+                with lock:
+                    peak[0] = max(peak[0], countOpen(opened))
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert peak[0] <= 3
+    assert pool.getMetrics()["open"] == countOpen(opened)
+
+def test_unclosed_connection_is_returned_when_collected(opened):
+    pool = createPool(size=1)
+    connection = pool.getConnection()[0]
+    assert pool.getMetrics()["inUse"] == 1
+    del connection
+    gc.collect()
+    assert pool.getMetrics()["inUse"] == 0
+    assert pool.getConnection()[0] is not None
+    assert len(opened) == 1
+
+# This fixture runs a request session against a pool of fake connections
+@pytest.fixture
+def session(opened, monkeypatch):
+    monkeypatch.setattr(db_connection, "pool", createPool(size=2))
+    beginSession()
+    yield opened
+    endSession()
+
+def test_rollback_only_discards_the_callers_changes(session):
+    ran = []
+    first = connect()[0]
+    afterCommit(lambda: ran.append("first"))
+    second = connect()[0]
+    afterCommit(lambda: ran.append("second"))
+    second.rollback()
+
+    assert commitSession() is None
+    assert ran == ["first"]
+    assert session[0].statements == ["SAVEPOINT session_1;", "SAVEPOINT session_2;", "ROLLBACK TO SAVEPOINT session_2;", "COMMIT"]
+
+def test_rollback_after_commit_keeps_the_committed_changes(session):
+    ran = []
+    connection = connect()[0]
+    afterCommit(lambda: ran.append("committed"))
+    connection.commit()
+    afterCommit(lambda: ran.append("rolled back"))
+    connection.rollback()
+
+    assert commitSession() is None
+    assert ran == ["committed"]
+    assert "ROLLBACK TO SAVEPOINT session_2;" in session[0].statements
+
+def test_rolling_back_to_an_older_savepoint_removes_later_ones(session):
+    ran = []
+    first = connect()[0]
+    second = connect()[0]
+    afterCommit(lambda: ran.append("second"))
+    first.rollback()
+    afterCommit(lambda: ran.append("after"))
+    # The second savepoint no longer exists, so the first is used instead
+    second.rollback()
+
+    assert commitSession() is None
+    assert ran == []
+    assert session[0].statements.count("ROLLBACK TO SAVEPOINT session_1;") == 2
+
+def test_lost_savepoint_rolls_back_everything(session):
+    ran = []
+    first = connect()[0]
+    afterCommit(lambda: ran.append("first"))
+    second = connect()[0]
+    afterCommit(lambda: ran.append("second"))
+
+    # e.g. the server rolled the whole transaction back after a deadlock
+    session[0].failRollbackTo = True
+    second.rollback()
+
+    assert commitSession() is None
+    assert ran == []
+    assert "ROLLBACK" in session[0].statements
@@ -0,0 +1,11 @@
+from services.diagnostics import getDiagnostics
+from services.availability_cache import availabilityCache
+import json
+
+def test_diagnostics_include_every_counter():
+    diagnostics = getDiagnostics()
+    assert set(diagnostics) == {"connectionPool", "availabilityCache", "authCache", "hashing", "emailWorker"}
+    assert diagnostics["availabilityCache"] == availabilityCache.getMetrics()
+    assert "histograms" in diagnostics["hashing"]
+    # The diagnostics are logged as JSON
+    assert json.loads(json.dumps(diagnostics)) == diagnostics
@@ -0,0 +1,225 @@
+from services import db_connection, email_outbox
+from services.db_connection import ConnectionPool
+from services.email_outbox import EmailWorker, claimEmails, recordResults, isDead, getBackoffSeconds, openSmtpSession, closeSmtpSession, MAX_ATTEMPTS, BACKOFF_BASE_SECONDS, BACKOFF_MAX_SECONDS
+import mysql.connector
+import socket
+import os
+import pytest
+
+# The emails are sent to a local aiosmtpd server, which records each message it accepts
+controller = pytest.importorskip("aiosmtpd.controller")
+
+# The tests which use the EmailOutbox table need a MySQL server, see test_make_reservation.py
+DB_SETTINGS = {
+    "host": os.getenv("TEST_DB_HOST", "127.0.0.1"),
+    "port": int(os.getenv("TEST_DB_PORT", 3306)),
+    "user": os.getenv("TEST_DB_USER", "root"),
+    "passwd": os.getenv("TEST_DB_PASSWORD")
+}
+DB_NAME = os.getenv("TEST_DB_NAME", "tablenest_test")
+needsDatabase = pytest.mark.skipif(DB_SETTINGS["passwd"] is None, reason="TEST_DB_PASSWORD is not set")
+
+# This class accepts every email, except those sent to busy@ (a temporary 4xx error) or
+# unknown@ (a permanent 5xx error)
+class RecordingHandler:
+    def __init__(self):
+        # (client address, recipient, message) for each email accepted
+        self.messages = []
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address.startswith("busy@"):
+            return "451 4.3.0 Mailbox busy, try again later"
+        if address.startswith("unknown@"):
+            return "550 5.1.1 No such user"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append((session.peer, envelope.rcpt_tos[0], envelope.content.decode()))
+        return "250 Message accepted"
+
+    def getSessionCount(self):
+        # Each SMTP session comes from a different client port
+        return len(set(peer for peer, _, _ in self.messages))
+
+def findFreePort():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+# This fixture starts a local SMTP server and points the email settings at it
+@pytest.fixture
+def smtpServer(monkeypatch):
+    handler = RecordingHandler()
+    server = controller.Controller(handler, hostname="127.0.0.1", port=findFreePort())
+    server.start()
+
+    # The settings are read from the environment, so a developer's .env file is not loaded
+    monkeypatch.setattr(email_outbox, "load_dotenv", lambda: None)
+    monkeypatch.setenv("EMAIL_SMTP_HOST", "127.0.0.1")
+    monkeypatch.setenv("EMAIL_SMTP_PORT", str(server.port))
+    monkeypatch.setenv("EMAIL_STARTTLS", "0")
+    monkeypatch.setenv("EMAIL_ALLOW_UNAUTHENTICATED", "1")
+    monkeypatch.delenv("EMAIL_PASSWORD", raising=False)
+
+    yield handler
+    server.stop()
+
+def createEmails(addresses, attempts=0):
+    return [(i + 1, address, f"Subject {i}", f"<p>Code {i}</p>", attempts) for i, address in enumerate(addresses)]
+
+def test_batch_is_sent_over_one_session(smtpServer):
+    worker = EmailWorker()
+    emails = createEmails([f"user{i}@example.com" for i in range(5)])
+    server, results = worker.sendBatch(None, emails)
+    assert results == [(None, False)] * 5
+
+    # The session is kept open and reused for the next batch
+    server, results = worker.sendBatch(server, createEmails(["user5@example.com", "user6@example.com"]))
+    closeSmtpSession(server)
+    assert results == [(None, False)] * 2
+
+    assert [recipient for _, recipient, _ in smtpServer.messages] == [f"user{i}@example.com" for i in range(5)] + ["user5@example.com", "user6@example.com"]
+    assert smtpServer.getSessionCount() == 1
+    assert worker.getMetrics()["smtpSessions"] == 1
+    assert "Code 0" in smtpServer.messages[0][2]
+
+def test_rejected_emails_are_retried_or_dead_lettered(smtpServer):
+    worker = EmailWorker()
+    emails = createEmails(["busy@example.com", "unknown@example.com", "user@example.com"])
+    server, results = worker.sendBatch(None, emails)
+    closeSmtpSession(server)
+
+    # A temporary error is retried, a permanent one is not, and the rest of the batch is still sent
+    assert results[0][0] is not None and not isDead(results[0], emails[0])
+    assert results[1][0] is not None and isDead(results[1], emails[1])
+    assert results[2] == (None, False)
+    assert [recipient for _, recipient, _ in smtpServer.messages] == ["user@example.com"]
+    assert smtpServer.getSessionCount() == 1
+
+def test_email_is_dead_lettered_after_too_many_attempts(smtpServer):
+    worker = EmailWorker()
+    emails = createEmails(["busy@example.com"], attempts=MAX_ATTEMPTS - 1)
+    server, results = worker.sendBatch(None, emails)
+    closeSmtpSession(server)
+    assert isDead(results[0], emails[0])
+
+def test_unreachable_server_leaves_every_email_to_be_retried(smtpServer, monkeypatch):
+    monkeypatch.setenv("EMAIL_SMTP_PORT", str(findFreePort()))
+    emails = createEmails(["user0@example.com", "user1@example.com"])
+    server, results = EmailWorker().sendBatch(None, emails)
+    assert server is None
+    assert all(result[0] is not None and not isDead(result, email) for email, result in zip(emails, results))
+
+def test_login_is_required_unless_unauthenticated_sending_is_allowed(smtpServer, monkeypatch):
+    monkeypatch.delenv("EMAIL_ALLOW_UNAUTHENTICATED")
+    server = openSmtpSession()
+    assert server[0] is None
+    assert "EMAIL_PASSWORD" in server[1]
+
+    monkeypatch.setenv("EMAIL_ALLOW_UNAUTHENTICATED", "1")
+    server = openSmtpSession()
+    assert server[1] is None
+    closeSmtpSession(server[0])
+
+def test_backoff_doubles_up_to_the_limit():
+    for attempts in range(1, 20):
+        expected = min(BACKOFF_BASE_SECONDS * 2 ** (attempts - 1), BACKOFF_MAX_SECONDS)
+        assert int(expected * 0.8) <= getBackoffSeconds(attempts) <= int(expected * 1.2)
+
+# This fixture creates an empty EmailOutbox table and points the connection pool at it
+@pytest.fixture
+def outbox(monkeypatch):
+    connection = mysql.connector.connect(**DB_SETTINGS)
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP DATABASE IF EXISTS {DB_NAME};")
+        cursor.execute(f"CREATE DATABASE {DB_NAME};")
+        cursor.execute(f"USE {DB_NAME};")
+        migration = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "migrations", "001_email_outbox.sql")
+        with open(migration) as file:
+            cursor.execute(file.read())
+    connection.commit()
+
+    pool = ConnectionPool(dict(DB_SETTINGS, database=DB_NAME, buffered=True), 10, 30, 1800, 300, 5)
+    monkeypatch.setattr(db_connection, "pool", pool)
+
+    yield
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP DATABASE IF EXISTS {DB_NAME};")
+    connection.close()
+
+# This function opens a connection to the test database which is not taken from the pool
+def openConnection():
+    return mysql.connector.connect(**DB_SETTINGS, database=DB_NAME)
+
+def queueEmails(addresses):
+    connection = openConnection()
+    with connection.cursor() as cursor:
+        sql = "INSERT INTO EmailOutbox (emailAddress, subject, body) VALUES (%s, %s, %s);"
+        cursor.executemany(sql, [(address, "Verify your email", f"<p>Code {i}</p>") for i, address in enumerate(addresses)])
+    connection.commit()
+    connection.close()
+
+def getEmails():
+    connection = openConnection()
+    with connection.cursor(dictionary=True) as cursor:
+        cursor.execute("SELECT *, TIMESTAMPDIFF(SECOND, NOW(), nextAttempt) AS delay FROM EmailOutbox ORDER BY emailID;")
+        emails = cursor.fetchall()
+    connection.close()
+    return emails
+
+@needsDatabase
+def test_claim_skips_emails_locked_by_another_worker(outbox):
+    queueEmails([f"user{i}@example.com" for i in range(4)])
+
+    # Another worker is part way through claiming the first two emails
+    other = openConnection()
+    with other.cursor() as cursor:
+        cursor.execute("SELECT emailID FROM EmailOutbox WHERE emailID IN (1, 2) FOR UPDATE;")
+        cursor.fetchall()
+
+        emails = claimEmails(10)
+        assert emails[1] is None
+        assert [email[0] for email in emails[0]] == [3, 4]
+    other.rollback()
+    other.close()
+
+    # The claimed emails are not claimed again until the claim times out
+    emails = claimEmails(10)
+    assert [email[0] for email in emails[0]] == [1, 2]
+    assert claimEmails(10) == ([], None)
+    assert [email["status"] for email in getEmails()] == ["sending"] * 4
+
+@needsDatabase
+def test_sent_email_body_is_cleared(outbox, smtpServer):
+    queueEmails(["user0@example.com", "user1@example.com"])
+    emails = claimEmails(10)[0]
+    server, results = EmailWorker().sendBatch(None, emails)
+    closeSmtpSession(server)
+    assert recordResults(emails, results) == (True, None)
+
+    assert "Code 1" in smtpServer.messages[1][2]
+    for email in getEmails():
+        assert email["status"] == "sent"
+        assert email["attempts"] == 1
+        assert email["body"] == ""
+        assert email["sentAt"] is not None and email["claimedAt"] is None
+
+@needsDatabase
+def test_failed_emails_are_retried_with_backoff_or_dead_lettered(outbox, smtpServer):
+    queueEmails(["busy@example.com", "unknown@example.com"])
+    emails = claimEmails(10)[0]
+    server, results = EmailWorker().sendBatch(None, emails)
+    closeSmtpSession(server)
+    assert recordResults(emails, results) == (True, None)
+
+    busy, unknown = getEmails()
+    assert busy["status"] == "pending" and busy["attempts"] == 1 and busy["claimedAt"] is None
+    assert BACKOFF_BASE_SECONDS * 0.8 - 2 <= busy["delay"] <= BACKOFF_BASE_SECONDS * 1.2
+    assert "451" in busy["lastError"]
+    assert busy["body"] != ""
+    assert unknown["status"] == "dead" and "550" in unknown["lastError"]
+
+    # The email is not claimed again until it is due
+    assert claimEmails(10) == ([], None)
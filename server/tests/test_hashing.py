@@ -0,0 +1,22 @@
+from services.hashing import HashingPool
+import pytest
+
+# The pool starts worker processes, so one is shared by the tests in this file
+@pytest.fixture(scope="module")
+def pool():
+    return HashingPool(1, 2, 5)
+
+def test_hash_and_verify(pool):
+    secretHash = pool.hash("verificationCode", "123456")
+    assert secretHash[1] is None
+    assert pool.verify("verificationCode", secretHash[0], "123456") == (True, None)
+    assert pool.verify("verificationCode", secretHash[0], "654321") == (False, None)
+
+def test_worker_errors_are_returned(pool):
+    # A hash which is not a string or bytes makes argon2 raise a TypeError in the worker
+    result = pool.verify("token", 12345, "secret")
+    assert result == (None, "An error occurred while checking the credentials")
+
+    # The pool keeps working afterwards
+    secretHash = pool.hash("verificationCode", "123456")
+    assert pool.verify("verificationCode", secretHash[0], "123456") == (True, None)
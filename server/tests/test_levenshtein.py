@@ -0,0 +1,73 @@
+from services.levenshtein import EncodedNames
+from services.restaurant_search import calculateLevenshteinDistance
+import random
+import pytest
+
+# Names are built from a small alphabet so that random terms often share characters with them
+# The non-ASCII characters keep their length when lowercased, as the search compares prefixes
+ALPHABET = "abcdeABCDE xyz'-&éÉßøÄü中文"
+
+# This function returns the distances calculated by the reference implementation, comparing the
+# term with the first len(term) characters of each name
+def referenceDistances(searchTerm, names):
+    return [calculateLevenshteinDistance(searchTerm, name[:len(searchTerm)]) for name in names]
+
+def randomText(randomGenerator, minLength, maxLength):
+    return "".join(randomGenerator.choice(ALPHABET) for _ in range(randomGenerator.randint(minLength, maxLength)))
+
+@pytest.mark.parametrize("seed", range(20))
+def test_bit_parallel_matches_reference(seed):
+    randomGenerator = random.Random(seed)
+    names = [randomText(randomGenerator, 0, 40) for _ in range(100)]
+    encoded = EncodedNames(names)
+    for _ in range(10):
+        searchTerm = randomText(randomGenerator, 1, 64)
+        assert list(encoded.calculatePrefixDistances(searchTerm)) == referenceDistances(searchTerm, names)
+
+@pytest.mark.parametrize("seed", range(5))
+def test_long_terms_match_reference(seed):
+    # Terms longer than 64 characters are calculated row by row
+    randomGenerator = random.Random(seed)
+    names = [randomText(randomGenerator, 0, 90) for _ in range(50)]
+    encoded = EncodedNames(names)
+    for _ in range(5):
+        searchTerm = randomText(randomGenerator, 65, 100)
+        assert list(encoded.calculatePrefixDistances(searchTerm)) == referenceDistances(searchTerm, names)
+
+@pytest.mark.parametrize("length", [63, 64, 65])
+def test_terms_either_side_of_64_characters(length):
+    randomGenerator = random.Random(length)
+    names = [randomText(randomGenerator, 0, 80) for _ in range(100)] + ["a" * 80, ""]
+    encoded = EncodedNames(names)
+    for searchTerm in ["a" * length, randomText(randomGenerator, length, length)]:
+        assert list(encoded.calculatePrefixDistances(searchTerm)) == referenceDistances(searchTerm, names)
+
+def test_empty_and_single_character_terms():
+    names = ["", "a", "A", "b", "ab", "Ba", "é", "中文", "xyz"]
+    encoded = EncodedNames(names)
+    for searchTerm in ["", "a", "B", "é", "É", "中", "q"]:
+        assert list(encoded.calculatePrefixDistances(searchTerm)) == referenceDistances(searchTerm, names)
+
+def test_unknown_characters_never_match():
+    names = ["abc", "café", "中文餐厅"]
+    encoded = EncodedNames(names)
+    for searchTerm in ["qqq", "cafe", "日本", "abq"]:
+        assert list(encoded.calculatePrefixDistances(searchTerm)) == referenceDistances(searchTerm, names)
+
+def test_appended_and_replaced_names_match_reference():
+    # The matrix grows as names are added and replaced, which must not change the results
+    randomGenerator = random.Random(99)
+    names = []
+    encoded = EncodedNames()
+    for i in range(150):
+        names.append(randomText(randomGenerator, 0, 30 + i // 10))
+        assert encoded.append(names[-1]) == i
+    for _ in range(50):
+        index = randomGenerator.randrange(len(names))
+        names[index] = randomText(randomGenerator, 0, 70)
+        encoded.set(index, names[index])
+
+    assert len(encoded) == len(names)
+    for _ in range(10):
+        searchTerm = randomText(randomGenerator, 1, 70)
+        assert list(encoded.calculatePrefixDistances(searchTerm)) == referenceDistances(searchTerm, names)
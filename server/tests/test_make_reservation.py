@@ -0,0 +1,283 @@
+from services import db_connection, make_reservation
+from services.db_connection import ConnectionPool, beginSession, commitSession, endSession
+from services.make_reservation import makeReservation
+from mysql.connector import errorcode
+import mysql.connector
+import threading
+import random
+import os
+import pytest
+
+# These tests need a MySQL server, as they check the locks taken while reserving. They are skipped
+# unless TEST_DB_PASSWORD is set, e.g. with a throwaway container:
+#   docker run -d -p 3306:3306 -e MYSQL_ROOT_PASSWORD=test mysql:8
+#   TEST_DB_USER=root TEST_DB_PASSWORD=test python -m pytest tests
+# The TEST_DB_NAME database (tablenest_test by default) is dropped and recreated
+DB_SETTINGS = {
+    "host": os.getenv("TEST_DB_HOST", "127.0.0.1"),
+    "port": int(os.getenv("TEST_DB_PORT", 3306)),
+    "user": os.getenv("TEST_DB_USER", "root"),
+    "passwd": os.getenv("TEST_DB_PASSWORD")
+}
+DB_NAME = os.getenv("TEST_DB_NAME", "tablenest_test")
+
+pytestmark = pytest.mark.skipif(DB_SETTINGS["passwd"] is None, reason="TEST_DB_PASSWORD is not set")
+
+# Only the columns used while reserving are created
+SCHEMA = [
+    """
+    CREATE TABLE User (
+        userID INT NOT NULL AUTO_INCREMENT,
+        email VARCHAR(255) NOT NULL,
+        name VARCHAR(255) NOT NULL,
+        PRIMARY KEY (userID)
+    );
+    """,
+    """
+    CREATE TABLE Restaurant (
+        restaurantID INT NOT NULL AUTO_INCREMENT,
+        name VARCHAR(255) NOT NULL,
+        PRIMARY KEY (restaurantID)
+    );
+    """,
+    """
+    CREATE TABLE RestaurantTable (
+        tableID INT NOT NULL AUTO_INCREMENT,
+        restaurantID INT NOT NULL,
+        capacity INT NOT NULL,
+        PRIMARY KEY (tableID),
+        INDEX (restaurantID)
+    );
+    """,
+    """
+    CREATE TABLE Reservation (
+        reservationID INT NOT NULL AUTO_INCREMENT,
+        restaurantID INT NOT NULL,
+        tableID INT NOT NULL,
+        userID INT NOT NULL,
+        persons INT NOT NULL,
+        datetime DATETIME NOT NULL,
+        PRIMARY KEY (reservationID),
+        INDEX idx_reservation_restaurant_datetime (restaurantID, datetime)
+    );
+    """
+]
+
+# The capacity of each of the restaurant's tables
+CAPACITIES = [2, 2, 4, 4, 6, 6]
+
+# This fixture creates an empty test database and points the connection pool at it
+# It returns (restaurantID, [userIDs], [tableIDs])
+@pytest.fixture
+def database(monkeypatch):
+    connection = mysql.connector.connect(**DB_SETTINGS)
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP DATABASE IF EXISTS {DB_NAME};")
+        cursor.execute(f"CREATE DATABASE {DB_NAME};")
+        cursor.execute(f"USE {DB_NAME};")
+        for sql in SCHEMA:
+            cursor.execute(sql)
+        migration = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "migrations", "001_email_outbox.sql")
+        with open(migration) as file:
+            cursor.execute(file.read())
+
+        cursor.execute("INSERT INTO Restaurant (name) VALUES ('Test Restaurant');")
+        restaurantID = cursor.lastrowid
+        cursor.executemany(
+            "INSERT INTO User (email, name) VALUES (%s, %s);",
+            [(f"user{i}@example.com", f"User {i}") for i in range(64)]
+        )
+        cursor.execute("SELECT userID FROM User ORDER BY userID;")
+        userIDs = [row[0] for row in cursor.fetchall()]
+        cursor.executemany(
+            "INSERT INTO RestaurantTable (restaurantID, capacity) VALUES (%s, %s);",
+            [(restaurantID, capacity) for capacity in CAPACITIES]
+        )
+        cursor.execute("SELECT tableID FROM RestaurantTable ORDER BY tableID;")
+        tableIDs = [row[0] for row in cursor.fetchall()]
+    connection.commit()
+
+    # Every thread checks out its own connection, so the pool must not make them queue
+    pool = ConnectionPool(dict(DB_SETTINGS, database=DB_NAME, buffered=True), 80, 30, 1800, 300, 5)
+    monkeypatch.setattr(db_connection, "pool", pool)
+
+    yield restaurantID, userIDs, tableIDs
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP DATABASE IF EXISTS {DB_NAME};")
+    connection.close()
+
+# This function opens a connection to the test database which is not taken from the pool
+def openConnection():
+    return mysql.connector.connect(**DB_SETTINGS, database=DB_NAME)
+
+# This function returns every pair of reservations at the same table within 2 hours of each other
+def findDoubleBookings():
+    connection = openConnection()
+    with connection.cursor() as cursor:
+        sql = """
+        SELECT first.reservationID, second.reservationID
+        FROM Reservation AS first INNER JOIN Reservation AS second
+            ON first.tableID = second.tableID AND first.reservationID < second.reservationID
+        WHERE ABS(TIMESTAMPDIFF(SECOND, first.datetime, second.datetime)) <= %s;
+        """
+        cursor.execute(sql, (make_reservation.RESERVATION_SECONDS,))
+        pairs = cursor.fetchall()
+    connection.close()
+    return pairs
+
+def countReservations():
+    connection = openConnection()
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT COUNT(*) FROM Reservation;")
+        count = cursor.fetchone()[0]
+    connection.close()
+    return count
+
+# This function makes the reservations at once, from one thread each, and returns their results
+# With inSession, each thread is handled like a request, which only commits once it has finished
+def reserveConcurrently(restaurantID, bookings, inSession=False):
+    results = [None] * len(bookings)
+    barrier = threading.Barrier(len(bookings))
+
+    def book(i, userID, date, time, persons):
+        barrier.wait()
+        if not inSession:
+            results[i] = makeReservation(userID, None, restaurantID, date, time, persons)
+            return
+
+        beginSession()
+        try:
+            result = makeReservation(userID, None, restaurantID, date, time, persons)
+            error = commitSession()
+            results[i] = result if error is None else (False, error)
+        finally:
+            endSession()
+
+    threads = [threading.Thread(target=book, args=(i,) + booking) for i, booking in enumerate(bookings)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(60)
+    return results
+
+def test_concurrent_reservations_never_double_book(database):
+    restaurantID, userIDs, tableIDs = database
+    randomGenerator = random.Random(2024)
+
+    # The times overlap each other's 2 hour windows, so bookings compete for the same tables
+    bookings = [
+        (userID, "2030-06-01", randomGenerator.choice(["18:00", "19:00", "20:00", "21:00"]), randomGenerator.randint(1, 6))
+        for userID in userIDs[:48]
+    ]
+    results = reserveConcurrently(restaurantID, bookings)
+
+    assert findDoubleBookings() == []
+    succeeded = [result for result in results if result == (True, None)]
+    assert len(succeeded) == countReservations()
+    assert len(succeeded) > 0
+
+    # A booking may only fail because every suitable table was taken, or after deadlocking or
+    # timing out on every attempt
+    for result in results:
+        if result != (True, None):
+            assert result[0] is False
+            assert result[1] == "No tables are available at the provided time" or "Deadlock" in result[1] or "Lock wait timeout" in result[1]
+
+def test_concurrent_requests_never_double_book(database):
+    restaurantID, userIDs, tableIDs = database
+    randomGenerator = random.Random(2025)
+
+    # The table locks are held until each request's session commits, rather than by makeReservation
+    bookings = [
+        (userID, "2030-06-06", randomGenerator.choice(["18:00", "19:00", "20:00"]), randomGenerator.randint(1, 6))
+        for userID in userIDs[:48]
+    ]
+    results = reserveConcurrently(restaurantID, bookings, inSession=True)
+
+    assert findDoubleBookings() == []
+    succeeded = [result for result in results if result == (True, None)]
+    assert len(succeeded) == countReservations()
+    assert len(succeeded) > 0
+    for result in results:
+        if result != (True, None):
+            assert result[0] is False
+            assert result[1] == "No tables are available at the provided time" or "Deadlock" in result[1] or "Lock wait timeout" in result[1]
+
+    # Every session has returned its connection to the pool
+    assert db_connection.pool.getMetrics()["inUse"] == 0
+
+def test_all_bookings_for_one_time_fill_each_table_once(database):
+    restaurantID, userIDs, tableIDs = database
+
+    # Every table can seat 2, so at most one booking per table can succeed
+    bookings = [(userID, "2030-06-02", "19:00", 2) for userID in userIDs[:40]]
+    results = reserveConcurrently(restaurantID, bookings)
+
+    assert findDoubleBookings() == []
+    assert sum(1 for result in results if result == (True, None)) == countReservations()
+    assert countReservations() <= len(tableIDs)
+
+def test_booking_waits_for_a_locked_table(database):
+    restaurantID, userIDs, tableIDs = database
+
+    # Another booking holds the lock on every table, and reserves them all before committing
+    holder = openConnection()
+    cursor = holder.cursor()
+    cursor.execute("SELECT tableID FROM RestaurantTable WHERE restaurantID = %s FOR UPDATE;", (restaurantID,))
+    cursor.fetchall()
+
+    results = []
+    thread = threading.Thread(target=lambda: results.append(
+        makeReservation(userIDs[0], None, restaurantID, "2030-06-03", "19:00", 2)
+    ))
+    thread.start()
+
+    # The booking cannot choose a table until the lock is released
+    thread.join(1)
+    assert thread.is_alive()
+
+    cursor.executemany(
+        "INSERT INTO Reservation (restaurantID, tableID, userID, persons, datetime) VALUES (%s, %s, %s, %s, %s);",
+        [(restaurantID, tableID, userIDs[1], 2, "2030-06-03 19:00:00") for tableID in tableIDs]
+    )
+    holder.commit()
+    cursor.close()
+    holder.close()
+
+    # The locking read sees the reservations committed while it waited
+    thread.join(30)
+    assert results == [(False, "No tables are available at the provided time")]
+    assert findDoubleBookings() == []
+
+def test_deadlocked_booking_is_retried(database, monkeypatch):
+    restaurantID, userIDs, tableIDs = database
+
+    # The first attempt is chosen as a deadlock victim, as MySQL would do
+    reserveBestTable = make_reservation.reserveBestTable
+    calls = []
+    def deadlockOnce(*args):
+        calls.append(args)
+        if len(calls) == 1:
+            raise mysql.connector.errors.DatabaseError(msg="Deadlock found", errno=errorcode.ER_LOCK_DEADLOCK)
+        return reserveBestTable(*args)
+    monkeypatch.setattr(make_reservation, "reserveBestTable", deadlockOnce)
+
+    result = makeReservation(userIDs[0], None, restaurantID, "2030-06-04", "19:00", 2)
+    assert result == (True, None)
+    assert len(calls) == 2
+    assert countReservations() == 1
+
+def test_booking_gives_up_after_repeated_deadlocks(database, monkeypatch):
+    restaurantID, userIDs, tableIDs = database
+
+    calls = []
+    def alwaysDeadlock(*args):
+        calls.append(args)
+        raise mysql.connector.errors.DatabaseError(msg="Deadlock found", errno=errorcode.ER_LOCK_DEADLOCK)
+    monkeypatch.setattr(make_reservation, "reserveBestTable", alwaysDeadlock)
+
+    result = makeReservation(userIDs[0], None, restaurantID, "2030-06-05", "19:00", 2)
+    assert result[0] is False
+    assert len(calls) == make_reservation.RESERVATION_ATTEMPTS
+    assert countReservations() == 0
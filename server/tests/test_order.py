@@ -0,0 +1,60 @@
+from models import order
+from models.order import Order, isValidQuantity
+from decimal import Decimal
+
+# This class stands in for a database cursor, recording the queries made and returning the
+# provided rows in turn
+class FakeCursor:
+    def __init__(self, rows):
+        self.rows = list(rows)
+        self.queries = []
+
+    def execute(self, sql, params=None):
+        self.queries.append(" ".join(sql.split()))
+
+    def executemany(self, sql, params):
+        self.queries.append(" ".join(sql.split()))
+        self.inserted = params
+
+    def fetchone(self):
+        return self.rows.pop(0)
+
+    def fetchall(self):
+        return self.rows.pop(0)
+
+class FakeConnection:
+    def __init__(self, cursor):
+        self.__cursor = cursor
+
+    def cursor(self):
+        return self.__cursor
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+# This function returns an existing order whose queries are answered by a FakeCursor
+def openOrder(monkeypatch, rows):
+    cursor = FakeCursor([(1, 7, 3, Decimal("0.00"), None, None, 0, 0, "")] + rows)
+    monkeypatch.setattr(order, "connect", lambda: (FakeConnection(cursor), None))
+    return Order(foodOrderID=5), cursor
+
+def test_valid_quantities():
+    assert isValidQuantity(1) and isValidQuantity(12)
+    for quantity in [0, -1, 2.5, 2.0, "2", True, None]:
+        assert not isValidQuantity(quantity)
+
+def test_invalid_quantities_are_rejected_before_any_query(monkeypatch):
+    for quantity in [2.5, "2", 0, True]:
+        foodOrder, cursor = openOrder(monkeypatch, [])
+        assert not foodOrder.addItems([(10, 1), (11, quantity)])
+        assert foodOrder.error == "The quantity of each item must be a whole number of at least 1"
+        # Only the order itself was read
+        assert len(cursor.queries) == 1
+
+def test_items_are_priced_by_quantity(monkeypatch):
+    foodOrder, cursor = openOrder(monkeypatch, [[(10, Decimal("4.50")), (11, Decimal("2.00"))], (Decimal("13.00"),)])
+    assert foodOrder.addItems([(10, 2), (11, 2)])
+    assert cursor.inserted == [(5, 10, 2, Decimal("4.50")), (5, 11, 2, Decimal("2.00"))]
@@ -0,0 +1,88 @@
+from services import order_events
+from services.order_events import orderEvents, streamOrderQueue
+import pytest
+
+# This class stands in for a restaurant's change log, answering getOrderQueueChanges
+class FakeChangeLog:
+    def __init__(self):
+        # (changeID, foodOrderID) for each change kept in the log, oldest first
+        self.changes = []
+        self.queries = 0
+
+    def add(self, foodOrderID):
+        self.changes.append((len(self.changes) + 1, foodOrderID))
+
+    def getOrderQueueChanges(self, restaurantID, version=0):
+        self.queries += 1
+        latest = self.changes[-1][0] if len(self.changes) > 0 else 0
+        if version not in [changeID for changeID, _ in self.changes]:
+            orders = [{"foodOrderID": foodOrderID} for _, foodOrderID in self.changes]
+            return ({"version": latest, "reset": True, "inserted": orders, "updated": [], "removed": []}, None)
+        orders = [{"foodOrderID": foodOrderID} for changeID, foodOrderID in self.changes if changeID > version]
+        return ({"version": latest, "reset": False, "inserted": orders, "updated": [], "removed": []}, None)
+
+@pytest.fixture
+def changeLog(monkeypatch):
+    changeLog = FakeChangeLog()
+    monkeypatch.setattr(order_events, "getOrderQueueChanges", changeLog.getOrderQueueChanges)
+    monkeypatch.setattr(order_events, "KEEPALIVE_SECONDS", 0.05)
+    return changeLog
+
+def getOrderIDs(event):
+    return [order["foodOrderID"] for order in event[2]["inserted"]]
+
+def test_stream_starts_with_the_whole_queue_then_sends_changes(changeLog):
+    changeLog.add(10)
+    events = streamOrderQueue(1)
+    event = next(events)
+    assert event[0] == "changes" and event[1] == 1
+    assert event[2]["reset"] and getOrderIDs(event) == [10]
+
+    changeLog.add(11)
+    orderEvents.publish(1, {"type": "order", "foodOrderID": 11})
+    event = next(events)
+    assert event[1] == 2
+    assert not event[2]["reset"] and getOrderIDs(event) == [11]
+    events.close()
+
+def test_reconnecting_stream_resumes_from_its_version(changeLog):
+    changeLog.add(10)
+    changeLog.add(11)
+
+    # The changes made while the client was disconnected are sent first
+    events = streamOrderQueue(1, 1)
+    event = next(events)
+    assert event[1] == 2
+    assert not event[2]["reset"] and getOrderIDs(event) == [11]
+    events.close()
+
+def test_expired_version_resets_the_client_queue(changeLog):
+    changeLog.add(10)
+    changeLog.changes = changeLog.changes[1:] + [(2, 11)]
+    events = streamOrderQueue(1, 1)
+    event = next(events)
+    assert event[2]["reset"] and getOrderIDs(event) == [11]
+    events.close()
+
+def test_idle_stream_sends_keepalives_without_querying(changeLog):
+    changeLog.add(10)
+    events = streamOrderQueue(1, 1)
+    assert next(events) is None
+    assert next(events) is None
+    assert changeLog.queries == 1
+    events.close()
+
+def test_events_waiting_together_need_one_query(changeLog):
+    events = streamOrderQueue(1)
+    next(events)
+    for foodOrderID in [10, 11, 12]:
+        changeLog.add(foodOrderID)
+        orderEvents.publish(1, {"type": "order", "foodOrderID": foodOrderID})
+    event = next(events)
+    assert getOrderIDs(event) == [10, 11, 12]
+    assert changeLog.queries == 2
+
+    # Other restaurants' events do not wake the stream
+    orderEvents.publish(2, {"type": "order", "foodOrderID": 13})
+    assert next(events) is None
+    events.close()
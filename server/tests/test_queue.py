@@ -0,0 +1,160 @@
+from services import queue
+from services.queue import getOrderQueueChanges, logOrderChange
+
+# This class stands in for the FoodOrderChange table and the restaurant's unfulfilled orders
+class FakeDatabase:
+    def __init__(self):
+        # (changeID, foodOrderID, restaurantID, changeType) for each change, oldest first
+        self.changes = []
+        # The unfulfilled orders of each restaurant, by foodOrderID
+        self.queues = {}
+        self.lockedRestaurants = []
+        self.commits = 0
+
+    def change(self, restaurantID, foodOrderID, changeType):
+        # Changes an order and logs it, returning the new version
+        orders = self.queues.setdefault(restaurantID, {})
+        if changeType == "delete":
+            del orders[foodOrderID]
+        else:
+            orders[foodOrderID] = {"foodOrderID": foodOrderID, "changes": orders.get(foodOrderID, {"changes": 0})["changes"] + 1}
+        assert logOrderChange(restaurantID, foodOrderID, changeType) == (True, None)
+        return self.changes[-1][0]
+
+    def getUnfulfilledOrders(self, restaurantID, foodOrderID=0, foodOrderIDs=None):
+        orders = self.queues.get(restaurantID, {})
+        return ([orders[i] for i in sorted(orders) if foodOrderIDs is None or i in foodOrderIDs], None)
+
+# This class answers the change log's queries from a FakeDatabase
+class FakeCursor:
+    def __init__(self, database):
+        self.database = database
+        self.result = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def execute(self, sql, params=()):
+        sql = " ".join(sql.split())
+        changes = self.database.changes
+        if sql.startswith("SELECT restaurantID FROM Restaurant"):
+            self.database.lockedRestaurants.append(params[0])
+            self.result = [(params[0],)]
+        elif sql.startswith("INSERT INTO FoodOrderChange"):
+            changeID = changes[-1][0] + 1 if len(changes) > 0 else 1
+            changes.append((changeID, params[0], params[1], params[2]))
+        elif "ORDER BY changeID DESC LIMIT 1 OFFSET" in sql:
+            newest = [change[0] for change in reversed(changes) if change[2] == params[0]]
+            self.result = [(newest[params[1]],)] if len(newest) > params[1] else []
+        elif sql.startswith("DELETE FROM FoodOrderChange"):
+            self.database.changes = [change for change in changes if change[2] != params[0] or change[0] > params[1]]
+        elif sql.startswith("SELECT changeID FROM FoodOrderChange WHERE changeID"):
+            self.result = [(change[0],) for change in changes if change[0] == params[0] and change[2] == params[1]]
+        elif sql.startswith("SELECT COALESCE(MAX(changeID), 0)"):
+            self.result = [(max([change[0] for change in changes if change[2] == params[0]], default=0),)]
+        elif sql.startswith("SELECT changeID, foodOrderID, changeType"):
+            self.result = [(change[0], change[1], change[3]) for change in changes if change[2] == params[0] and change[0] > params[1]]
+        else:
+            raise AssertionError("Unexpected query: " + sql)
+
+    def fetchone(self):
+        return self.result[0] if len(self.result) > 0 else None
+
+    def fetchall(self):
+        return list(self.result)
+
+class FakeConnection:
+    def __init__(self, database):
+        self.database = database
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def cursor(self):
+        return FakeCursor(self.database)
+
+    def commit(self):
+        self.database.commits += 1
+
+    def rollback(self):
+        pass
+
+def createDatabase(monkeypatch):
+    database = FakeDatabase()
+    monkeypatch.setattr(queue, "connect", lambda: (FakeConnection(database), None))
+    monkeypatch.setattr(queue, "openPooledConnection", lambda: (FakeConnection(database), None))
+    monkeypatch.setattr(queue, "getUnfulfilledOrders", database.getUnfulfilledOrders)
+    return database
+
+def test_changes_are_logged_in_their_own_transaction(monkeypatch):
+    database = createDatabase(monkeypatch)
+    database.change(1, 10, "insert")
+    # The restaurant is locked only while the change is logged, and the change is committed
+    assert database.lockedRestaurants == [1]
+    assert database.commits == 1
+    assert database.changes == [(1, 10, 1, "insert")]
+
+def test_version_0_returns_the_whole_queue(monkeypatch):
+    database = createDatabase(monkeypatch)
+    database.change(1, 10, "insert")
+    version = database.change(1, 11, "insert")
+    database.change(2, 12, "insert")
+
+    changes = getOrderQueueChanges(1, 0)
+    assert changes[1] is None
+    assert changes[0]["version"] == version
+    assert changes[0]["reset"]
+    assert [order["foodOrderID"] for order in changes[0]["inserted"]] == [10, 11]
+
+def test_only_changes_since_the_version_are_returned(monkeypatch):
+    database = createDatabase(monkeypatch)
+    database.change(1, 10, "insert")
+    database.change(1, 11, "insert")
+    version = database.change(1, 12, "insert")
+
+    database.change(1, 13, "insert")
+    database.change(1, 10, "update")
+    database.change(1, 11, "delete")
+    database.change(2, 14, "insert")
+    latest = database.change(1, 13, "update")
+
+    changes = getOrderQueueChanges(1, version)[0]
+    assert changes["version"] == latest
+    assert not changes["reset"]
+    assert [order["foodOrderID"] for order in changes["inserted"]] == [13]
+    assert [order["foodOrderID"] for order in changes["updated"]] == [10]
+    assert changes["removed"] == [11]
+
+    # Nothing has changed since the latest version
+    assert getOrderQueueChanges(1, latest)[0] == {"version": latest, "reset": False, "inserted": [], "updated": [], "removed": []}
+
+def test_expired_version_resets_the_queue(monkeypatch):
+    database = createDatabase(monkeypatch)
+    monkeypatch.setattr(queue, "CHANGE_LOG_SIZE", 3)
+    version = database.change(1, 10, "insert")
+    for foodOrderID in range(11, 15):
+        latest = database.change(1, foodOrderID, "insert")
+
+    # Only the newest changes are kept
+    assert len(database.changes) == 3
+    changes = getOrderQueueChanges(1, version)[0]
+    assert changes["reset"]
+    assert changes["version"] == latest
+    assert [order["foodOrderID"] for order in changes["inserted"]] == [10, 11, 12, 13, 14]
+
+def test_unknown_version_resets_the_queue(monkeypatch):
+    database = createDatabase(monkeypatch)
+    database.change(1, 10, "insert")
+    otherVersion = database.change(2, 11, "insert")
+
+    # A version from another restaurant's log is not accepted either
+    for version in [otherVersion, 999]:
+        changes = getOrderQueueChanges(1, version)[0]
+        assert changes["reset"]
+        assert [order["foodOrderID"] for order in changes["inserted"]] == [10]
@@ -0,0 +1,111 @@
+from services.reservation_availability import DaySchedule, buildDaySchedules, RESERVATION_SECONDS
+import datetime as dt
+import random
+
+# This function returns the start times the old per-slot queries found available, one query for
+# each 30 minute start time:
+#   SELECT tableID FROM RestaurantTable WHERE restaurantID = %s AND capacity >= %s
+#   AND tableID NOT IN (SELECT tableID FROM Reservation WHERE restaurantID = %s
+#                       AND ABS(TIMESTAMPDIFF(SECOND, %s, DATETIME)) < 7200);
+def referenceAvailableTimes(date, openingPeriods, tables, reservations, persons):
+    availableStartTimes = []
+    for currentTime, closingTime in openingPeriods:
+        closingTime -= dt.timedelta(hours=2)
+        while currentTime <= closingTime:
+            currentDatetime = dt.datetime.combine(date, dt.time(0, 0)) + currentTime
+            reserved = set(
+                tableID for tableID, reservationTime in reservations
+                if abs(int((reservationTime - currentDatetime).total_seconds())) < 7200
+            )
+            if any(capacity >= persons and tableID not in reserved for tableID, capacity in tables):
+                availableStartTimes.append((dt.datetime.min + currentTime).strftime("%H:%M"))
+            currentTime += dt.timedelta(minutes=30)
+    return availableStartTimes
+
+# This function returns random opening periods for a day, which may overlap or be empty
+def createOpeningPeriods(generator):
+    periods = []
+    for _ in range(generator.choice([0, 1, 1, 2, 3])):
+        opening = dt.timedelta(minutes=generator.randrange(0, 48) * 30)
+        closing = opening + dt.timedelta(minutes=generator.randrange(0, 30) * 30)
+        periods.append((opening, min(closing, dt.timedelta(hours=24))))
+    return periods
+
+# This function returns random reservations around a date, including on the days either side and
+# at times which are not on a 30 minute boundary
+def createReservations(generator, date, tables, count):
+    if len(tables) == 0:
+        return []
+    midnight = dt.datetime.combine(date, dt.time(0, 0))
+    return [
+        (generator.choice(tables)[0], midnight + dt.timedelta(minutes=generator.randrange(-300, 1740, generator.choice([1, 15, 30]))))
+        for _ in range(count)
+    ]
+
+def test_day_schedule_matches_the_per_slot_queries():
+    generator = random.Random(1)
+    date = dt.date(2026, 11, 2)
+    for _ in range(300):
+        tables = [(tableID, generator.choice([2, 2, 4, 6, 8])) for tableID in range(1, generator.randrange(1, 9))]
+        openingPeriods = createOpeningPeriods(generator)
+        reservations = createReservations(generator, date, tables, generator.randrange(0, 25))
+
+        schedule = DaySchedule(date, openingPeriods, tables)
+        schedule.addReservations(reservations)
+        for persons in range(1, 10):
+            assert schedule.getAvailableTimes(persons) == referenceAvailableTimes(date, openingPeriods, tables, reservations, persons)
+
+def test_reservation_blocks_start_times_less_than_two_hours_away():
+    date = dt.date(2026, 11, 2)
+    schedule = DaySchedule(date, [(dt.timedelta(hours=12), dt.timedelta(hours=22))], [(1, 4)])
+    schedule.addReservations([(1, dt.datetime(2026, 11, 2, 16, 0))])
+    times = schedule.getAvailableTimes(2)
+    assert "14:00" in times and "18:00" in times
+    assert "14:30" not in times and "17:30" not in times
+    assert times == referenceAvailableTimes(date, [(dt.timedelta(hours=12), dt.timedelta(hours=22))], [(1, 4)], [(1, dt.datetime(2026, 11, 2, 16, 0))], 2)
+    assert RESERVATION_SECONDS == 7200
+
+# This class answers the queries made by buildDaySchedules for one restaurant
+class FakeCursor:
+    def __init__(self, weeklyOpeningPeriods, tables, reservations):
+        self.weeklyOpeningPeriods = weeklyOpeningPeriods
+        self.tables = tables
+        self.reservations = reservations
+        self.result = []
+        self.queries = 0
+
+    def execute(self, sql, params):
+        self.queries += 1
+        sql = " ".join(sql.split())
+        if sql.startswith("SELECT dayOfWeek, openingTime, closingTime FROM OpeningPeriod"):
+            self.result = [(day, opening, closing) for day, periods in self.weeklyOpeningPeriods.items() for opening, closing in periods]
+        elif sql.startswith("SELECT tableID, capacity FROM RestaurantTable"):
+            self.result = list(self.tables)
+        elif sql.startswith("SELECT tableID, datetime FROM Reservation"):
+            self.result = sorted(
+                (reservation for reservation in self.reservations if params[1] < reservation[1] < params[2]),
+                key=lambda reservation: reservation[1]
+            )
+        else:
+            raise AssertionError("Unexpected query: " + sql)
+
+    def fetchall(self):
+        return self.result
+
+def test_calendar_schedules_match_the_per_slot_queries():
+    generator = random.Random(2)
+    startDate = dt.datetime(2026, 11, 2)
+    for _ in range(30):
+        tables = [(tableID, generator.choice([2, 4, 6])) for tableID in range(1, generator.randrange(1, 7))]
+        weeklyOpeningPeriods = {day: createOpeningPeriods(generator) for day in range(1, 8)}
+        dates = [startDate + dt.timedelta(days=i) for i in range(10)]
+        reservations = [reservation for date in dates for reservation in createReservations(generator, date, tables, 6)]
+
+        # Every date is built with the same three queries
+        cursor = FakeCursor(weeklyOpeningPeriods, tables, reservations)
+        schedules = buildDaySchedules(cursor, 1, dates)
+        assert cursor.queries <= 3
+        for date in dates:
+            openingPeriods = weeklyOpeningPeriods[date.weekday() + 1]
+            for persons in [1, 3, 5]:
+                assert schedules[date].getAvailableTimes(persons) == referenceAvailableTimes(date, openingPeriods, tables, reservations, persons)
@@ -0,0 +1,68 @@
+from services import search_index
+from services.search_index import RestaurantSearchIndex, MAX_SEARCH_TERM_LENGTH
+from services.restaurant_search import calculateLevenshteinDistance
+import random
+import pytest
+
+ALPHABET = "abcdeABC '-é中"
+
+# This function returns the best k results as the original search did, scoring every name with
+# calculateLevenshteinDistance against its first len(searchTerm) characters
+def referenceSearch(searchTerm, restaurantNames, k):
+    scored = sorted(
+        (calculateLevenshteinDistance(name[:len(searchTerm)], searchTerm), restaurantID, name)
+        for restaurantID, name in restaurantNames
+    )
+    return [(restaurantID, name, distance) for distance, restaurantID, name in scored[:k]]
+
+def randomText(randomGenerator, minLength, maxLength):
+    return "".join(randomGenerator.choice(ALPHABET) for _ in range(randomGenerator.randint(minLength, maxLength)))
+
+def randomNames(randomGenerator, count):
+    # restaurantIDs are not contiguous, as rows are deleted
+    restaurantIDs = randomGenerator.sample(range(1, count * 3), count)
+    return [(restaurantID, randomText(randomGenerator, 1, 30)) for restaurantID in restaurantIDs]
+
+# The trie is used while it is fast enough, and every name is scored at once otherwise
+@pytest.mark.parametrize("budget", [10 ** 9, 0])
+@pytest.mark.parametrize("seed", range(5))
+def test_ranking_matches_reference(seed, budget, monkeypatch):
+    monkeypatch.setattr(search_index, "TRIE_CELL_BUDGET", budget)
+    randomGenerator = random.Random(seed)
+    restaurantNames = randomNames(randomGenerator, 300)
+    index = RestaurantSearchIndex()
+    index.load(restaurantNames)
+    for _ in range(10):
+        searchTerm = randomText(randomGenerator, 1, 12)
+        k = randomGenerator.choice([1, 10, 25])
+        assert index.search(searchTerm, k) == referenceSearch(searchTerm, restaurantNames, k)
+
+def test_long_terms_match_reference():
+    # Terms longer than the limit at /restaurantSearch are still scored correctly by the index
+    randomGenerator = random.Random(7)
+    restaurantNames = [(restaurantID, randomText(randomGenerator, 50, 90)) for restaurantID in range(1, 101)]
+    index = RestaurantSearchIndex()
+    index.load(restaurantNames)
+    searchTerm = randomText(randomGenerator, MAX_SEARCH_TERM_LENGTH + 1, MAX_SEARCH_TERM_LENGTH + 10)
+    assert index.search(searchTerm, 10) == referenceSearch(searchTerm, restaurantNames, 10)
+
+def test_renamed_and_added_restaurants_match_reference():
+    randomGenerator = random.Random(11)
+    restaurantNames = dict(randomNames(randomGenerator, 200))
+    index = RestaurantSearchIndex()
+    index.load(list(restaurantNames.items()))
+    for _ in range(50):
+        restaurantID = randomGenerator.choice(list(restaurantNames) + [max(restaurantNames) + 1])
+        restaurantNames[restaurantID] = randomText(randomGenerator, 1, 30)
+        index.setName(restaurantID, restaurantNames[restaurantID])
+
+    for _ in range(10):
+        searchTerm = randomText(randomGenerator, 1, 12)
+        assert index.search(searchTerm, 10) == referenceSearch(searchTerm, list(restaurantNames.items()), 10)
+
+def test_search_route_rejects_long_terms():
+    import main
+    client = main.app.test_client()
+    response = client.post("/restaurantSearch", json={"searchTerm": "a" * (MAX_SEARCH_TERM_LENGTH + 1)}).json
+    assert response["results"] is None
+    assert response["error"] == f"The search term must be at most {MAX_SEARCH_TERM_LENGTH} characters"
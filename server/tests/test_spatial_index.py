@@ -0,0 +1,111 @@
+from geopy.distance import geodesic as gd
+from services import nearby_restaurants
+from services.nearby_restaurants import getNearbyRestaurants
+from services.spatial_index import RestaurantSpatialIndex, calculateHaversine, HAVERSINE_TOLERANCE
+import numpy as np
+import random
+import pytest
+
+CATEGORIES = ["Italian", "Indian", "Thai", "Cafe"]
+
+# This function returns the page of restaurants the search returned before the spatial index,
+# calculating the geodesic distance to every restaurant
+def referenceNearby(restaurants, coordinates, limit, offset=0, maxMiles=None, category=None):
+    results = []
+    for restaurantID, location, restaurantCategory in restaurants:
+        if category is not None and restaurantCategory.strip().lower() != category.strip().lower():
+            continue
+        distance = gd(coordinates, tuple(float(x) for x in location.split(","))).miles
+        if maxMiles is None or distance <= maxMiles:
+            results.append((distance, restaurantID))
+    results.sort()
+    return [(restaurantID, distance) for distance, restaurantID in results[offset:offset + limit]]
+
+# This function returns restaurants clustered around a few cities, with some spread worldwide
+def createRestaurants(generator, count):
+    cities = [(51.5, -0.12), (53.48, -2.24), (40.71, -74.0), (-33.87, 151.2), (64.1, -21.9)]
+    restaurants = []
+    for restaurantID in range(1, count + 1):
+        if generator.random() < 0.8:
+            city = generator.choice(cities)
+            latitude, longitude = city[0] + generator.gauss(0, 0.3), city[1] + generator.gauss(0, 0.3)
+        else:
+            latitude, longitude = generator.uniform(-80, 80), generator.uniform(-180, 180)
+        restaurants.append((restaurantID, f"{latitude}, {longitude}", generator.choice(CATEGORIES)))
+    return restaurants
+
+# This function points the nearby search at a new index holding the provided restaurants
+def loadIndex(monkeypatch, restaurants):
+    index = RestaurantSpatialIndex()
+    index.load(restaurants)
+    monkeypatch.setattr(nearby_restaurants, "spatialIndex", index)
+    return index
+
+def assertSameAsReference(restaurants, coordinates, limit, offset=0, maxMiles=None, category=None):
+    results = getNearbyRestaurants(coordinates, limit, offset, maxMiles, category)
+    assert results[1] is None
+    assert results[0] == referenceNearby(restaurants, coordinates, limit, offset, maxMiles, category)
+
+def test_haversine_is_within_the_tolerance_of_the_geodesic_distance():
+    generator = random.Random(1)
+    for _ in range(2000):
+        start = (generator.uniform(-89, 89), generator.uniform(-180, 180))
+        end = (generator.uniform(-89, 89), generator.uniform(-180, 180))
+        geodesic = gd(start, end).miles
+        if geodesic < 1e-3:
+            continue
+        haversine = float(calculateHaversine(start, np.array([end[0]]), np.array([end[1]]))[0])
+        assert abs(haversine / geodesic - 1) < HAVERSINE_TOLERANCE
+
+def test_nearest_restaurants_match_every_geodesic_distance(monkeypatch):
+    generator = random.Random(2)
+    restaurants = createRestaurants(generator, 400)
+    loadIndex(monkeypatch, restaurants)
+    for _ in range(20):
+        coordinates = (generator.uniform(-60, 70), generator.uniform(-180, 180))
+        limit, offset = generator.choice([1, 5, 10]), generator.choice([0, 0, 7])
+        assertSameAsReference(restaurants, coordinates, limit, offset)
+        assertSameAsReference(restaurants, coordinates, limit, offset, category=generator.choice(CATEGORIES))
+
+    # Searches from the cities, where many restaurants are close together
+    for coordinates in [(51.5, -0.12), (40.71, -74.0), (64.1, -21.9)]:
+        assertSameAsReference(restaurants, coordinates, 10)
+        assertSameAsReference(restaurants, coordinates, 10, maxMiles=15)
+        assertSameAsReference(restaurants, coordinates, 50, maxMiles=30, category="thai ")
+
+def test_moved_restaurants_match_every_geodesic_distance(monkeypatch):
+    generator = random.Random(3)
+    restaurants = createRestaurants(generator, 300)
+    index = loadIndex(monkeypatch, restaurants)
+
+    # Enough restaurants are moved to rebuild the tree, with some still pending afterwards
+    for _ in range(120):
+        position = generator.randrange(len(restaurants))
+        restaurantID = restaurants[position][0]
+        moved = createRestaurants(generator, 1)[0]
+        restaurants[position] = (restaurantID, moved[1], moved[2])
+        index.setRestaurant(restaurantID, moved[1], moved[2])
+    for coordinates in [(51.5, -0.12), (53.48, -2.24), (0, 0)]:
+        assertSameAsReference(restaurants, coordinates, 10)
+        assertSameAsReference(restaurants, coordinates, 20, maxMiles=40)
+
+@pytest.mark.parametrize("coordinates, ends", [
+    # Due north from the equator the geodesic distance is about 0.56% shorter than the haversine distance
+    ((0.0, 0.0), [(1.0, 0.0), (2.0, 0.0), (0.5, 0.0)]),
+    # Due east along the equator it is about 0.1% longer
+    ((0.0, 0.0), [(0.0, 1.0), (0.0, 2.0), (0.0, 0.5)]),
+    # Due north near a pole it is about 0.42% longer
+    ((80.0, 0.0), [(81.0, 0.0), (82.0, 0.0), (80.5, 0.0)])
+])
+def test_restaurants_at_the_edge_of_the_tolerance(monkeypatch, coordinates, ends):
+    restaurants = [(i + 1, f"{latitude}, {longitude}", "Cafe") for i, (latitude, longitude) in enumerate(ends)]
+    loadIndex(monkeypatch, restaurants)
+
+    # A restaurant exactly maxMiles away along the ellipsoid is included, even where the haversine
+    # distance used to choose candidates is further than maxMiles
+    for end in ends:
+        maxMiles = gd(coordinates, end).miles
+        assertSameAsReference(restaurants, coordinates, 10, maxMiles=maxMiles)
+        assertSameAsReference(restaurants, coordinates, 1, maxMiles=maxMiles)
+    assertSameAsReference(restaurants, coordinates, 1)
+    assertSameAsReference(restaurants, coordinates, 2)
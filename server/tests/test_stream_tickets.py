@@ -0,0 +1,15 @@
+from services.stream_tickets import StreamTickets
+import time
+
+def test_ticket_can_only_be_used_once():
+    tickets = StreamTickets(30)
+    ticket = tickets.issue(1, "token", 7)
+    assert tickets.redeem(ticket) == (1, "token", 7)
+    assert tickets.redeem(ticket) is None
+
+def test_unknown_and_expired_tickets_are_rejected():
+    tickets = StreamTickets(0.01)
+    ticket = tickets.issue(1, "token", 7)
+    time.sleep(0.02)
+    assert tickets.redeem(ticket) is None
+    assert tickets.redeem("not a ticket") is None
@@ -0,0 +1,28 @@
+from services.top_k import getPageParameters, getNextPage, selectTopK, encodeCursor, MAX_RESULTS, MAX_LIMIT
+import random
+
+def test_page_parameters():
+    assert getPageParameters({}) == ((0, 10), None)
+    assert getPageParameters({"offset": 20, "limit": 5}) == ((20, 5), None)
+    assert getPageParameters({"cursor": encodeCursor(30)}) == ((30, 10), None)
+    assert getPageParameters({"cursor": "not a cursor"})[0] is None
+    assert getPageParameters({"limit": True})[0] is None
+    assert getPageParameters({"limit": MAX_LIMIT + 1})[0] is None
+
+def test_offset_is_capped():
+    assert getPageParameters({"offset": MAX_RESULTS - 10, "limit": 10})[0] == (MAX_RESULTS - 10, 10)
+    assert getPageParameters({"offset": MAX_RESULTS - 9, "limit": 10})[0] is None
+    assert getPageParameters({"offset": 10 ** 9})[0] is None
+    assert getPageParameters({"cursor": encodeCursor(10 ** 9)})[0] is None
+
+def test_no_cursor_past_the_cap():
+    assert getNextPage(list(range(11)), 0, 10) == (list(range(10)), encodeCursor(10))
+    assert getNextPage(list(range(11)), MAX_RESULTS - 10, 10) == (list(range(10)), None)
+    assert getNextPage(list(range(5)), 0, 10) == (list(range(5)), None)
+
+def test_select_top_k_matches_sorting():
+    randomGenerator = random.Random(3)
+    candidates = [(randomGenerator.randint(0, 20), restaurantID, restaurantID) for restaurantID in range(500)]
+    expected = [candidate[2] for candidate in sorted(candidates)]
+    for offset, limit in [(0, 10), (10, 10), (490, 20), (0, 0)]:
+        assert selectTopK(iter(candidates), limit, offset) == expected[offset:offset + limit]